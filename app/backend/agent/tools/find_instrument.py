@@ -16,7 +16,7 @@ import os
 backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 if backend_dir not in sys.path:
     sys.path.insert(0, backend_dir)
-from tool_executor import search_instruments
+from tool_executor import search_instruments, resolve_exchange_segment
 
 
 class FindInstrumentTool(Tool):
@@ -194,20 +194,12 @@ class FindInstrumentTool(Tool):
                           instrument.get("INSTRUMENT_TYPE") or "").upper()
 
         # Handle indices
-        if segment == "I" or segment == "INDEX" or instrument_type == "INDEX":
+        if instrument_type == "INDEX":
             return "IDX_I"
-        elif exchange == "NSE" and segment == "E":
-            return "NSE_EQ"
-        elif exchange == "BSE" and segment == "E":
-            return "BSE_EQ"
-        elif exchange == "NSE" and segment == "D":
-            return "NSE_FO"
-        elif exchange == "BSE" and segment == "D":
-            return "BSE_FO"
-        elif exchange == "MCX":
-            return "MCX_COM"
-        elif exchange == "NCDEX":
-            return "NCDEX_COM"
+
+        exchange_segment = resolve_exchange_segment(exchange, segment)
+        if exchange_segment:
+            return exchange_segment
 
         return f"{exchange}_EQ"  # Default fallback
 
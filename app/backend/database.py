@@ -1,11 +1,18 @@
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
 from datetime import datetime
 from typing import List, Optional, Dict
 import os
-from dotenv import load_dotenv
+from settings import load_env
 
-load_dotenv()
+load_env()
+
+# Instruments are written in chunks of this many documents, with a few chunks in flight
+INSTRUMENT_INSERT_BATCH = 1000
+INSTRUMENT_INSERT_CONCURRENCY = 4
+# A sync writes under "<format><suffix>" and swaps the rows in once all chunks are stored
+INSTRUMENT_STAGING_SUFFIX = ".staging"
 
 class Database:
     def __init__(self):
@@ -134,24 +141,45 @@ class Database:
 
     # Instruments methods
     async def save_instruments(self, instruments: List[Dict], format_type: str = "detailed") -> Dict:
-        """Save or update instruments in database"""
+        """
+        Replace the instruments of format_type. New rows are written under a
+        staging format tag and only take over once every batch succeeded, so a
+        failed sync leaves the previous instruments in place.
+        """
+        staging_format = f"{format_type}{INSTRUMENT_STAGING_SUFFIX}"
         try:
-            # Delete existing instruments
-            await self.instruments.delete_many({"format": format_type})
+            # Drop leftovers of an earlier sync that did not finish
+            await self.instruments.delete_many({"format": staging_format})
 
-            # Insert new instruments with metadata
+            # Insert new instruments with metadata, in concurrent chunks so round
+            # trips to MongoDB overlap instead of one huge insert_many
             now = datetime.utcnow()
-            instruments_with_meta = []
-            for inst in instruments:
-                inst_data = {
-                    **inst,
-                    "format": format_type,
-                    "updated_at": now
-                }
-                instruments_with_meta.append(inst_data)
-
-            if instruments_with_meta:
-                await self.instruments.insert_many(instruments_with_meta)
+            semaphore = asyncio.Semaphore(INSTRUMENT_INSERT_CONCURRENCY)
+
+            async def insert_chunk(start: int):
+                async with semaphore:
+                    chunk = [
+                        {**inst, "format": staging_format, "updated_at": now}
+                        for inst in instruments[start:start + INSTRUMENT_INSERT_BATCH]
+                    ]
+                    await self.instruments.insert_many(chunk, ordered=False)
+
+            results = await asyncio.gather(
+                *(insert_chunk(start) for start in range(0, len(instruments), INSTRUMENT_INSERT_BATCH)),
+                return_exceptions=True
+            )
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                await self.instruments.delete_many({"format": staging_format})
+                return {"success": False, "error": f"{len(errors)} of {len(results)} instrument batches failed: {errors[0]}"}
+
+            # Swap: promote the staged rows, then drop the previous ones
+            await self.instruments.update_many({"format": staging_format}, {"$set": {"format": format_type}})
+            await self.instruments.delete_many({
+                "format": format_type,
+                "updated_at": {"$ne": now},
+                "_id": {"$ne": "metadata"}
+            })
 
             # Update metadata
             await self.instruments.update_one(
@@ -1,10 +1,9 @@
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import List, Optional, Union
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationInfo, field_validator
+from typing import List, Literal, Optional, Union
 import os
-from dotenv import load_dotenv
 import httpx
 import json
 import asyncio
@@ -19,11 +18,31 @@ except ImportError:
     OLLAMA_LIBRARY_AVAILABLE = False
     print("Warning: ollama library not installed. Using HTTP requests instead. Install with: pip install ollama")
 
+# orjson renders the large JSON bodies (option chains, candles) much faster.
+# Routes whose results are already plain JSON (parsed DhanHQ responses) return
+# DefaultJSONResponse directly, skipping FastAPI's jsonable_encoder walk.
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:
+    DefaultJSONResponse = JSONResponse
+
+# Prometheus metrics are served on /metrics only when prometheus_client is installed
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
 from database import Database
+from settings import get_dhan_settings, load_env
 from models import Project, File, ChatMessage
-from trading import trading_service
-from tools import DHANHQ_TOOLS
-from tool_executor import execute_tool, get_access_token
+from trading import check_order_enum, quote_batcher, trading_service
+from tools import DHANHQ_TOOLS, DHANHQ_TOOLS_JSON
+from tool_executor import dumps_tool_result, execute_tool, get_access_token, warm_instruments
+from ws.dhan_daemon import DhanMarketDataDaemon
+from ws.market_cache import MarketCache
+from ws.subscriptions import SubscriptionManager
 
 
 def format_market_quote_result(data, instrument_name=None):
@@ -44,7 +63,7 @@ def format_market_quote_result(data, instrument_name=None):
     if isinstance(data, dict):
         print(f"[format_market_quote_result] Top-level keys: {list(data.keys())}")
         # Log full structure for debugging (truncated if too large)
-        data_str = json.dumps(data, indent=2)
+        data_str = dumps_tool_result(data)
         if len(data_str) > 1000:
             print(f"[format_market_quote_result] Data structure (first 1000 chars):\n{data_str[:1000]}...")
         else:
@@ -222,7 +241,7 @@ Volume: {volume}
 """)
     else:
         # If we couldn't find quote_data, log what we received
-        print(f"[format_market_quote_result] Could not extract quote_data. Data structure: {json.dumps(data, indent=2)[:500]}")
+        print(f"[format_market_quote_result] Could not extract quote_data. Data structure: {dumps_tool_result(data)[:500]}")
 
         # Try one more structure: check if data is a list with quote objects
         if isinstance(data, list) and len(data) > 0:
@@ -236,7 +255,7 @@ Volume: {volume}
         # If still no quote_data, return detailed error with raw structure
         if not quote_data:
             # Show raw structure for debugging
-            raw_structure = json.dumps(data, indent=2)
+            raw_structure = dumps_tool_result(data)
             if len(raw_structure) > 2000:
                 raw_structure = raw_structure[:2000] + "... (truncated)"
 
@@ -263,7 +282,7 @@ The API returned data, but it doesn't match expected structures. Here's what was
     # If we couldn't find the data, return detailed error with raw structure
     if not formatted:
         # Show raw structure for debugging
-        raw_structure = json.dumps(data, indent=2)
+        raw_structure = dumps_tool_result(data)
         if len(raw_structure) > 2000:
             raw_structure = raw_structure[:2000] + "... (truncated)"
 
@@ -335,7 +354,7 @@ The API returned data, but it doesn't match expected structures. Here's what was
 
         if not formatted:
             # Last resort: return formatted JSON with helpful message
-            raw_json = json.dumps(data, indent=2)
+            raw_json = dumps_tool_result(data)
             # Limit the output size for readability
             if len(raw_json) > 2000:
                 raw_json = raw_json[:2000] + "\n... (truncated)"
@@ -448,9 +467,9 @@ def format_search_results(data):
     formatted.append("\nSelect the appropriate instrument from above and use its security_id and exchange_segment for subsequent operations.")
     return "\n".join(formatted)
 
-load_dotenv()
+load_env()
 
-app = FastAPI(title="DevAgent API", version="1.0.0")
+app = FastAPI(title="DevAgent API", version="1.0.0", default_response_class=DefaultJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -484,13 +503,38 @@ async def weekly_instrument_sync():
         except Exception as e:
             print(f"Error in weekly instrument sync: {e}")
 
-# Global variable for sync task
+# Global variables for background tasks
 sync_task = None
+instrument_warmup_task = None
+dhan_prewarm_task = None
+market_data_daemon = None
+
+# Serve quotes from the DhanHQ WebSocket feed opened with DHAN_ACCESS_TOKEN (opt-in);
+# off by default, so quotes are polled over REST with each request's own token
+DHAN_LIVE_QUOTES = os.getenv("DHAN_LIVE_QUOTES", "false").lower() == "true"
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize instruments on startup"""
-    global sync_task
+    global sync_task, instrument_warmup_task, dhan_prewarm_task, market_data_daemon
+
+    # Load the instrument catalog used by tool searches in the background
+    instrument_warmup_task = asyncio.create_task(warm_instruments())
+
+    # Connect the fallback token's DhanHQ client before the first tool call needs it
+    env_access_token = get_dhan_settings().access_token
+    if env_access_token and trading_service.client_id:
+        dhan_prewarm_task = asyncio.create_task(trading_service.run_blocking(trading_service.prewarm, env_access_token))
+
+    # One feed connection for the whole process; quote requests subscribe what they ask for
+    if DHAN_LIVE_QUOTES:
+        live_quotes, live_subscriptions = MarketCache(), SubscriptionManager()
+        daemon = DhanMarketDataDaemon(live_subscriptions, live_quotes)
+        if daemon.enabled:
+            daemon.start()
+            trading_service.use_live_quotes(live_quotes, live_subscriptions)
+            market_data_daemon = daemon
+
     db_instance = Database()
 
     # Ensure indexes are created for performance
@@ -519,13 +563,16 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
-    global sync_task
-    if sync_task:
-        sync_task.cancel()
-        try:
-            await sync_task
-        except asyncio.CancelledError:
-            pass
+    if market_data_daemon:
+        market_data_daemon.stop()
+    for task in (sync_task, instrument_warmup_task, dhan_prewarm_task):
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    await trading_service.aclose()
 
 # AI Provider configuration
 # Use Ollama directly at localhost:11434 (default Ollama port)
@@ -588,19 +635,49 @@ class TradingAuthRequest(BaseModel):
     token_id: Optional[str] = None
 
 
-class PlaceOrderRequest(BaseModel):
-    access_token: str
+def _security_id_str(value: Union[int, str]) -> str:
+    """Security ids travel as strings (DhanHQ's format); accept JSON numbers too"""
+    if isinstance(value, int) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str) or not value.strip().isdigit():
+        raise ValueError("security_id must be a numeric id")
+    return value.strip().lstrip("0") or "0"
+
+
+class OrderDetails(BaseModel):
     security_id: str
     exchange_segment: str
     transaction_type: str
-    quantity: int
+    quantity: int = Field(gt=0)
     order_type: str
     product_type: str
-    price: float = 0
-    trigger_price: float = 0
-    disclosed_quantity: int = 0
+    price: float = Field(default=0, ge=0)
+    trigger_price: float = Field(default=0, ge=0)
+    disclosed_quantity: int = Field(default=0, ge=0)
     validity: str = "DAY"
 
+    _security_id = field_validator("security_id", mode="before")(_security_id_str)
+
+    # Reject unknown enums here instead of spending a DhanHQ request (and rate limit) on them
+    @field_validator("exchange_segment", "transaction_type", "order_type", "product_type", "validity")
+    @classmethod
+    def _known_order_enum(cls, value: str, info: ValidationInfo) -> str:
+        return check_order_enum(info.field_name, value)
+
+
+class PlaceOrderRequest(OrderDetails):
+    access_token: str
+
+
+class PlaceOrdersRequest(BaseModel):
+    access_token: str
+    orders: List[OrderDetails]
+
+
+class CancelOrdersRequest(BaseModel):
+    access_token: str
+    order_ids: List[str] = Field(min_length=1)
+
 
 class ModifyOrderRequest(BaseModel):
     access_token: str
@@ -634,12 +711,16 @@ class ExpiryListRequest(BaseModel):
 
 class HistoricalDataRequest(BaseModel):
     access_token: Optional[str] = None  # Optional - can use DHAN_ACCESS_TOKEN env var as fallback
-    security_id: Union[int, str]  # Accept both int and string (official example uses string)
+    security_id: str  # Official example uses a string; JSON numbers are converted once here
     exchange_segment: str
     instrument_type: str
     from_date: str  # Format: "YYYY-MM-DD"
     to_date: str    # Format: "YYYY-MM-DD"
     interval: str = "daily"  # "daily" for daily data, "intraday" or "minute" for intraday minute data
+    # "columnar" returns intraday candles as arrays ({"open": [...], "time": [...], ...})
+    format: Literal["rows", "columnar"] = "rows"
+
+    _security_id = field_validator("security_id", mode="before")(_security_id_str)
 
 
 class TradeHistoryRequest(BaseModel):
@@ -654,10 +735,17 @@ class MarginCalculatorRequest(BaseModel):
     security_id: str
     exchange_segment: str
     transaction_type: str
-    quantity: int
+    quantity: int = Field(gt=0)
     product_type: str
-    price: float = 0
-    trigger_price: float = 0
+    price: float = Field(default=0, ge=0)
+    trigger_price: float = Field(default=0, ge=0)
+
+    _security_id = field_validator("security_id", mode="before")(_security_id_str)
+
+    @field_validator("exchange_segment", "transaction_type", "product_type")
+    @classmethod
+    def _known_order_enum(cls, value: str, info: ValidationInfo) -> str:
+        return check_order_enum(info.field_name, value)
 
 
 class KillSwitchRequest(BaseModel):
@@ -686,6 +774,13 @@ async def root():
     return {"status": "ok", "message": "DevAgent API is running"}
 
 
+if PROMETHEUS_AVAILABLE:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Prometheus scrape endpoint (DhanHQ call latency and error counts)"""
+        return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 # Projects endpoints
 @app.post("/api/projects", response_model=dict)
 async def create_project(project: ProjectCreate):
@@ -912,6 +1007,14 @@ async def generate_ollama_router_response(prompt: str, task: Optional[str] = Non
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def encode_llm_payload(payload: dict) -> bytes:
+    """Serialize an LLM request body, splicing in the pre-serialized DhanHQ tool manifest"""
+    if payload.get("tools") is DHANHQ_TOOLS:
+        body = json.dumps({key: value for key, value in payload.items() if key != "tools"})
+        return f'{body[:-1]}, "tools": {DHANHQ_TOOLS_JSON}}}'.encode()
+    return json.dumps(payload).encode()
+
+
 async def generate_openai_response(prompt: str, tools=None, messages=None, access_token=None):
     """Generate non-streaming response from OpenAI-compatible API with optional tool calling"""
     # Use provided token or fallback to environment variable
@@ -952,7 +1055,7 @@ async def generate_openai_response(prompt: str, tools=None, messages=None, acces
                 else:
                     payload["tool_choice"] = "auto"  # Let model decide when to use tools
 
-            response = await client.post(url, json=payload)
+            response = await client.post(url, content=encode_llm_payload(payload), headers={"Content-Type": "application/json"})
             if response.status_code != 200:
                 raise HTTPException(status_code=response.status_code, detail=response.text)
             data = response.json()
@@ -1031,13 +1134,13 @@ async def generate_openai_response(prompt: str, tools=None, messages=None, acces
                                                                      None)
                                 elif function_name == "get_market_quote" or function_name == "get_quote":
                                     # Log the raw data before formatting for debugging
-                                    print(f"[get_market_quote] Raw data before formatting: {json.dumps(data, indent=2)[:1000]}")
+                                    print(f"[get_market_quote] Raw data before formatting: {dumps_tool_result(data)[:1000]}")
                                     # Format market quote data nicely, using instrument name from search if available
                                     formatted_result = format_market_quote_result(data, instrument_name=instrument_name_from_search)
 
                                     # If formatting failed (returns "No market data available"), include raw structure
                                     if formatted_result.startswith("No market data available"):
-                                        raw_data_str = json.dumps(data, indent=2)
+                                        raw_data_str = dumps_tool_result(data)
                                         if len(raw_data_str) > 1500:
                                             raw_data_str = raw_data_str[:1500] + "... (truncated)"
                                         formatted_result = f"{formatted_result}\n\n**Raw API Response:**\n```json\n{raw_data_str}\n```"
@@ -1053,7 +1156,7 @@ async def generate_openai_response(prompt: str, tools=None, messages=None, acces
                                         else:
                                             formatted_result = f"Current Price: ₹{metrics.get('current_price', 'N/A')}\n\nHistorical data available but trend calculation failed."
                                     else:
-                                        formatted_result = json.dumps(data, indent=2)
+                                        formatted_result = dumps_tool_result(data)
                                 elif function_name == "get_historical_data":
                                     # Format historical data for trend analysis
                                     if isinstance(data, list) and len(data) > 0:
@@ -1068,13 +1171,13 @@ async def generate_openai_response(prompt: str, tools=None, messages=None, acces
                                             change_pct = (change / first_close) * 100
                                             formatted_result += f"\nChange: ₹{change:.2f} ({change_pct:+.2f}%)\nDirection: {'📈 Upward' if change > 0 else '📉 Downward' if change < 0 else '➡️ Neutral'}"
                                     else:
-                                        formatted_result = json.dumps(data, indent=2)
+                                        formatted_result = dumps_tool_result(data)
                                 elif function_name == "get_positions":
                                     formatted_result = format_positions_result(data)
                                 elif function_name == "get_holdings":
                                     formatted_result = format_holdings_result(data)
                                 else:
-                                    formatted_result = json.dumps(data, indent=2)
+                                    formatted_result = dumps_tool_result(data)
 
                                 # Include tool call details in successful response
                                 content = f"{tool_call_details}✅ Success!\n\n{formatted_result}"
@@ -1094,7 +1197,7 @@ async def generate_openai_response(prompt: str, tools=None, messages=None, acces
                                 # Include tool call details in error response
                                 content = f"{tool_call_details}❌ Error: {error_msg}"
                         else:
-                            content = f"{tool_call_details}\n{json.dumps(result, indent=2)}"
+                            content = f"{tool_call_details}\n{dumps_tool_result(result)}"
 
                         tool_results.append({
                             "role": "tool",
@@ -1123,7 +1226,7 @@ async def generate_openai_response(prompt: str, tools=None, messages=None, acces
                             payload["tools"] = tools
                             payload["tool_choice"] = "auto"  # Let model decide if more tools needed
 
-                        response = await client.post(url, json=payload)
+                        response = await client.post(url, content=encode_llm_payload(payload), headers={"Content-Type": "application/json"})
                         if response.status_code != 200:
                             raise HTTPException(status_code=response.status_code, detail=response.text)
                         data = response.json()
@@ -1160,12 +1263,12 @@ async def generate_openai_response(prompt: str, tools=None, messages=None, acces
                                             formatted_result = format_search_results(data)
                                         elif function_name == "get_market_quote" or function_name == "get_quote":
                                             # Log the raw data before formatting for debugging
-                                            print(f"[agentic_loop] get_market_quote raw data: {json.dumps(data, indent=2)[:1000]}")
+                                            print(f"[agentic_loop] get_market_quote raw data: {dumps_tool_result(data)[:1000]}")
                                             formatted_result = format_market_quote_result(data, instrument_name=instrument_name_from_search)
 
                                             # If formatting failed (returns "No market data available"), include raw structure
                                             if formatted_result.startswith("No market data available"):
-                                                raw_data_str = json.dumps(data, indent=2)
+                                                raw_data_str = dumps_tool_result(data)
                                                 if len(raw_data_str) > 1500:
                                                     raw_data_str = raw_data_str[:1500] + "... (truncated)"
                                                 formatted_result = f"{formatted_result}\n\n**Raw API Response:**\n```json\n{raw_data_str}\n```"
@@ -1180,7 +1283,7 @@ async def generate_openai_response(prompt: str, tools=None, messages=None, acces
                                                 else:
                                                     formatted_result = f"Current Price: ₹{metrics.get('current_price', 'N/A')}\n\nHistorical data available but trend calculation failed."
                                             else:
-                                                formatted_result = json.dumps(data, indent=2)
+                                                formatted_result = dumps_tool_result(data)
                                         elif function_name == "get_historical_data":
                                             if isinstance(data, list) and len(data) > 0:
                                                 first = data[0] if isinstance(data[0], dict) else {}
@@ -1193,15 +1296,15 @@ async def generate_openai_response(prompt: str, tools=None, messages=None, acces
                                                     change_pct = (change / first_close) * 100
                                                     formatted_result += f"\nChange: ₹{change:.2f} ({change_pct:+.2f}%)\nDirection: {'📈 Upward' if change > 0 else '📉 Downward' if change < 0 else '➡️ Neutral'}"
                                             else:
-                                                formatted_result = json.dumps(data, indent=2)
+                                                formatted_result = dumps_tool_result(data)
                                         else:
-                                            formatted_result = json.dumps(data, indent=2)
+                                            formatted_result = dumps_tool_result(data)
                                         content = f"✅ Success!\n\n{formatted_result}"
                                     else:
                                         error_msg = result.get("error", "Unknown error")
                                         content = f"❌ Error: {error_msg}"
                                 else:
-                                    content = json.dumps(result, indent=2)
+                                    content = dumps_tool_result(result)
 
                                 new_tool_results.append({
                                     "role": "tool",
@@ -1382,7 +1485,7 @@ async def generate_openai_response(prompt: str, tools=None, messages=None, acces
                                                     else:
                                                         formatted = f"Current Price: ₹{metrics.get('current_price', 'N/A')}\n\nHistorical data available but trend calculation failed."
                                                 else:
-                                                    formatted = json.dumps(data, indent=2)
+                                                    formatted = dumps_tool_result(data)
 
                                                 return {"response": f"{instrument_info}Here's the trend analysis for {instrument_name_for_format}:\n\n{formatted}"}
                                             else:
@@ -1869,7 +1972,7 @@ async def trading_auth_token(request: TradingAuthRequest):
         raise HTTPException(status_code=400, detail="Access token is required")
 
     # Validate token by getting user profile
-    result = trading_service.get_user_profile(request.token_id)
+    result = await trading_service.run_blocking(trading_service.get_user_profile, request.token_id)
     if not result.get("success"):
         error_detail = result.get("error", "Invalid access token")
         # Log the error for debugging
@@ -1889,7 +1992,7 @@ async def trading_auth_pin(request: TradingAuthRequest):
     """Authenticate with PIN and TOTP"""
     if not request.pin or not request.totp:
         raise HTTPException(status_code=400, detail="PIN and TOTP are required")
-    result = trading_service.authenticate_with_pin(request.pin, request.totp)
+    result = await trading_service.run_blocking(trading_service.authenticate_with_pin, request.pin, request.totp)
     if not result.get("success"):
         raise HTTPException(status_code=401, detail=result.get("error", "Authentication failed"))
     return result
@@ -1898,7 +2001,8 @@ async def trading_auth_pin(request: TradingAuthRequest):
 @app.post("/api/trading/auth/oauth")
 async def trading_auth_oauth():
     """Generate OAuth consent URL"""
-    result = trading_service.authenticate_oauth(
+    result = await trading_service.run_blocking(
+        trading_service.authenticate_oauth,
         trading_service.app_id or "",
         trading_service.app_secret or ""
     )
@@ -1912,7 +2016,8 @@ async def trading_auth_consume(request: TradingAuthRequest):
     """Consume token ID from OAuth redirect"""
     if not request.token_id:
         raise HTTPException(status_code=400, detail="Token ID is required")
-    result = trading_service.consume_token_id(
+    result = await trading_service.run_blocking(
+        trading_service.consume_token_id,
         request.token_id,
         trading_service.app_id or "",
         trading_service.app_secret or ""
@@ -1927,7 +2032,7 @@ async def trading_profile(request: TradingAuthRequest):
     """Get user profile"""
     if not request.token_id:
         raise HTTPException(status_code=400, detail="Access token is required")
-    result = trading_service.get_user_profile(request.token_id)
+    result = await trading_service.run_blocking(trading_service.get_user_profile, request.token_id)
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to get profile"))
     return result
@@ -1936,27 +2041,46 @@ async def trading_profile(request: TradingAuthRequest):
 @app.post("/api/trading/orders/place")
 async def place_order(request: PlaceOrderRequest):
     """Place a trading order"""
-    result = trading_service.place_order(request.access_token, request.dict())
+    result = await trading_service.run_blocking(trading_service.place_order, request.access_token, request.dict())
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to place order"))
     return result
 
 
+@app.post("/api/trading/orders/place-batch")
+async def place_orders(request: PlaceOrdersRequest):
+    """Place several orders in parallel batches (BUY legs first)"""
+    orders = [order.dict() for order in request.orders]
+    result = await trading_service.run_blocking(trading_service.place_orders, request.access_token, orders)
+    if not result.get("success"):
+        raise HTTPException(status_code=500, detail=result.get("error", "Failed to place orders"))
+    return result
+
+
+@app.post("/api/trading/orders/cancel-batch")
+async def cancel_orders(request: CancelOrdersRequest):
+    """Cancel several orders concurrently"""
+    result = await trading_service.cancel_orders(request.access_token, request.order_ids)
+    if not result.get("success"):
+        raise HTTPException(status_code=500, detail=result.get("error", "Failed to cancel orders"))
+    return result
+
+
 @app.post("/api/trading/orders")
 async def get_orders(request: TradingAuthRequest):
     """Get all orders"""
     if not request.token_id:
         raise HTTPException(status_code=400, detail="Access token is required")
-    result = trading_service.get_orders(request.token_id)
+    result = await trading_service.get_orders_async(request.token_id)
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to get orders"))
-    return result
+    return DefaultJSONResponse(result)
 
 
 @app.get("/api/trading/orders/{order_id}")
 async def get_order(order_id: str, access_token: str):
     """Get order by ID"""
-    result = trading_service.get_order_by_id(access_token, order_id)
+    result = await trading_service.run_blocking(trading_service.get_order_by_id, access_token, order_id)
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to get order"))
     return result
@@ -1967,7 +2091,7 @@ async def cancel_order(order_id: str, request: TradingAuthRequest):
     """Cancel an order"""
     if not request.token_id:
         raise HTTPException(status_code=400, detail="Access token is required")
-    result = trading_service.cancel_order(request.token_id, order_id)
+    result = await trading_service.run_blocking(trading_service.cancel_order, request.token_id, order_id)
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to cancel order"))
     return result
@@ -1976,7 +2100,7 @@ async def cancel_order(order_id: str, request: TradingAuthRequest):
 @app.post("/api/trading/orders/{order_id}/modify")
 async def modify_order(order_id: str, request: ModifyOrderRequest):
     """Modify an order"""
-    result = trading_service.modify_order(request.access_token, order_id, request.dict())
+    result = await trading_service.run_blocking(trading_service.modify_order, request.access_token, order_id, request.dict())
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to modify order"))
     return result
@@ -1987,10 +2111,10 @@ async def get_positions(request: TradingAuthRequest):
     """Get current positions"""
     if not request.token_id:
         raise HTTPException(status_code=400, detail="Access token is required")
-    result = trading_service.get_positions(request.token_id)
+    result = await trading_service.get_positions_async(request.token_id)
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to get positions"))
-    return result
+    return DefaultJSONResponse(result)
 
 
 @app.post("/api/trading/holdings")
@@ -1998,10 +2122,10 @@ async def get_holdings(request: TradingAuthRequest):
     """Get current holdings"""
     if not request.token_id:
         raise HTTPException(status_code=400, detail="Access token is required")
-    result = trading_service.get_holdings(request.token_id)
+    result = await trading_service.get_holdings_async(request.token_id)
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to get holdings"))
-    return result
+    return DefaultJSONResponse(result)
 
 
 @app.post("/api/trading/funds")
@@ -2009,10 +2133,32 @@ async def get_funds(request: TradingAuthRequest):
     """Get fund limits and margin details"""
     if not request.token_id:
         raise HTTPException(status_code=400, detail="Access token is required")
-    result = trading_service.get_fund_limits(request.token_id)
+    result = await trading_service.get_fund_limits_async(request.token_id)
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to get funds"))
-    return result
+    return DefaultJSONResponse(result)
+
+
+@app.post("/api/trading/portfolio")
+async def get_portfolio(request: TradingAuthRequest):
+    """Get positions, holdings and funds in a single call"""
+    if not request.token_id:
+        raise HTTPException(status_code=400, detail="Access token is required")
+    result = await trading_service.get_portfolio_snapshot(request.token_id)
+    if not result.get("success"):
+        raise HTTPException(status_code=500, detail=result.get("error", "Failed to get portfolio"))
+    return DefaultJSONResponse(result)
+
+
+@app.post("/api/trading/dashboard")
+async def get_dashboard(request: TradingAuthRequest):
+    """Get positions, holdings, funds and orders in a single call"""
+    if not request.token_id:
+        raise HTTPException(status_code=400, detail="Access token is required")
+    result = await trading_service.get_dashboard_snapshot(request.token_id)
+    if not result.get("success"):
+        raise HTTPException(status_code=500, detail=result.get("error", "Failed to get dashboard"))
+    return DefaultJSONResponse(result)
 
 
 @app.post("/api/trading/market/quote")
@@ -2023,16 +2169,16 @@ async def get_market_quote(request: MarketQuoteRequest):
     if not access_token:
         raise HTTPException(status_code=400, detail="Access token required. Provide access_token in request or set DHAN_ACCESS_TOKEN environment variable.")
 
-    result = trading_service.get_market_quote(access_token, request.securities)
+    result = await quote_batcher.get(access_token, request.securities)
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to get market quote"))
-    return result
+    return DefaultJSONResponse(result)
 
 
 @app.post("/api/trading/market/option-chain")
 async def get_option_chain(request: OptionChainRequest):
     """Get option chain data"""
-    result = trading_service.get_option_chain(
+    result = await trading_service.get_option_chain_async(
         request.access_token,
         request.under_security_id,
         request.under_exchange_segment,
@@ -2040,7 +2186,7 @@ async def get_option_chain(request: OptionChainRequest):
     )
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to get option chain"))
-    return result
+    return DefaultJSONResponse(result)
 
 
 @app.post("/api/trading/market/historical")
@@ -2062,7 +2208,8 @@ async def get_historical_data(request: HistoricalDataRequest):
         "instrument_type": "EQUITY",
         "from_date": "2023-01-01",
         "to_date": "2023-01-31",
-        "interval": "daily"  # or "intraday" or "minute"
+        "interval": "daily",  # or "intraday" or "minute"
+        "format": "rows"  # or "columnar" for intraday candles as arrays
     }
     """
     # Use provided token or fallback to environment variable
@@ -2070,17 +2217,16 @@ async def get_historical_data(request: HistoricalDataRequest):
     if not access_token:
         raise HTTPException(status_code=400, detail="Access token required. Provide access_token in request or set DHAN_ACCESS_TOKEN environment variable.")
 
-    # Convert security_id to int for the method (it will convert to string internally)
-    security_id = int(request.security_id) if isinstance(request.security_id, str) else request.security_id
-
-    result = trading_service.get_historical_data(
+    result = await trading_service.run_blocking(
+        trading_service.get_historical_data,
         access_token,
-        security_id,
+        request.security_id,
         request.exchange_segment,
         request.instrument_type,
         request.from_date,
         request.to_date,
-        request.interval
+        request.interval,
+        request.format == "columnar"
     )
     if not result.get("success"):
         # Return the error with proper structure, including error code if available
@@ -2097,7 +2243,7 @@ async def get_securities(request: TradingAuthRequest):
     """Get security/instrument list"""
     if not request.token_id:
         raise HTTPException(status_code=400, detail="Access token is required")
-    result = trading_service.get_security_list(request.token_id)
+    result = await trading_service.get_security_list_async(request.token_id)
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to get securities"))
     return result
@@ -2131,7 +2277,7 @@ async def get_instrument_list_csv(request: InstrumentListCSVRequest):
         print(f"Database error for instruments: {e}, falling back to CSV API")
 
     # Fallback to CSV API if not in database or database query fails
-    result = trading_service.get_instrument_list_csv(request.format_type)
+    result = await trading_service.get_instrument_list_csv_async(request.format_type)
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to get instrument list"))
     return result
@@ -2201,7 +2347,7 @@ async def get_instrument_list_segmentwise(request: InstrumentListSegmentwiseRequ
 @app.post("/api/trading/expiry-list")
 async def get_expiry_list(request: ExpiryListRequest):
     """Get expiry list for underlying"""
-    result = trading_service.get_expiry_list(
+    result = await trading_service.get_expiry_list_async(
         request.access_token,
         request.under_security_id,
         request.under_exchange_segment
@@ -2216,10 +2362,10 @@ async def get_trades(request: TradingAuthRequest):
     """Get all trades executed today"""
     if not request.token_id:
         raise HTTPException(status_code=400, detail="Access token is required")
-    result = trading_service.get_trades(request.token_id)
+    result = await trading_service.get_trades_async(request.token_id)
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to get trades"))
-    return result
+    return DefaultJSONResponse(result)
 
 
 @app.post("/api/trading/trades/{order_id}")
@@ -2227,7 +2373,7 @@ async def get_trade_by_order_id(order_id: str, request: TradingAuthRequest):
     """Get trades by order ID"""
     if not request.token_id:
         raise HTTPException(status_code=400, detail="Access token is required")
-    result = trading_service.get_trade_by_order_id(request.token_id, order_id)
+    result = await trading_service.run_blocking(trading_service.get_trade_by_order_id, request.token_id, order_id)
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to get trade"))
     return result
@@ -2236,7 +2382,8 @@ async def get_trade_by_order_id(order_id: str, request: TradingAuthRequest):
 @app.post("/api/trading/trades/history")
 async def get_trade_history(request: TradeHistoryRequest):
     """Get trade history for date range"""
-    result = trading_service.get_trade_history(
+    result = await trading_service.run_blocking(
+        trading_service.get_trade_history,
         request.access_token,
         request.from_date,
         request.to_date,
@@ -2250,7 +2397,7 @@ async def get_trade_history(request: TradeHistoryRequest):
 @app.post("/api/trading/margin/calculator")
 async def calculate_margin(request: MarginCalculatorRequest):
     """Calculate margin for an order"""
-    result = trading_service.calculate_margin(request.access_token, request.dict())
+    result = await trading_service.run_blocking(trading_service.calculate_margin, request.access_token, request.dict())
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to calculate margin"))
     return result
@@ -2264,10 +2411,10 @@ async def manage_kill_switch(request: KillSwitchRequest):
 
     if request.status:
         # Manage kill switch
-        result = trading_service.manage_kill_switch(request.token_id, request.status)
+        result = await trading_service.run_blocking(trading_service.manage_kill_switch, request.token_id, request.status)
     else:
         # Get status
-        result = trading_service.get_kill_switch_status(request.token_id)
+        result = await trading_service.run_blocking(trading_service.get_kill_switch_status, request.token_id)
 
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error", "Failed to manage kill switch"))
@@ -2277,7 +2424,8 @@ async def manage_kill_switch(request: KillSwitchRequest):
 @app.post("/api/trading/ledger")
 async def get_ledger(request: LedgerRequest):
     """Get ledger report"""
-    result = trading_service.get_ledger(
+    result = await trading_service.run_blocking(
+        trading_service.get_ledger,
         request.access_token,
         request.from_date,
         request.to_date
@@ -0,0 +1,36 @@
+"""
+Process-wide configuration read from the environment and app/backend/.env
+"""
+import functools
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv  # pyright: ignore[reportMissingImports]
+
+
+@functools.lru_cache(maxsize=1)
+def load_env() -> None:
+    """Load .env into os.environ; later calls in the same process are no-ops"""
+    load_dotenv()
+
+
+@dataclass(frozen=True)
+class DhanSettings:
+    """DhanHQ credentials, fixed for the life of the process"""
+    client_id: Optional[str]
+    app_id: Optional[str]
+    app_secret: Optional[str]
+    # Fallback token for tool calls and the market-data daemon when a request has none
+    access_token: Optional[str]
+
+
+@functools.lru_cache(maxsize=1)
+def get_dhan_settings() -> DhanSettings:
+    load_env()
+    return DhanSettings(
+        client_id=os.getenv("DHAN_CLIENT_ID"),
+        app_id=os.getenv("DHAN_APP_ID"),
+        app_secret=os.getenv("DHAN_APP_SECRET"),
+        access_token=os.getenv("DHAN_ACCESS_TOKEN")
+    )
@@ -0,0 +1,150 @@
+"""
+Tests for the indexed instrument search in find_instrument_by_segment
+Run from the backend directory: python3 -m pytest test_instrument_search.py
+
+Each query is answered twice: through _InstrumentSearchIndex, and through the
+linear scan over every row that the search falls back to without an index.
+Both must pick the same instrument.
+"""
+
+import asyncio
+import random
+import time
+
+import pytest
+
+import tool_executor
+from tool_executor import _annotate_instruments, _InstrumentSearchIndex, find_instrument_by_segment
+
+
+def _row(security_id, underlying, symbol_name, display_name, trading_symbol="",
+         segment="E", instrument="EQUITY", exchange="NSE"):
+    return {
+        "SECURITY_ID": str(security_id),
+        "EXCH_ID": exchange,
+        "SEGMENT": segment,
+        "INSTRUMENT": instrument,
+        "UNDERLYING_SYMBOL": underlying,
+        "SYMBOL_NAME": symbol_name,
+        "DISPLAY_NAME": display_name,
+        "TRADING_SYMBOL": trading_symbol,
+    }
+
+
+EQUITY_ROWS = [
+    # A contains match listed before the exact matches
+    _row(1, "HDFCBANKX", "HDFC BANK EXTRA", "HDFC Bank Extra"),
+    # Exact tiers: display_name, then symbol_name, then underlying_symbol
+    _row(2, "HDFCB", "HDFC BANK LTD", "HDFC"),
+    _row(3, "HDFCL", "HDFC", "HDFC Life"),
+    _row(4, "HDFC", "HOUSING DEVELOPMENT", "Housing Development Finance"),
+    _row(5, "HDFC", "HDFC DUPLICATE", "HDFC Duplicate"),
+    # ETF-like rows are skipped by contains matches in equity segments
+    _row(6, "HDFCNIFTY50", "HDFC NIFTY ETF", "HDFC Nifty ETF", instrument="ETF"),
+    _row(7, "RELIANCE", "RELIANCE INDUSTRIES", "Reliance Industries", "RELIANCE-EQ"),
+    _row(8, "TCS", "TATA CONSULTANCY", "Tata Consultancy Services", "TCS-EQ"),
+    # Not an equity instrument: listed before the TATA equities but ranks below them
+    _row(11, "TATACAP", "TATA CAPITAL FUT", "Tata Capital Fut", segment="D", instrument="FUTURES"),
+    _row(9, "TATAMOTORS", "TATA MOTORS", "Tata Motors", "TATAMOTORS-EQ"),
+    _row(10, "TATASTEEL", "TATA STEEL", "Tata Steel", "TATASTEEL-EQ"),
+    _row(12, "", "", "", "INFY-EQ"),
+]
+
+INDEX_ROWS = [
+    _row(13, "NIFTY", "NIFTY 50", "Nifty 50", segment="I", instrument="INDEX"),
+    _row(25, "BANKNIFTY", "NIFTY BANK", "Nifty Bank", segment="I", instrument="INDEX"),
+    _row(27, "FINNIFTY", "NIFTY FIN SERVICE", "Nifty Financial Services", segment="I", instrument="INDEX"),
+    # Not an index: IDX_I searches must drop it, with or without the index
+    _row(99, "NIFTYBEES", "NIFTY BEES", "Nifty BeES", segment="E", instrument="EQUITY"),
+    _row(51, "SENSEX", "S&P BSE SENSEX", "Sensex", segment="I", instrument="INDEX", exchange="BSE"),
+]
+
+
+def _load_segment(exchange_segment, rows):
+    """Install rows as a segment's cached instrument list, like _get_segment_instruments does"""
+    rows = [dict(row) for row in rows]
+    _annotate_instruments(rows)
+    tool_executor._segment_instruments[exchange_segment] = (time.time(), rows)
+    tool_executor._segment_search_index[exchange_segment] = _InstrumentSearchIndex(rows)
+
+
+@pytest.fixture(autouse=True)
+def _clean_segments():
+    yield
+    tool_executor._segment_instruments.clear()
+    tool_executor._segment_search_index.clear()
+
+
+def _find_both(exchange_segment, symbol, **kwargs):
+    """Return (indexed result, linear scan result) for one query"""
+    indexed = asyncio.run(find_instrument_by_segment(exchange_segment, symbol, **kwargs))
+    search_index = tool_executor._segment_search_index.pop(exchange_segment)
+    try:
+        linear = asyncio.run(find_instrument_by_segment(exchange_segment, symbol, **kwargs))
+    finally:
+        tool_executor._segment_search_index[exchange_segment] = search_index
+    return indexed, linear
+
+
+@pytest.mark.parametrize("symbol, expected_id", [
+    ("hdfc", 4),        # underlying_symbol beats the earlier symbol_name/display_name matches
+    ("HDFC BANK LTD", 2),
+    ("hdfc life", 3),
+    ("tata", 9),        # contains: first equity row at the best priority, not the future
+    ("steel", 10),
+    ("infy", 12),       # contains in trading_symbol only
+    ("hdfcnifty", None),
+    ("unknown", None),
+])
+def test_equity_ranking_matches_linear_scan(symbol, expected_id):
+    _load_segment("NSE_EQ", EQUITY_ROWS)
+
+    indexed, linear = _find_both("NSE_EQ", symbol)
+
+    assert indexed == linear
+    assert (indexed or {}).get("security_id") == expected_id
+
+
+@pytest.mark.parametrize("symbol, expected_id", [
+    ("nifty", 13),
+    ("nifty bank", 25),
+    ("bees", None),     # only the non-index row matches
+    ("sensex", 51),
+])
+def test_index_segment_filters_non_indices(symbol, expected_id):
+    _load_segment("IDX_I", INDEX_ROWS)
+
+    indexed, linear = _find_both("IDX_I", symbol)
+
+    assert indexed == linear
+    assert (indexed or {}).get("security_id") == expected_id
+    if indexed:
+        assert indexed["exchange_segment"] == "IDX_I"
+
+
+def test_exact_match_skips_contains_pass():
+    _load_segment("NSE_EQ", EQUITY_ROWS)
+
+    indexed, linear = _find_both("NSE_EQ", "steel", exact_match=True)
+
+    assert indexed is None and linear is None
+
+
+def test_random_queries_match_linear_scan():
+    rng = random.Random(20240101)
+    alphabet = "ABCDE"
+    rows = []
+    for security_id in range(300):
+        words = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(4)]
+        rows.append(_row(
+            security_id, words[0], words[1], words[2].lower(), words[3],
+            segment=rng.choice(["E", "I", "D"]),
+            instrument=rng.choice(["EQUITY", "INDEX", "ETF", "BOND", "FUTURES", ""])
+        ))
+    queries = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 3))) for _ in range(60)]
+
+    for exchange_segment in ("NSE_EQ", "IDX_I", "NSE_FO"):
+        _load_segment(exchange_segment, rows)
+        for query in queries:
+            indexed, linear = _find_both(exchange_segment, query)
+            assert indexed == linear, (exchange_segment, query)
@@ -0,0 +1,97 @@
+"""
+Tests for QuoteBatcher request coalescing
+Run from the backend directory: python3 -m pytest test_quote_batcher.py
+"""
+
+import asyncio
+
+from trading import QuoteBatcher
+
+
+def _quote_response(quotes):
+    """A get_market_quote result in DhanHQ's data -> data -> {segment: {id: quote}} shape"""
+    return {"success": True, "data": {"status": "success", "data": {"data": quotes}}}
+
+
+class FakeService:
+    """Records get_market_quote_async calls and answers with every requested id"""
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    async def get_market_quote_async(self, access_token, securities):
+        self.calls.append((access_token, securities))
+        if self.error is not None:
+            raise self.error
+        return _quote_response({
+            segment: {str(sec_id): {"last_price": float(sec_id)} for sec_id in sec_ids}
+            for segment, sec_ids in securities.items()
+        })
+
+
+async def _gather_quotes(batcher, *requests):
+    return await asyncio.gather(*(batcher.get(token, securities) for token, securities in requests))
+
+
+def test_concurrent_requests_share_one_merged_call():
+    service = FakeService()
+    batcher = QuoteBatcher(service, window=0.01)
+
+    first, second = asyncio.run(_gather_quotes(
+        batcher,
+        ("token", {"NSE_EQ": [1333, 11536]}),
+        ("token", {"NSE_EQ": [11536, 2885], "IDX_I": [13]}),
+    ))
+
+    assert len(service.calls) == 1
+    assert service.calls[0][1] == {"NSE_EQ": [1333, 11536, 2885], "IDX_I": [13]}
+    assert first["data"]["data"]["data"] == {
+        "NSE_EQ": {"1333": {"last_price": 1333.0}, "11536": {"last_price": 11536.0}}
+    }
+    assert second["data"]["data"]["data"] == {
+        "NSE_EQ": {"11536": {"last_price": 11536.0}, "2885": {"last_price": 2885.0}},
+        "IDX_I": {"13": {"last_price": 13.0}},
+    }
+    assert not batcher._tasks
+
+
+def test_requests_are_batched_per_access_token():
+    service = FakeService()
+    batcher = QuoteBatcher(service, window=0.01)
+
+    asyncio.run(_gather_quotes(
+        batcher,
+        ("token-a", {"NSE_EQ": [1333]}),
+        ("token-b", {"NSE_EQ": [1333]}),
+    ))
+
+    assert sorted(token for token, _ in service.calls) == ["token-a", "token-b"]
+
+
+def test_upstream_error_reaches_every_caller():
+    batcher = QuoteBatcher(FakeService(error=RuntimeError("rate limited")), window=0.01)
+
+    results = asyncio.run(_gather_quotes(
+        batcher,
+        ("token", {"NSE_EQ": [1333]}),
+        ("token", {"BSE_EQ": [500325]}),
+    ))
+
+    assert results == [{"success": False, "error": "rate limited"}] * 2
+
+
+def test_flush_sends_pending_batches_immediately():
+    service = FakeService()
+    batcher = QuoteBatcher(service, window=60)
+
+    async def run():
+        pending = asyncio.ensure_future(batcher.get("token", {"NSE_EQ": [1333]}))
+        await asyncio.sleep(0)
+        await batcher.flush()
+        return await pending
+
+    result = asyncio.run(run())
+
+    assert len(service.calls) == 1
+    assert result["data"]["data"]["data"] == {"NSE_EQ": {"1333": {"last_price": 1333.0}}}
@@ -0,0 +1,116 @@
+"""
+Tests for trading.py's caching, throttling and request-splitting helpers
+Run from the backend directory: python3 -m pytest test_trading_helpers.py
+"""
+
+import asyncio
+
+import pytest
+
+import trading
+from trading import TokenBucket, TTLCache, _intraday_date_chunks, check_order_enum, trading_service
+
+
+def test_intraday_date_chunks_cover_the_range_without_gaps(monkeypatch):
+    monkeypatch.setattr(trading, "INTRADAY_CHUNK_DAYS", 30)
+
+    assert _intraday_date_chunks("2024-01-01", "2024-03-15") == [
+        ("2024-01-01", "2024-01-30"),
+        ("2024-01-31", "2024-02-29"),
+        ("2024-03-01", "2024-03-15"),
+    ]
+    assert _intraday_date_chunks("2024-01-01", "2024-01-01") == [("2024-01-01", "2024-01-01")]
+
+
+def test_intraday_date_chunks_pass_bad_ranges_through():
+    assert _intraday_date_chunks("yesterday", "2024-01-01") == [("yesterday", "2024-01-01")]
+    assert _intraday_date_chunks("2024-02-01", "2024-01-01") == [("2024-02-01", "2024-01-01")]
+
+
+def test_ttl_cache_expires_and_evicts_least_recently_used(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(trading.time, "monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=2, ttl=10)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1      # "a" is now the most recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    now[0] += 10
+    assert cache.get("a") is None
+    assert cache.get("c") is None
+
+
+def test_token_bucket_spends_the_burst_then_waits_for_refills(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(trading.time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(rate=5, burst=2)
+
+    assert bucket._reserve() == 0.0
+    assert bucket._reserve() == 0.0
+    assert bucket._reserve() == pytest.approx(0.2)
+    assert bucket._reserve() == pytest.approx(0.4)
+
+    now[0] += 10
+    assert bucket._reserve() == 0.0
+
+
+def test_single_flight_shares_one_call():
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"success": True, "data": len(calls)}
+
+    async def run():
+        return await asyncio.gather(*(
+            trading_service._single_flight(("test", "shared"), call) for _ in range(3)
+        ))
+
+    results = asyncio.run(run())
+
+    assert calls == [1]
+    assert results == [{"success": True, "data": 1}] * 3
+    assert ("test", "shared") not in trading_service._inflight
+
+
+def test_single_flight_propagates_the_error_to_every_waiter():
+    async def call():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        return await asyncio.gather(
+            *(trading_service._single_flight(("test", "error"), call) for _ in range(2)),
+            return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+
+    assert [str(result) for result in results] == ["upstream down"] * 2
+    assert ("test", "error") not in trading_service._inflight
+
+
+@pytest.mark.parametrize("field, value", [
+    ("exchange_segment", "NSE_EQ"),
+    ("transaction_type", "BUY"),
+    ("product_type", "INTRADAY"),
+    ("order_type", "STOP_LOSS"),
+    ("validity", "DAY"),
+])
+def test_check_order_enum_accepts_each_fields_values(field, value):
+    check_order_enum(field, value)
+
+
+@pytest.mark.parametrize("field, value", [
+    ("order_type", "BUY"),          # valid, but for another field
+    ("exchange_segment", "INTRADAY"),
+    ("validity", "GTC"),
+])
+def test_check_order_enum_rejects_values_of_other_fields(field, value):
+    with pytest.raises(ValueError):
+        check_order_enum(field, value)
@@ -5,13 +5,87 @@ This module handles execution of tool/function calls made by AI agents,
 routing them to the appropriate TradingService methods.
 """
 
-from typing import Dict, Any, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 from datetime import datetime, timedelta
+import asyncio
+import bisect
+import hashlib
 import json
+import logging
+import operator
 import os
-from trading import trading_service
+import sys
+import time
+import traceback
+from settings import get_dhan_settings
+from trading import quote_batcher, trading_service
 from database import Database
 
+# orjson is optional: it serializes large tool results (option chains, candles)
+# several times faster than the stdlib encoder
+_HAS_ORJSON = False
+try:
+    import orjson
+    _HAS_ORJSON = True
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+market_logger = logging.getLogger("devagent.market")
+
+
+def dumps_tool_result(value: Any) -> str:
+    """
+    Serialize a tool result (or part of one) as indented JSON for the LLM or UI.
+
+    Uses orjson when installed. Values JSON cannot represent natively (Decimal,
+    datetime, ...) are stringified instead of raising.
+    """
+    if _HAS_ORJSON:
+        try:
+            return orjson.dumps(
+                value,
+                default=str,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+            ).decode()
+        except TypeError:
+            # e.g. integers beyond 64 bits; the stdlib encoder handles these
+            pass
+    return json.dumps(value, indent=2, default=str)
+
+# (exchange, segment) -> DhanHQ exchange segment. "*" matches any value.
+_EXCHANGE_SEGMENT_MAP = {
+    ("NSE", "E"): "NSE_EQ",
+    ("BSE", "E"): "BSE_EQ",
+    ("NSE", "D"): "NSE_FO",
+    ("BSE", "D"): "BSE_FO",
+    ("MCX", "*"): "MCX_COM",
+    ("NCDEX", "*"): "NCDEX_COM",
+    ("*", "I"): "IDX_I",
+    ("*", "INDEX"): "IDX_I",
+}
+
+
+def resolve_exchange_segment(exchange: str, segment: str) -> Optional[str]:
+    """
+    Resolve an instrument's exchange/segment codes to a DhanHQ exchange segment.
+
+    Tries the exact (exchange, segment) pair first, then the segment wildcard
+    (so indices resolve to IDX_I on any exchange), then the exchange wildcard.
+
+    Args:
+        exchange: Exchange id (e.g., "NSE", "BSE", "MCX"), upper-cased
+        segment: Segment code (e.g., "E", "D", "I"), upper-cased
+
+    Returns:
+        DhanHQ exchange segment (e.g., "NSE_EQ", "IDX_I") or None if unknown
+    """
+    return (
+        _EXCHANGE_SEGMENT_MAP.get((exchange, segment))
+        or _EXCHANGE_SEGMENT_MAP.get(("*", segment))
+        or _EXCHANGE_SEGMENT_MAP.get((exchange, "*"))
+    )
+
 
 def get_access_token(access_token: Optional[str] = None) -> Optional[str]:
     """
@@ -25,7 +99,33 @@ def get_access_token(access_token: Optional[str] = None) -> Optional[str]:
     """
     if access_token:
         return access_token
-    return os.getenv("DHAN_ACCESS_TOKEN")
+    return get_dhan_settings().access_token
+
+
+# Callables execute_tool dispatches through, imported on first use because
+# tools and the agent registry import this module: (validate_tool_args,
+# router execute_tool, registry get_tool). The router pair is None when the
+# agent package cannot be imported, leaving only the legacy executors.
+_dispatch_functions: Optional[Tuple[Callable[..., Any], Optional[Callable[..., Any]], Optional[Callable[..., Any]]]] = None
+
+
+def _get_dispatch_functions() -> Tuple[Callable[..., Any], Optional[Callable[..., Any]], Optional[Callable[..., Any]]]:
+    """Resolve the validation, router and registry functions once per process."""
+    global _dispatch_functions
+    if _dispatch_functions is None:
+        from tools import validate_tool_args
+        router_execute_tool = get_tool = None
+        try:
+            try:
+                from agent.tool_router import execute_tool as router_execute_tool
+                from agent.tool_registry import get_tool
+            except ImportError:
+                from app.agent.tool_router import execute_tool as router_execute_tool
+                from app.agent.tool_registry import get_tool
+        except Exception as e:
+            print(f"[execute_tool] New tool router unavailable, using legacy executors: {e}")
+        _dispatch_functions = (validate_tool_args, router_execute_tool, get_tool)
+    return _dispatch_functions
 
 
 async def execute_tool(
@@ -48,17 +148,20 @@ async def execute_tool(
     Returns:
         Dict with function execution results
     """
+    validate_tool_args, router_execute_tool, get_tool = _get_dispatch_functions()
+
+    # Reject malformed LLM arguments before calling any tool
+    function_args, validation_error = validate_tool_args(function_name, function_args)
+    if validation_error:
+        return {
+            "success": False,
+            "error": validation_error
+        }
+
     # Try new tool router first
     try:
-        try:
-            from agent.tool_router import execute_tool as router_execute_tool
-            from agent.tool_registry import get_tool
-        except ImportError:
-            from app.agent.tool_router import execute_tool as router_execute_tool
-            from app.agent.tool_registry import get_tool
-
         # Check if tool exists in new registry
-        tool = get_tool(function_name)
+        tool = get_tool(function_name) if get_tool else None
         if tool:
             result = await router_execute_tool(function_name, function_args, access_token)
             # Convert new format to legacy format for compatibility
@@ -82,7 +185,6 @@ async def execute_tool(
             return result
     except Exception as e:
         # If new system fails, fall back to legacy
-        import traceback
         print(f"[execute_tool] New tool router failed, falling back to legacy: {e}")
         print(f"[execute_tool] Traceback: {traceback.format_exc()}")
 
@@ -96,140 +198,301 @@ async def execute_tool(
             "error": "Access token required for trading operations. Please provide access_token parameter or set DHAN_ACCESS_TOKEN environment variable."
         }
 
+    executor = TOOL_EXECUTORS.get(function_name)
+    if executor is None:
+        return {
+            "success": False,
+            "error": f"Unknown function: {function_name}. Available functions: {', '.join(TOOL_EXECUTORS)}"
+        }
+
     try:
         # Route to appropriate TradingService method
-        if function_name == "search_instruments":
-            # Search instruments (supports exact_match and case_sensitive like Ruby gem)
-            return await search_instruments(
-                function_args.get("query", ""),
-                function_args.get("exchange_segment"),
-                function_args.get("instrument_type"),
-                function_args.get("limit", 10),
-                function_args.get("exact_match", False),
-                function_args.get("case_sensitive", False)
-            )
-        elif function_name == "get_market_quote":
-            # Handle IDX_I format for indices - use IDX_I directly (DhanHQ API supports it)
-            securities = function_args["securities"]
-
-            # Convert security IDs to integers (ohlc_data expects integers, not strings)
-            securities_int = {}
-            for exchange_seg, sec_ids in securities.items():
-                securities_int[exchange_seg] = [
-                    int(sec_id) if isinstance(sec_id, (str, int, float)) else sec_id
-                    for sec_id in sec_ids
-                ]
-
-            print(f"[get_market_quote] Calling with securities (original): {securities}")
-            print(f"[get_market_quote] Calling with securities (converted to int): {securities_int}")
-
-            # ohlc_data expects integers, so use the converted version
-            result = trading_service.get_market_quote(
-                access_token,
-                securities_int
-            )
+        return await executor(access_token, function_args)
+    except KeyError as e:
+        return {
+            "success": False,
+            "error": f"Missing required parameter: {str(e)}"
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"Error executing {function_name}: {str(e)}"
+        }
 
-            # Log the result for debugging
-            if result.get("success"):
-                data = result.get("data", {})
-                print(f"[get_market_quote] Success - data type: {type(data)}")
-                if isinstance(data, dict):
-                    print(f"[get_market_quote] Data keys: {list(data.keys())}")
-                    if "data" in data and isinstance(data["data"], dict):
-                        print(f"[get_market_quote] data.data keys: {list(data['data'].keys())}")
-            else:
-                print(f"[get_market_quote] Failed - error: {result.get('error')}")
 
-            return result
+# Small integer codes for instrument segments, assigned once when a segment's
+# rows are loaded so the search loop compares ints instead of upper-cased strings
+SEGMENT_UNKNOWN = 0
+SEGMENT_INDEX = 1
+SEGMENT_EQUITY = 2
+SEGMENT_DERIV = 3
+SEGMENT_COM = 4
+_SEGMENT_TO_CODE = {
+    "I": SEGMENT_INDEX,
+    "INDEX": SEGMENT_INDEX,
+    "E": SEGMENT_EQUITY,
+    "D": SEGMENT_DERIV,
+    "M": SEGMENT_COM,
+}
 
-        elif function_name == "get_historical_data":
-            security_id = function_args["security_id"]
-            exchange_segment = function_args["exchange_segment"]
-            instrument_type = function_args["instrument_type"]
-            from_date = function_args["from_date"]
-            to_date = function_args["to_date"]
-            interval = function_args.get("interval", "daily")
-
-            print(f"[get_historical_data] Calling with:")
-            print(f"  security_id: {security_id}")
-            print(f"  exchange_segment: {exchange_segment}")
-            print(f"  instrument_type: {instrument_type}")
-            print(f"  from_date: {from_date}")
-            print(f"  to_date: {to_date}")
-            print(f"  interval: {interval}")
-
-            result = trading_service.get_historical_data(
-                access_token,
-                security_id,
-                exchange_segment,
-                instrument_type,
-                from_date,
-                to_date,
-                interval
-            )
+# Membership sets used while ranking instrument matches
+_EQUITY_SEGMENTS = frozenset({"NSE_EQ", "BSE_EQ"})
+_EQUITY_INSTRUMENT_TYPES = frozenset({"EQUITY", "EQ", ""})
+_MUTUAL_FUND_INSTRUMENT_TYPES = frozenset({"MUTUAL_FUND", "MF"})
+_DEBT_INSTRUMENT_TYPES = frozenset({"DEBT", "BOND"})
+_COMMODITY_INSTRUMENT_TYPES = frozenset({"COMMODITY", "CURRENCY"})
+_DERIVATIVE_INSTRUMENT_TYPES = frozenset({"FUTURES", "OPTIONS"})
+
+
+# Instrument master columns the search reads; every other column is dropped at load
+_INSTRUMENT_FIELDS = (
+    "SECURITY_ID", "SEM_SECURITY_ID", "SM_SECURITY_ID",
+    "EXCH_ID", "SEM_EXM_EXCH_ID",
+    "SEGMENT", "SEM_SEGMENT",
+    "INSTRUMENT", "INSTRUMENT_TYPE",
+    "UNDERLYING_SYMBOL", "SYMBOL_NAME", "DISPLAY_NAME",
+    "TRADING_SYMBOL", "SEM_TRADING_SYMBOL",
+)
+# Low-cardinality columns whose values are interned so rows share one string object
+_INSTRUMENT_CATEGORY_FIELDS = frozenset({
+    "EXCH_ID", "SEM_EXM_EXCH_ID", "SEGMENT", "SEM_SEGMENT", "INSTRUMENT", "INSTRUMENT_TYPE",
+})
+
+
+def _project_instruments(instruments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Copy raw instrument rows keeping only _INSTRUMENT_FIELDS.
 
-            if result.get("success"):
-                data_count = len(result.get("data", [])) if isinstance(result.get("data"), list) else "N/A"
-                print(f"[get_historical_data] Success - returned {data_count} data points")
-            else:
-                print(f"[get_historical_data] Failed - error: {result.get('error')}")
+    Instrument masters carry dozens of columns per row; the search needs a
+    handful, so narrowing rows cuts the resident size and the on-disk snapshot.
+    """
+    projected = []
+    for inst in instruments:
+        row = {}
+        for field in _INSTRUMENT_FIELDS:
+            value = inst.get(field)
+            if value is None:
+                continue
+            if field in _INSTRUMENT_CATEGORY_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            row[field] = value
+        projected.append(row)
+    return projected
+
+
+def _annotate_instruments(instruments: List[Dict[str, Any]]) -> None:
+    """
+    Precompute per-row search fields in place.
 
-            return result
+    Adds "_segment_code" (integer segment code) and "_match_keys", the
+    upper-cased, stripped and interned (underlying_symbol, symbol_name,
+    display_name, trading_symbol) used by case-insensitive searches.
+    """
+    for inst in instruments:
+        segment = (inst.get("SEGMENT") or inst.get("SEM_SEGMENT") or "").upper()
+        inst["_segment_code"] = _SEGMENT_TO_CODE.get(segment, SEGMENT_UNKNOWN)
+        inst["_match_keys"] = (
+            sys.intern((inst.get("UNDERLYING_SYMBOL") or "").upper().strip()),
+            sys.intern((inst.get("SYMBOL_NAME") or "").upper().strip()),
+            sys.intern((inst.get("DISPLAY_NAME") or "").upper().strip()),
+            sys.intern((inst.get("TRADING_SYMBOL") or inst.get("SEM_TRADING_SYMBOL") or "").upper().strip())
+        )
 
-        elif function_name == "get_positions":
-            result = trading_service.get_positions(access_token)
-            return result
 
-        elif function_name == "get_holdings":
-            result = trading_service.get_holdings(access_token)
-            return result
+# Separates fields and rows in _InstrumentSearchIndex.haystack; never part of a query
+_INDEX_SEPARATOR = "\x00"
 
-        elif function_name == "get_fund_limits":
-            result = trading_service.get_fund_limits(access_token)
-            return result
 
-        elif function_name == "get_option_chain":
-            result = trading_service.get_option_chain(
-                access_token,
-                function_args["under_security_id"],
-                function_args["under_exchange_segment"],
-                function_args["expiry"]
-            )
-            return result
+class _InstrumentSearchIndex:
+    """
+    Lookup structures over a segment's annotated instrument rows.
 
-        elif function_name == "get_orders":
-            result = trading_service.get_orders(access_token)
-            return result
+    exact maps each upper-cased underlying_symbol, symbol_name and display_name
+    to the positions of the rows carrying it. haystack joins every row's match
+    keys into one string so substring queries run as str.find in C; starts
+    holds each row's offset into it for mapping hits back to rows.
+    """
 
-        elif function_name == "get_trades":
-            result = trading_service.get_trades(access_token)
-            return result
+    __slots__ = ("instruments", "exact", "haystack", "starts")
+
+    def __init__(self, instruments: List[Dict[str, Any]]):
+        self.instruments = instruments
+        self.exact: Dict[str, List[int]] = {}
+        self.starts: List[int] = []
+        parts = []
+        offset = 0
+        for position, inst in enumerate(instruments):
+            match_keys = inst["_match_keys"]
+            for key in match_keys[:3]:
+                if key:
+                    positions = self.exact.setdefault(key, [])
+                    if not positions or positions[-1] != position:
+                        positions.append(position)
+            row = _INDEX_SEPARATOR.join(match_keys) + _INDEX_SEPARATOR
+            self.starts.append(offset)
+            parts.append(row)
+            offset += len(row)
+        self.haystack = "".join(parts)
+
+    def exact_candidates(self, search_symbol: str) -> List[Dict[str, Any]]:
+        """Rows whose underlying_symbol, symbol_name or display_name equals search_symbol, in list order."""
+        return [self.instruments[position] for position in self.exact.get(search_symbol, ())]
+
+    def contains_candidates(self, search_symbol: str) -> List[Dict[str, Any]]:
+        """Rows with search_symbol in any match key, in list order."""
+        if _INDEX_SEPARATOR in search_symbol:
+            return self.instruments
+        candidates = []
+        find = self.haystack.find
+        starts = self.starts
+        row_count = len(starts)
+        position = find(search_symbol)
+        while position != -1:
+            row = bisect.bisect_right(starts, position) - 1
+            candidates.append(self.instruments[row])
+            if row + 1 >= row_count:
+                break
+            # Resume at the next row so each row is reported once
+            position = find(search_symbol, starts[row + 1])
+        return candidates
+
+
+# Per-segment instrument lists. Kept in memory and snapshotted to disk so a cold
+# start does not re-download each segment's instrument master on the first search.
+_INSTRUMENT_CACHE_DIR = os.getenv(
+    "INSTRUMENT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "instruments")
+)
+_INSTRUMENT_CACHE_VERSION = 3  # 2: rows narrowed to _INSTRUMENT_FIELDS; 3: JSON rows
+_INSTRUMENT_CACHE_MAX_AGE = 24 * 60 * 60  # seconds; instrument masters change ~daily
+_segment_instruments: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+_segment_search_index: Dict[str, _InstrumentSearchIndex] = {}
+
+
+def _instrument_snapshot_paths(exchange_segment: str) -> Tuple[str, str]:
+    """Return (data, sidecar) paths of the on-disk snapshot for a segment."""
+    base = os.path.join(_INSTRUMENT_CACHE_DIR, exchange_segment)
+    return f"{base}.rows.json", f"{base}.json"
+
+
+def _load_instrument_snapshot(exchange_segment: str) -> Optional[Tuple[float, List[Dict[str, Any]]]]:
+    """
+    Load a segment's instrument snapshot from disk.
 
-        elif function_name == "analyze_market":
-            # Composite function that combines multiple API calls
-            return await analyze_market_composite(
-                access_token,
-                function_args["security_id"],
-                function_args["exchange_segment"],
-                function_args.get("days", 30)
-            )
+    Returns:
+        (fetched_at, instruments), or None if the snapshot is missing, stale,
+        from another cache version, or fails its checksum
+    """
+    data_path, sidecar_path = _instrument_snapshot_paths(exchange_segment)
+    try:
+        with open(sidecar_path, "r") as f:
+            sidecar = json.load(f)
+        if sidecar.get("version") != _INSTRUMENT_CACHE_VERSION:
+            return None
+        fetched_at = float(sidecar.get("fetched_at", 0))
+        if time.time() - fetched_at > _INSTRUMENT_CACHE_MAX_AGE:
+            return None
 
-        else:
-            return {
-                "success": False,
-                "error": f"Unknown function: {function_name}. Available functions: {', '.join(TOOL_EXECUTORS.keys())}"
-            }
+        with open(data_path, "rb") as f:
+            payload = f.read()
+        if hashlib.sha256(payload).hexdigest() != sidecar.get("sha256"):
+            return None
+        # Re-project to intern the category fields again, as JSON decoding does not
+        instruments = _project_instruments(orjson.loads(payload) if _HAS_ORJSON else json.loads(payload))
+        if len(instruments) != sidecar.get("row_count"):
+            return None
+        return fetched_at, instruments
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Ignoring instrument snapshot for %s: %s", exchange_segment, e)
+        return None
 
-    except KeyError as e:
-        return {
-            "success": False,
-            "error": f"Missing required parameter: {str(e)}"
+
+def _save_instrument_snapshot(exchange_segment: str, fetched_at: float, instruments: List[Dict[str, Any]]) -> None:
+    """Write a segment's instrument list to disk with a {version, row_count, sha256} sidecar."""
+    data_path, sidecar_path = _instrument_snapshot_paths(exchange_segment)
+    try:
+        os.makedirs(_INSTRUMENT_CACHE_DIR, exist_ok=True)
+        payload = orjson.dumps(instruments) if _HAS_ORJSON else json.dumps(instruments).encode()
+        sidecar = {
+            "version": _INSTRUMENT_CACHE_VERSION,
+            "exchange_segment": exchange_segment,
+            "row_count": len(instruments),
+            "sha256": hashlib.sha256(payload).hexdigest(),
+            "fetched_at": fetched_at
         }
+        # Write to temp files and rename so a crash never leaves a torn snapshot
+        with open(f"{data_path}.tmp", "wb") as f:
+            f.write(payload)
+        with open(f"{sidecar_path}.tmp", "w") as f:
+            json.dump(sidecar, f)
+        os.replace(f"{data_path}.tmp", data_path)
+        os.replace(f"{sidecar_path}.tmp", sidecar_path)
     except Exception as e:
-        return {
-            "success": False,
-            "error": f"Error executing {function_name}: {str(e)}"
-        }
+        logger.warning("Could not save instrument snapshot for %s: %s", exchange_segment, e)
+
+
+async def _get_segment_instruments(exchange_segment: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Get the instrument list for a segment from memory, the disk snapshot, or the API.
+
+    Args:
+        exchange_segment: Exchange segment (e.g., "NSE_EQ", "IDX_I")
+
+    Returns:
+        List of raw instrument rows, or None if they could not be fetched
+    """
+    cached = _segment_instruments.get(exchange_segment)
+    if cached and time.time() - cached[0] <= _INSTRUMENT_CACHE_MAX_AGE:
+        return cached[1]
+
+    snapshot = await asyncio.to_thread(_load_instrument_snapshot, exchange_segment)
+    if snapshot is None:
+        segment_result = await trading_service.get_instrument_list_segmentwise(exchange_segment)
+        if not segment_result.get("success") or not segment_result.get("data", {}).get("instruments"):
+            logger.warning(
+                "Failed to fetch instruments for segment %s: %s",
+                exchange_segment, segment_result.get("error", "Unknown error")
+            )
+            return None
+        snapshot = (time.time(), _project_instruments(segment_result["data"]["instruments"]))
+        await asyncio.to_thread(_save_instrument_snapshot, exchange_segment, *snapshot)
+
+    _annotate_instruments(snapshot[1])
+    _segment_search_index[exchange_segment] = _InstrumentSearchIndex(snapshot[1])
+    _segment_instruments[exchange_segment] = snapshot
+    return snapshot[1]
+
+
+# Segments searched when no exchange_segment is given (like Ruby gem's find_anywhere)
+_COMMON_SEGMENTS = ("NSE_EQ", "BSE_EQ", "IDX_I", "NSE_FO", "BSE_FO")
+
+# Set once warm_instruments() has loaded the common segments
+_INSTRUMENTS_READY = asyncio.Event()
+_instrument_warmup_started = False
+_INSTRUMENTS_READY_WAIT = 0.5  # seconds a search waits for an in-progress warmup
+
+
+async def warm_instruments(segments: Tuple[str, ...] = _COMMON_SEGMENTS) -> None:
+    """
+    Load the instrument lists for the common segments in the background.
+
+    Started at app startup so the first search does not pay for downloading
+    and parsing the instrument masters. Searches issued while this runs wait
+    briefly and then fail fast instead of fetching inline.
+    """
+    global _instrument_warmup_started
+    _instrument_warmup_started = True
+    try:
+        results = await asyncio.gather(
+            *(_get_segment_instruments(segment) for segment in segments),
+            return_exceptions=True
+        )
+        loaded = sum(1 for result in results if result and not isinstance(result, Exception))
+        logger.info("Instrument catalog warmed: %d/%d segments loaded", loaded, len(segments))
+    finally:
+        _INSTRUMENTS_READY.set()
 
 
 async def find_instrument_by_segment(
@@ -256,53 +519,58 @@ async def find_instrument_by_segment(
         Dict with instrument data or None if not found
     """
     try:
-        # Fetch instruments from API for the segment
-        segment_result = await trading_service.get_instrument_list_segmentwise(exchange_segment)
-        if not segment_result.get("success") or not segment_result.get("data", {}).get("instruments"):
-            print(f"Warning: Failed to fetch instruments for segment {exchange_segment}: {segment_result.get('error', 'Unknown error')}")
+        # Instruments for the segment (memory, disk snapshot, then API)
+        instruments = await _get_segment_instruments(exchange_segment)
+        if not instruments:
             return None
 
-        instruments = segment_result["data"]["instruments"]
-        search_symbol = symbol if case_sensitive else symbol.upper()
+        # Interned so exact matches against the interned row keys compare by identity
+        search_symbol = symbol if case_sensitive else sys.intern(symbol.upper().strip())
         print(f"Searching for '{search_symbol}' in {len(instruments)} instruments from segment {exchange_segment}")
 
         # Two-pass approach: First pass for exact matches, second pass for contains matches
         # This ensures exact matches are always prioritized, even if contains matches appear earlier in the list
 
+        # Case-insensitive searches only need to visit rows the index says can match
+        search_index = None if case_sensitive or not search_symbol else _segment_search_index.get(exchange_segment)
+        if search_index is not None and search_index.instruments is not instruments:
+            search_index = None
+
+        # Loop invariants for the requested segment
+        is_equity_segment = exchange_segment in _EQUITY_SEGMENTS
+        is_index_segment = exchange_segment == "IDX_I"
+
         def process_instrument(inst, collect_contains=False):
             """Process a single instrument and return match info if found"""
             inst_type = (inst.get("INSTRUMENT") or inst.get("INSTRUMENT_TYPE") or "").upper()
 
             # Get all fields (normalize case if needed)
-            underlying_symbol = inst.get("UNDERLYING_SYMBOL") or ""
-            symbol_name = inst.get("SYMBOL_NAME") or ""
-            display_name = inst.get("DISPLAY_NAME") or ""
-            trading_symbol = inst.get("TRADING_SYMBOL") or inst.get("SEM_TRADING_SYMBOL") or ""
-
-            if not case_sensitive:
-                underlying_symbol = underlying_symbol.upper().strip()
-                symbol_name = symbol_name.upper().strip()
-                display_name = display_name.upper().strip()
-                trading_symbol = trading_symbol.upper().strip()
-
-            # Get segment for filtering
-            segment = (inst.get("SEGMENT") or inst.get("SEM_SEGMENT") or "").upper()
+            if case_sensitive:
+                underlying_symbol = inst.get("UNDERLYING_SYMBOL") or ""
+                symbol_name = inst.get("SYMBOL_NAME") or ""
+                display_name = inst.get("DISPLAY_NAME") or ""
+                trading_symbol = inst.get("TRADING_SYMBOL") or inst.get("SEM_TRADING_SYMBOL") or ""
+                underlying_upper = underlying_symbol.upper()
+                symbol_upper = symbol_name.upper()
+                display_upper = display_name.upper()
+            else:
+                # Upper-cased, stripped and interned once at load time (see _annotate_instruments)
+                underlying_symbol, symbol_name, display_name, trading_symbol = inst["_match_keys"]
+                underlying_upper, symbol_upper, display_upper = underlying_symbol, symbol_name, display_name
+
+            # Segment code assigned at load time (see _annotate_instruments)
+            segment_code = inst.get("_segment_code", SEGMENT_UNKNOWN)
 
             # For equity segment searches, filter out non-equity instruments in contains matches
             # This prevents ETFs, mutual funds, etc. from matching when searching for stocks
-            is_equity_segment = exchange_segment in ["NSE_EQ", "BSE_EQ"]
-            is_equity_instrument = inst_type in ["EQUITY", "EQ", ""] or segment == "E"
+            is_equity_instrument = inst_type in _EQUITY_INSTRUMENT_TYPES or segment_code == SEGMENT_EQUITY
 
             # Check for non-equity instruments by type and symbol patterns
             # ETFs and mutual funds often have patterns like "HDFCNEXT50", "HDFCAMC", etc.
-            underlying_upper = underlying_symbol.upper()
-            symbol_upper = symbol_name.upper()
-            display_upper = display_name.upper()
-
-            is_etf = inst_type in ["ETF"] or "ETF" in symbol_upper or "ETF" in display_upper
-            is_mutual_fund = inst_type in ["MUTUAL_FUND", "MF"] or "AMC" in symbol_upper or "AMC" in display_upper or "MUTUAL" in symbol_upper
-            is_debt = inst_type in ["DEBT", "BOND"]
-            is_commodity = inst_type in ["COMMODITY", "CURRENCY"]
+            is_etf = inst_type == "ETF" or "ETF" in symbol_upper or "ETF" in display_upper
+            is_mutual_fund = inst_type in _MUTUAL_FUND_INSTRUMENT_TYPES or "AMC" in symbol_upper or "AMC" in display_upper or "MUTUAL" in symbol_upper
+            is_debt = inst_type in _DEBT_INSTRUMENT_TYPES
+            is_commodity = inst_type in _COMMODITY_INSTRUMENT_TYPES
 
             # Also check for common patterns: if underlying_symbol contains numbers/patterns typical of ETFs/MFs
             # e.g., "HDFCNEXT50", "HDFC1406DD" - these are likely ETFs/MFs, not stocks
@@ -401,14 +669,13 @@ async def find_instrument_by_segment(
 
             security_id = inst.get("SECURITY_ID") or inst.get("SEM_SECURITY_ID") or inst.get("SM_SECURITY_ID")
             exchange = inst.get("EXCH_ID") or inst.get("SEM_EXM_EXCH_ID") or "NSE"
-            # segment already defined above
+            segment = (inst.get("SEGMENT") or inst.get("SEM_SEGMENT") or "").upper()
 
             # Map exchange segment correctly - ensure indices use IDX_I
             final_exchange_segment = exchange_segment
-            segment_upper = segment.upper()
-            if segment_upper == "I" or segment_upper == "INDEX" or inst_type == "INDEX":
+            if segment_code == SEGMENT_INDEX or inst_type == "INDEX":
                 final_exchange_segment = "IDX_I"
-            elif exchange_segment == "IDX_I" and segment_upper != "I":
+            elif is_index_segment:
                 return None  # Skip if we requested IDX_I but this isn't an index
 
             return {
@@ -427,32 +694,43 @@ async def find_instrument_by_segment(
                 }
             }
 
-        # PASS 1: Search for EXACT matches only (priority 1-3)
-        exact_matches = []
-        for inst in instruments:
+        # PASS 1: Search for EXACT matches only (priority 1-3), bucketed by tier.
+        # Only the single best match is returned, so the first priority-1 hit
+        # ends the scan - nothing later in the list can outrank it.
+        exact_tiers = {1: [], 2: [], 3: []}
+        exact_candidates = search_index.exact_candidates(search_symbol) if search_index else instruments
+        for inst in exact_candidates:
             match_info = process_instrument(inst, collect_contains=False)
             if match_info and match_info["priority"] <= 3:  # Only exact matches
-                exact_matches.append(match_info)
+                exact_tiers[match_info["priority"]].append(match_info)
+                if match_info["priority"] == 1:
+                    break
 
         # If we found exact matches, return the best one immediately
+        exact_matches = exact_tiers[1] or exact_tiers[2] or exact_tiers[3]
         if exact_matches:
-            exact_matches.sort(key=lambda x: x["priority"])
             best_match = exact_matches[0]["instrument"]
             print(f"Selected best EXACT match: {best_match.get('symbol_name')} / {best_match.get('display_name')} / {best_match.get('underlying_symbol')} (Priority: {exact_matches[0]['priority']}, Security ID: {best_match.get('security_id')}, Exchange Segment: {best_match.get('exchange_segment')})")
             return best_match
 
-        # PASS 2: Only if no exact matches, search for CONTAINS matches (priority 4-7)
+        # PASS 2: Only if no exact matches, search for CONTAINS matches (priority 3.5-7).
+        # Only the best match is needed, so keep a running minimum (the first
+        # lowest-priority match, as a stable sort would pick) instead of sorting.
         if not exact_match:
-            contains_matches = []
-            for inst in instruments:
-                match_info = process_instrument(inst, collect_contains=True)
-                if match_info and match_info["priority"] >= 4:  # Only contains matches
-                    contains_matches.append(match_info)
-
-            if contains_matches:
-                contains_matches.sort(key=lambda x: x["priority"])
-                best_match = contains_matches[0]["instrument"]
-                print(f"Selected best CONTAINS match: {best_match.get('symbol_name')} / {best_match.get('display_name')} / {best_match.get('underlying_symbol')} (Priority: {contains_matches[0]['priority']}, Security ID: {best_match.get('security_id')}, Exchange Segment: {best_match.get('exchange_segment')})")
+            contains_candidates = search_index.contains_candidates(search_symbol) if search_index else instruments
+            contains_matches = (
+                process_instrument(inst, collect_contains=True)
+                for inst in contains_candidates
+            )
+            best_info = min(
+                (match_info for match_info in contains_matches if match_info and match_info["priority"] > 3),
+                key=operator.itemgetter("priority"),
+                default=None
+            )
+
+            if best_info:
+                best_match = best_info["instrument"]
+                print(f"Selected best CONTAINS match: {best_match.get('symbol_name')} / {best_match.get('display_name')} / {best_match.get('underlying_symbol')} (Priority: {best_info['priority']}, Security ID: {best_match.get('security_id')}, Exchange Segment: {best_match.get('exchange_segment')})")
                 return best_match
 
         print(f"No match found for '{search_symbol}' in segment {exchange_segment}")
@@ -479,7 +757,8 @@ async def search_instruments(
     3. display_name (lowest priority)
 
     Args:
-        query: Search query (symbol name, trading symbol, etc.)
+        query: Search query (symbol name, trading symbol, etc.); separate several
+            symbols with "|" (e.g., "NIFTY|BANKNIFTY") to resolve a basket
         exchange_segment: Optional exchange segment filter (if None, searches common segments)
         instrument_type: Optional instrument type filter
         limit: Maximum number of results
@@ -489,6 +768,24 @@ async def search_instruments(
     Returns:
         Dict with search results including security_id, exchange_segment, etc.
     """
+    if _instrument_warmup_started and not _INSTRUMENTS_READY.is_set():
+        try:
+            await asyncio.wait_for(_INSTRUMENTS_READY.wait(), timeout=_INSTRUMENTS_READY_WAIT)
+        except asyncio.TimeoutError:
+            return {
+                "success": False,
+                "error": "Instrument catalog loading, retry shortly"
+            }
+
+    # Basket queries such as "NIFTY|BANKNIFTY|FINNIFTY" resolve each symbol separately
+    if "|" in query:
+        patterns = list(dict.fromkeys(p.strip() for p in query.split("|") if p.strip()))
+        if len(patterns) > 1:
+            return await _search_instrument_basket(
+                query, patterns, exchange_segment, instrument_type, limit, exact_match, case_sensitive
+            )
+        query = patterns[0] if patterns else ""
+
     try:
         # If exchange_segment is provided, use find_instrument_by_segment (like Ruby gem's find)
         if exchange_segment:
@@ -509,14 +806,14 @@ async def search_instruments(
                 }
 
         # If no exchange_segment, search across common segments (like Ruby gem's find_anywhere)
-        common_segments = ["NSE_EQ", "BSE_EQ", "IDX_I", "NSE_FO", "BSE_FO"]
+        common_segments = list(_COMMON_SEGMENTS)
         if instrument_type:
             # Filter segments based on instrument type
             if instrument_type.upper() == "INDEX":
                 common_segments = ["IDX_I"]
             elif instrument_type.upper() == "EQUITY":
                 common_segments = ["NSE_EQ", "BSE_EQ"]
-            elif instrument_type.upper() in ["FUTURES", "OPTIONS"]:
+            elif instrument_type.upper() in _DERIVATIVE_INSTRUMENT_TYPES:
                 common_segments = ["NSE_FO", "BSE_FO"]
 
         # Try each segment until we find a match
@@ -535,11 +832,10 @@ async def search_instruments(
         # If no match found, try to fetch and show sample instruments for debugging
         # Start with IDX_I for index queries, or NSE_EQ for others
         sample_segment = "IDX_I" if (instrument_type and instrument_type.upper() == "INDEX") or "NIFTY" in query.upper() or "SENSEX" in query.upper() else "NSE_EQ"
-        segment_result = await trading_service.get_instrument_list_segmentwise(sample_segment)
+        idx_instruments = await _get_segment_instruments(sample_segment)
 
         sample_instruments = []
-        if segment_result.get("success") and segment_result.get("data", {}).get("instruments"):
-            idx_instruments = segment_result["data"]["instruments"]
+        if idx_instruments:
             # Show first 30 instruments and also search for any that might match
             query_upper = query.upper()
             for inst in idx_instruments[:30]:
@@ -588,248 +884,97 @@ async def search_instruments(
 
     except Exception as e:
         error_detail = str(e) if str(e) else repr(e)
-        import traceback
         print(f"Error in search_instruments: {error_detail}")
-        print(traceback.format_exc())
+        logger.debug("search_instruments failure", exc_info=True)
         return {
             "success": False,
             "error": f"Error searching instruments: {error_detail}"
         }
 
-        # Normalize query and detect if it's an index query
-        query_upper = query.upper().strip() if not case_sensitive else query.strip()
-        is_index_query = (
-            (instrument_type and instrument_type.upper() == "INDEX") or
-            "NIFTY" in query_upper or
-            "SENSEX" in query_upper
-        )
 
-        # Get all instruments from database
-        try:
-            instruments = await db.get_instruments("detailed", limit=50000)
-            if not instruments:
-                # If database is empty, try to fetch from CSV as fallback
-                print("Database is empty, trying to fetch from CSV...")
-                csv_result = trading_service.get_instrument_list_csv("detailed")
-                if csv_result.get("success") and csv_result.get("data", {}).get("instruments"):
-                    instruments = csv_result["data"]["instruments"]
-                    # Optionally save to DB for future use
-                    try:
-                        await db.save_instruments(instruments, "detailed")
-                    except Exception as e:
-                        print(f"Warning: Could not save instruments to database: {e}")
-                else:
-                    instruments = []
-        except Exception as e:
-            print(f"Error fetching instruments from database: {str(e)}")
-            # Try CSV as fallback
-            try:
-                csv_result = trading_service.get_instrument_list_csv("detailed")
-                if csv_result.get("success") and csv_result.get("data", {}).get("instruments"):
-                    instruments = csv_result["data"]["instruments"]
-                else:
-                    instruments = []
-            except Exception as csv_error:
-                print(f"Error fetching instruments from CSV: {str(csv_error)}")
-                instruments = []
-
-        # Two-pass approach: First pass for exact matches, second pass for contains matches
-        def process_db_instrument(inst, collect_contains=False):
-            """Process a single database instrument and return match info if found"""
-            # Check various fields
-            symbol_name = (inst.get("SYMBOL_NAME") or inst.get("SEM_SYMBOL_NAME") or inst.get("SM_SYMBOL_NAME") or "").upper()
-            trading_symbol = (inst.get("SEM_TRADING_SYMBOL") or inst.get("TRADING_SYMBOL") or "").upper()
-            display_name = (inst.get("DISPLAY_NAME") or inst.get("SEM_CUSTOM_SYMBOL") or "").upper()
-            underlying_symbol = (inst.get("UNDERLYING_SYMBOL") or inst.get("SEM_UNDERLYING_SYMBOL") or "").upper()
-            security_id = str(inst.get("SEM_SECURITY_ID") or inst.get("SECURITY_ID") or inst.get("SM_SECURITY_ID") or "")
-
-            # Get segment and exchange for filtering
-            segment = (inst.get("SEM_SEGMENT") or inst.get("SEGMENT") or "").upper()
-            exchange = (inst.get("SEM_EXM_EXCH_ID") or inst.get("EXCH_ID") or inst.get("EXCHANGE_ID") or "").upper()
-
-            # For index queries, must have segment "I"
-            if is_index_query:
-                if segment != "I":
-                    return None
-
-            match_priority = None
+async def _search_instrument_basket(
+    query: str,
+    patterns: List[str],
+    exchange_segment: Optional[str],
+    instrument_type: Optional[str],
+    limit: int,
+    exact_match: bool,
+    case_sensitive: bool
+) -> Dict[str, Any]:
+    """
+    Resolve several "|"-separated symbols with one search per symbol.
 
-            # Try EXACT matches first
-            if underlying_symbol:
-                underlying_symbol_clean = underlying_symbol.strip()
-                if underlying_symbol_clean == query_upper:
-                    match_priority = 1
-            elif symbol_name:
-                symbol_name_clean = symbol_name.strip()
-                if symbol_name_clean == query_upper:
-                    match_priority = 2
-            elif display_name:
-                display_name_clean = display_name.strip()
-                if display_name_clean == query_upper:
-                    match_priority = 3
-            # Only check contains matches if collect_contains is True
-            elif collect_contains and not exact_match:
-                if underlying_symbol and query_upper in underlying_symbol:
-                    match_priority = 4
-                elif symbol_name and query_upper in symbol_name:
-                    match_priority = 5
-                elif display_name and query_upper in display_name:
-                    match_priority = 6
-                elif trading_symbol and query_upper in trading_symbol:
-                    match_priority = 7
-                elif query_upper == security_id:
-                    match_priority = 8
+    Segment instrument lists are cached, so the searches share the loaded rows
+    instead of fetching them once per symbol.
+    """
+    results = await asyncio.gather(*(
+        search_instruments(pattern, exchange_segment, instrument_type, limit, exact_match, case_sensitive)
+        for pattern in patterns
+    ))
+
+    instruments = []
+    not_found = []
+    for pattern, result in zip(patterns, results):
+        if result.get("success"):
+            instruments.extend(result.get("data", {}).get("instruments", []))
+        else:
+            not_found.append(pattern)
 
-            if match_priority is None:
-                return None
+    if not instruments:
+        return {
+            "success": False,
+            "error": f"No instruments found matching any of {patterns}"
+        }
 
-            # Apply filters if provided
-            if exchange_segment:
-                # Handle IDX_I specially
-                if exchange_segment == "IDX_I":
-                    if segment != "I":
-                        return None
-                else:
-                    expected_exchange = exchange_segment.split("_")[0]
-                    expected_segment = exchange_segment.split("_")[1] if "_" in exchange_segment else ""
-                    segment_map = {"EQ": "E", "FNO": "D", "FO": "D", "IDX": "I", "COM": "M"}
-                    expected_segment_code = segment_map.get(expected_segment, expected_segment)
-                    if exchange.upper() != expected_exchange.upper() or (expected_segment_code and segment != expected_segment_code):
-                        return None
+    return {
+        "success": True,
+        "data": {
+            "instruments": instruments,
+            "count": len(instruments),
+            "query": query,
+            "not_found": not_found
+        }
+    }
 
-            if instrument_type:
-                inst_type = (inst.get("INSTRUMENT") or inst.get("INSTRUMENT_TYPE") or "").upper()
-                if inst_type != instrument_type.upper():
-                    return None
 
-            # Extract relevant information
-            security_id_val = inst.get("SEM_SECURITY_ID") or inst.get("SECURITY_ID") or inst.get("SM_SECURITY_ID")
-            exchange_val = inst.get("SEM_EXM_EXCH_ID") or inst.get("EXCH_ID") or inst.get("EXCHANGE_ID") or "NSE"
-            segment_val = inst.get("SEM_SEGMENT") or inst.get("SEGMENT") or "E"
-
-            # Map to DhanHQ exchange segment format
-            exchange_segment_formatted = "NSE_EQ"
-            segment_upper = segment_val.upper()
-            exchange_upper = exchange_val.upper()
-
-            if segment_upper == "I" or segment_upper == "INDEX":
-                exchange_segment_formatted = "IDX_I"
-            elif exchange_upper == "NSE" and segment_upper == "E":
-                exchange_segment_formatted = "NSE_EQ"
-            elif exchange_upper == "BSE" and segment_upper == "E":
-                exchange_segment_formatted = "BSE_EQ"
-            elif exchange_upper == "NSE" and segment_upper == "D":
-                exchange_segment_formatted = "NSE_FO"
-            elif exchange_upper == "BSE" and segment_upper == "D":
-                exchange_segment_formatted = "BSE_FO"
-            elif exchange_upper == "MCX":
-                exchange_segment_formatted = "MCX_COM"
-            elif exchange_upper == "NCDEX":
-                exchange_segment_formatted = "NCDEX_COM"
+# Close-price field names seen across DhanHQ responses, in lookup order
+_CLOSE_KEYS = ("close", "CLOSE", "Close", "ClosePrice", "CLOSE_PRICE", "close_price", "c", "C")
 
-            return {
-                "priority": match_priority,
-                "result": {
-                    "security_id": int(security_id_val) if security_id_val else None,
-                    "exchange_segment": exchange_segment_formatted,
-                    "symbol_name": inst.get("SYMBOL_NAME") or inst.get("SEM_SYMBOL_NAME") or "",
-                    "trading_symbol": inst.get("SEM_TRADING_SYMBOL") or inst.get("TRADING_SYMBOL") or "",
-                    "display_name": inst.get("DISPLAY_NAME") or inst.get("SEM_CUSTOM_SYMBOL") or "",
-                    "instrument_type": inst.get("INSTRUMENT") or inst.get("INSTRUMENT_TYPE") or "",
-                    "exchange": exchange_val,
-                    "segment": segment_val
-                }
-            }
 
-        # PASS 1: Search for EXACT matches only (priority 1-3)
-        exact_results = []
-        for inst in instruments:
-            match_info = process_db_instrument(inst, collect_contains=False)
-            if match_info and match_info["priority"] <= 3:
-                exact_results.append(match_info)
-
-        # If we found exact matches, use them (sorted and limited)
-        if exact_results:
-            exact_results.sort(key=lambda x: x["priority"])
-            results = [item["result"] for item in exact_results[:limit]]
-        else:
-            # PASS 2: Only if no exact matches, search for CONTAINS matches (priority 4-8)
-            if not exact_match:
-                contains_results = []
-                for inst in instruments:
-                    match_info = process_db_instrument(inst, collect_contains=True)
-                    if match_info and match_info["priority"] >= 4:
-                        contains_results.append(match_info)
-
-                if contains_results:
-                    contains_results.sort(key=lambda x: x["priority"])
-                    results = [item["result"] for item in contains_results[:limit]]
-                else:
-                    results = []
-            else:
-                results = []
-
-        if not results:
-            # If no results found, try to fetch and show sample instruments from API
-            sample_instruments = []
-            sample_info = ""
-
-            # For index queries, fetch IDX_I instruments to show samples
-            if is_index_query:
-                try:
-                    segment_result = await trading_service.get_instrument_list_segmentwise("IDX_I")
-                    if segment_result.get("success") and segment_result.get("data", {}).get("instruments"):
-                        idx_instruments = segment_result["data"]["instruments"]
-                        # Show first 20 instruments as samples
-                        for inst in idx_instruments[:20]:
-                            underlying_symbol = (inst.get("UNDERLYING_SYMBOL") or inst.get("UNDERLYING") or "").upper().strip()
-                            symbol_name = inst.get("SYMBOL_NAME") or inst.get("DISPLAY_NAME") or ""
-                            security_id = inst.get("SECURITY_ID") or inst.get("SEM_SECURITY_ID") or ""
-                            sample_instruments.append({
-                                "underlying_symbol": underlying_symbol,
-                                "symbol_name": symbol_name,
-                                "security_id": security_id,
-                                "display_name": inst.get("DISPLAY_NAME", ""),
-                                "trading_symbol": inst.get("TRADING_SYMBOL", "")
-                            })
-                        sample_info = f"\n\nFound {len(idx_instruments)} total instruments in IDX_I segment. Sample instruments:\n" + "\n".join([
-                            f"  - {inst['symbol_name']} (underlying_symbol: {inst['underlying_symbol']}, security_id: {inst['security_id']})"
-                            for inst in sample_instruments[:10]
-                        ])
-                except Exception as e:
-                    print(f"Error fetching sample instruments: {str(e)}")
-
-            # If no results found, provide helpful error message with samples
-            error_msg = f"No instruments found matching '{query}'. Please check the spelling or try a different search term. For indices like NIFTY, ensure you're searching with the correct name.{sample_info}"
+def _extract_closes(historical_list: Union[List[Any], Dict[str, Any]]) -> List[float]:
+    """
+    Extract close prices from historical candles in chronological order.
 
-            return {
-                "success": False,
-                "error": error_msg,
-                "data": {
-                    "query": query,
-                    "sample_instruments": sample_instruments[:10] if sample_instruments else None,
-                    "hint": "Check the sample_instruments above to see available instruments. Look for matching underlying_symbol or symbol_name."
-                } if sample_instruments else None
-            }
+    The close-price key is resolved once from the first candle instead of
+    probing every name on every row. Columnar responses (a dict of arrays such
+    as ``{"close": [...], "open": [...]}``) are read directly.
 
-        return {
-            "success": True,
-            "data": {
-                "instruments": results,
-                "count": len(results),
-                "query": query
-            }
-        }
+    Args:
+        historical_list: List of candle dicts, or a dict of per-field arrays
 
-    except Exception as e:
-        error_detail = str(e) if str(e) else repr(e)
-        import traceback
-        print(f"Error in search_instruments: {error_detail}")
-        print(traceback.format_exc())
-        return {
-            "success": False,
-            "error": f"Error searching instruments: {error_detail}"
-        }
+    Returns:
+        List of close prices; blank and non-numeric values are skipped
+    """
+    if isinstance(historical_list, dict):
+        key = next((k for k in _CLOSE_KEYS if isinstance(historical_list.get(k), list)), None)
+        values = historical_list[key] if key else []
+    else:
+        first = next((row for row in historical_list if isinstance(row, dict)), None)
+        key = next((k for k in _CLOSE_KEYS if first.get(k) is not None), None) if first else None
+        if key is None:
+            return []
+        get_close = operator.itemgetter(key)
+        values = (get_close(row) for row in historical_list if isinstance(row, dict) and key in row)
+
+    closes = []
+    for value in values:
+        if value is None or value == "":
+            continue
+        try:
+            closes.append(float(value))
+        except (ValueError, TypeError):
+            continue
+    return closes
 
 
 async def analyze_market_composite(
@@ -849,36 +994,42 @@ async def analyze_market_composite(
         to_date = datetime.now().strftime("%Y-%m-%d")
         from_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
 
-        # Get current quote
-        quote_result = trading_service.get_market_quote(
-            access_token,
-            {exchange_segment: [security_id]}
-        )
-
         # Determine instrument type based on exchange segment
         # IDX_I is for indices, others are typically EQUITY
         instrument_type = "INDEX" if exchange_segment == "IDX_I" else "EQUITY"
 
-        # Get historical data
-        print(f"[analyze_market] Using instrument:")
-        print(f"  security_id: {security_id}")
-        print(f"  exchange_segment: {exchange_segment}")
-        print(f"  instrument_type: {instrument_type}")
-        print(f"[analyze_market] Fetching historical data for date range: {from_date} to {to_date} (interval: daily)")
-        historical_result = trading_service.get_historical_data(
-            access_token,
-            security_id,
-            exchange_segment,
-            instrument_type,
-            from_date,
-            to_date,
-            "daily"
+        market_logger.debug(
+            "[analyze_market] security_id=%s exchange_segment=%s instrument_type=%s range=%s..%s (daily)",
+            security_id, exchange_segment, instrument_type, from_date, to_date
         )
 
+        # Quote and historical data are independent calls - fetch them concurrently
+        quote_result, historical_result = await asyncio.gather(
+            trading_service.get_market_quote_async(
+                access_token,
+                {exchange_segment: [security_id]}
+            ),
+            trading_service.run_blocking(
+                trading_service.get_historical_data,
+                access_token,
+                security_id,
+                exchange_segment,
+                instrument_type,
+                from_date,
+                to_date,
+                "daily"
+            ),
+            return_exceptions=True
+        )
+        if isinstance(quote_result, Exception):
+            quote_result = {"success": False, "error": str(quote_result)}
+        if isinstance(historical_result, Exception):
+            historical_result = {"success": False, "error": str(historical_result)}
+
         if not historical_result.get("success"):
-            print(f"[analyze_market] Historical data fetch failed: {historical_result.get('error')}")
+            market_logger.debug("[analyze_market] Historical data fetch failed: %s", historical_result.get("error"))
         else:
-            print(f"[analyze_market] Historical data fetch succeeded")
+            market_logger.debug("[analyze_market] Historical data fetch succeeded")
 
         # Combine results
         analysis = {
@@ -901,7 +1052,7 @@ async def analyze_market_composite(
         quote_available = quote_result.get("success")
         historical_available = historical_result.get("success")
 
-        print(f"[analyze_market] Quote result success: {quote_available}, Historical result success: {historical_available}")
+        market_logger.debug("[analyze_market] Quote result success: %s, Historical result success: %s", quote_available, historical_available)
 
         if quote_available or historical_available:
             quote_data_raw = quote_result.get("data", {}) if quote_available else {}
@@ -909,31 +1060,34 @@ async def analyze_market_composite(
 
             # Extract quote data from nested structure (same as format_market_quote_result)
             quote_data = None
-            print(f"[analyze_market] Extracting quote data from structure, exchange_segment: {exchange_segment}")
+            market_logger.debug("[analyze_market] Extracting quote data from structure, exchange_segment: %s", exchange_segment)
 
             if isinstance(quote_data_raw, dict):
                 # Try nested structure: data.data.data.{exchange_segment}.{security_id}
                 if "data" in quote_data_raw and isinstance(quote_data_raw["data"], dict):
                     if "data" in quote_data_raw["data"]:
                         nested_data = quote_data_raw["data"]["data"]
-                        print(f"[analyze_market] Nested data keys: {list(nested_data.keys()) if isinstance(nested_data, dict) else 'not a dict'}")
+                        if market_logger.isEnabledFor(logging.DEBUG):
+                            market_logger.debug("[analyze_market] Nested data keys: %s", list(nested_data.keys()) if isinstance(nested_data, dict) else "not a dict")
                         for exchange_seg in [exchange_segment, "IDX_I", "NSE_IDX", "BSE_IDX", "NSE_EQ", "BSE_EQ"]:
                             if exchange_seg in nested_data:
                                 securities = nested_data[exchange_seg]
-                                print(f"[analyze_market] Found segment {exchange_seg}, securities type: {type(securities)}")
+                                market_logger.debug("[analyze_market] Found segment %s, securities type: %s", exchange_seg, type(securities))
                                 if isinstance(securities, dict):
-                                    print(f"[analyze_market] Security IDs in {exchange_seg}: {list(securities.keys())}")
+                                    if market_logger.isEnabledFor(logging.DEBUG):
+                                        market_logger.debug("[analyze_market] Security IDs in %s: %s", exchange_seg, list(securities.keys()))
                                     for sec_id, quote_info in securities.items():
                                         if isinstance(quote_info, dict) and quote_info:
                                             quote_data = quote_info
-                                            print(f"[analyze_market] Found quote data for security_id {sec_id}, keys: {list(quote_data.keys())}")
+                                            if market_logger.isEnabledFor(logging.DEBUG):
+                                                market_logger.debug("[analyze_market] Found quote data for security_id %s, keys: %s", sec_id, list(quote_data.keys()))
                                             break
                                     if quote_data:
                                         break
                 # If not found, try direct access
                 if not quote_data and any(key in quote_data_raw for key in ["LTP", "ltp", "lastPrice", "OPEN", "open"]):
                     quote_data = quote_data_raw
-                    print(f"[analyze_market] Using quote_data_raw as flat structure")
+                    market_logger.debug("[analyze_market] Using quote_data_raw as flat structure")
 
             # Extract key metrics with more field variations
             current_price = None
@@ -952,12 +1106,12 @@ async def analyze_market_composite(
                     except (ValueError, TypeError):
                         current_price = None
 
-                print(f"[analyze_market] Extracted current_price: {current_price}")
+                market_logger.debug("[analyze_market] Extracted current_price: %s", current_price)
 
             # Calculate trend if historical data available
             trend = None
             trend_summary = ""
-            print(f"[analyze_market] Historical data type: {type(historical_data)}, length: {len(historical_data) if isinstance(historical_data, (list, dict)) else 'N/A'}")
+            market_logger.debug("[analyze_market] Historical data type: %s, length: %s", type(historical_data), len(historical_data) if isinstance(historical_data, (list, dict)) else "N/A")
 
             if historical_data:
                 # Handle different historical data structures
@@ -965,41 +1119,24 @@ async def analyze_market_composite(
                 if isinstance(historical_data, list):
                     historical_list = historical_data
                 elif isinstance(historical_data, dict):
-                    # Might be wrapped in a dict, try to extract list
-                    historical_list = historical_data.get("data") or historical_data.get("historical") or []
-                    if not isinstance(historical_list, list):
+                    # Might be wrapped in a dict, try to extract list (or columnar arrays)
+                    historical_list = historical_data.get("data") or historical_data.get("historical") or historical_data
+                    if not isinstance(historical_list, (list, dict)):
                         historical_list = []
 
                 if historical_list and len(historical_list) > 0:
-                    print(f"[analyze_market] Processing {len(historical_list)} historical data points")
+                    market_logger.debug("[analyze_market] Processing %s historical data points", len(historical_list))
                     # Get first and last close prices
-                    first_close = None
-                    last_close = None
-
-                    # Try to get close prices from historical data with multiple field name variations
-                    for item in historical_list:
-                        if isinstance(item, dict):
-                            # Try multiple field name variations for close price
-                            close_val = (item.get("close") or item.get("CLOSE") or item.get("Close") or
-                                       item.get("ClosePrice") or item.get("CLOSE_PRICE") or
-                                       item.get("close_price") or item.get("c") or item.get("C"))
-
-                            if close_val is not None and close_val != "":
-                                try:
-                                    close_float = float(close_val) if isinstance(close_val, (int, float, str)) else None
-                                    if close_float is not None:
-                                        if first_close is None:
-                                            first_close = close_float
-                                        last_close = close_float
-                                except (ValueError, TypeError):
-                                    continue
-
-                    print(f"[analyze_market] First close: {first_close}, Last close: {last_close}")
+                    closes = _extract_closes(historical_list)
+                    first_close = closes[0] if closes else None
+                    last_close = closes[-1] if closes else None
+
+                    market_logger.debug("[analyze_market] First close: %s, Last close: %s", first_close, last_close)
 
                     # Use last_close as current_price if current_price is None
                     if current_price is None and last_close:
                         current_price = last_close
-                        print(f"[analyze_market] Using last_close as current_price: {current_price}")
+                        market_logger.debug("[analyze_market] Using last_close as current_price: %s", current_price)
 
                     if first_close and last_close and first_close > 0:
                         change = last_close - first_close
@@ -1022,12 +1159,13 @@ async def analyze_market_composite(
                         trend_summary += f"- Change: ₹{trend['change']} ({trend['change_percent']:+.2f}%)\n"
                         trend_summary += f"- Direction: {'📈 Upward' if direction == 'up' else '📉 Downward' if direction == 'down' else '➡️ Neutral'}"
                     else:
-                        print(f"[analyze_market] Trend calculation failed - first_close: {first_close}, last_close: {last_close}")
+                        market_logger.debug("[analyze_market] Trend calculation failed - first_close: %s, last_close: %s", first_close, last_close)
                         # If we have historical data but can't calculate trend, at least show we have data
                         if historical_list:
-                            trend_summary = f"Historical data available ({len(historical_list)} data points) but could not extract close prices for trend calculation. Available keys in first item: {list(historical_list[0].keys()) if historical_list and isinstance(historical_list[0], dict) else 'N/A'}"
+                            sample = historical_list if isinstance(historical_list, dict) else historical_list[0]
+                            trend_summary = f"Historical data available ({len(historical_list)} data points) but could not extract close prices for trend calculation. Available keys in first item: {list(sample.keys()) if isinstance(sample, dict) else 'N/A'}"
                 else:
-                    print(f"[analyze_market] No historical data available or empty list")
+                    market_logger.debug("[analyze_market] No historical data available or empty list")
                     if not quote_result.get("success"):
                         trend_summary = f"Failed to fetch current quote data: {quote_result.get('error', 'Unknown error')}"
                     elif not historical_result.get("success"):
@@ -1057,16 +1195,140 @@ async def analyze_market_composite(
         }
 
 
-# Export available tool names
-TOOL_EXECUTORS = {
-    "get_market_quote",
-    "get_historical_data",
-    "get_positions",
-    "get_holdings",
-    "get_fund_limits",
-    "get_option_chain",
-    "get_orders",
-    "get_trades",
-    "analyze_market"
-}
+async def _execute_search_instruments(access_token: str, function_args: Dict[str, Any]) -> Dict[str, Any]:
+    # Search instruments (supports exact_match and case_sensitive like Ruby gem)
+    return await search_instruments(
+        function_args.get("query", ""),
+        function_args.get("exchange_segment"),
+        function_args.get("instrument_type"),
+        function_args.get("limit", 10),
+        function_args.get("exact_match", False),
+        function_args.get("case_sensitive", False)
+    )
+
+
+async def _execute_get_market_quote(access_token: str, function_args: Dict[str, Any]) -> Dict[str, Any]:
+    # Handle IDX_I format for indices - use IDX_I directly (DhanHQ API supports it)
+    securities = function_args["securities"]
+
+    # Convert security IDs to integers (ohlc_data expects integers, not strings)
+    securities_int = {}
+    for exchange_seg, sec_ids in securities.items():
+        securities_int[exchange_seg] = [
+            int(sec_id) if isinstance(sec_id, (str, int, float)) else sec_id
+            for sec_id in sec_ids
+        ]
+
+    market_logger.debug("[get_market_quote] Calling with securities (original): %s", securities)
+    market_logger.debug("[get_market_quote] Calling with securities (converted to int): %s", securities_int)
+
+    # ohlc_data expects integers, so use the converted version
+    result = await quote_batcher.get(
+        access_token,
+        securities_int
+    )
+
+    # Log the result for debugging
+    if result.get("success"):
+        if market_logger.isEnabledFor(logging.DEBUG):
+            data = result.get("data", {})
+            market_logger.debug("[get_market_quote] Success - data type: %s", type(data))
+            if isinstance(data, dict):
+                market_logger.debug("[get_market_quote] Data keys: %s", list(data.keys()))
+                if "data" in data and isinstance(data["data"], dict):
+                    market_logger.debug("[get_market_quote] data.data keys: %s", list(data["data"].keys()))
+    else:
+        market_logger.debug("[get_market_quote] Failed - error: %s", result.get("error"))
+
+    return result
+
+
+async def _execute_get_historical_data(access_token: str, function_args: Dict[str, Any]) -> Dict[str, Any]:
+    security_id = function_args["security_id"]
+    exchange_segment = function_args["exchange_segment"]
+    instrument_type = function_args["instrument_type"]
+    from_date = function_args["from_date"]
+    to_date = function_args["to_date"]
+    interval = function_args.get("interval", "daily")
+
+    market_logger.debug(
+        "[get_historical_data] Calling with security_id=%s exchange_segment=%s instrument_type=%s "
+        "from_date=%s to_date=%s interval=%s",
+        security_id, exchange_segment, instrument_type, from_date, to_date, interval
+    )
+
+    result = await trading_service.run_blocking(
+        trading_service.get_historical_data,
+        access_token,
+        security_id,
+        exchange_segment,
+        instrument_type,
+        from_date,
+        to_date,
+        interval
+    )
+
+    if result.get("success"):
+        data = result.get("data")
+        market_logger.debug(
+            "[get_historical_data] Success - returned %s data points",
+            len(data) if isinstance(data, list) else "N/A"
+        )
+    else:
+        market_logger.debug("[get_historical_data] Failed - error: %s", result.get("error"))
+
+    return result
+
+
+async def _execute_get_positions(access_token: str, function_args: Dict[str, Any]) -> Dict[str, Any]:
+    return await trading_service.get_positions_async(access_token)
 
+
+async def _execute_get_holdings(access_token: str, function_args: Dict[str, Any]) -> Dict[str, Any]:
+    return await trading_service.get_holdings_async(access_token)
+
+
+async def _execute_get_fund_limits(access_token: str, function_args: Dict[str, Any]) -> Dict[str, Any]:
+    return await trading_service.get_fund_limits_async(access_token)
+
+
+async def _execute_get_option_chain(access_token: str, function_args: Dict[str, Any]) -> Dict[str, Any]:
+    return await trading_service.get_option_chain_async(
+        access_token,
+        function_args["under_security_id"],
+        function_args["under_exchange_segment"],
+        function_args["expiry"]
+    )
+
+
+async def _execute_get_orders(access_token: str, function_args: Dict[str, Any]) -> Dict[str, Any]:
+    return await trading_service.get_orders_async(access_token)
+
+
+async def _execute_get_trades(access_token: str, function_args: Dict[str, Any]) -> Dict[str, Any]:
+    return await trading_service.get_trades_async(access_token)
+
+
+async def _execute_analyze_market(access_token: str, function_args: Dict[str, Any]) -> Dict[str, Any]:
+    # Composite function that combines multiple API calls
+    return await analyze_market_composite(
+        access_token,
+        function_args["security_id"],
+        function_args["exchange_segment"],
+        function_args.get("days", 30)
+    )
+
+
+# Legacy tool name -> executor(access_token, function_args)
+TOOL_EXECUTORS: Dict[str, Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]] = {
+    "search_instruments": _execute_search_instruments,
+    "get_market_quote": _execute_get_market_quote,
+    "get_historical_data": _execute_get_historical_data,
+    "get_positions": _execute_get_positions,
+    "get_holdings": _execute_get_holdings,
+    "get_fund_limits": _execute_get_fund_limits,
+    "get_option_chain": _execute_get_option_chain,
+    "get_orders": _execute_get_orders,
+    "get_trades": _execute_get_trades,
+    "analyze_market": _execute_analyze_market
+}
@@ -8,6 +8,12 @@ DEPRECATED: This module now uses the new agent.tool_registry system.
 The DHANHQ_TOOLS list is generated from the tool registry.
 """
 
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict, ValidationError, create_model
+
 # Import the new tool registry system
 _HAS_NEW_REGISTRY = False
 get_tool_specs = None
@@ -245,30 +251,162 @@ _LEGACY_DHANHQ_TOOLS = [
     }
 ]
 
-# Tool execution mapping
-TOOL_EXECUTORS = {
-    "search_instruments": "search_instruments",
-    "get_market_quote": "get_market_quote",
-    "get_historical_data": "get_historical_data",
-    "get_positions": "get_positions",
-    "get_holdings": "get_holdings",
-    "get_fund_limits": "get_fund_limits",
-    "get_option_chain": "get_option_chain",
-    "get_orders": "get_orders",
-    "get_trades": "get_trades",
-    "analyze_market": "analyze_market"  # Composite function
-}
+# Tool execution mapping: tool name -> executor(access_token, function_args).
+# Re-exported from tool_executor so there is a single dispatch table; nothing
+# in this module uses it, callers import it from here.
+from tool_executor import TOOL_EXECUTORS  # noqa: F401
 
-# Generate tools from registry (backward compatibility)
-# This runs after _LEGACY_DHANHQ_TOOLS is defined
+# Tool specs from the registry (backward compatibility), in OpenAI function
+# calling format. This runs after _LEGACY_DHANHQ_TOOLS is defined
 if _HAS_NEW_REGISTRY and get_tool_specs:
     try:
-        DHANHQ_TOOLS = get_tool_specs()
+        _TOOL_SPECS = get_tool_specs()
     except Exception as e:
         print(f"[tools.py] Warning: Failed to load tools from registry: {e}")
         # Fall back to legacy tools
-        DHANHQ_TOOLS = _LEGACY_DHANHQ_TOOLS
+        _TOOL_SPECS = _LEGACY_DHANHQ_TOOLS
 else:
     # Use legacy tools if registry not available
-    DHANHQ_TOOLS = _LEGACY_DHANHQ_TOOLS
+    _TOOL_SPECS = _LEGACY_DHANHQ_TOOLS
+
+
+# JSON schema type -> Python type for generated argument models
+_JSON_SCHEMA_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": float,
+    "boolean": bool,
+    "object": dict,
+    "array": list,
+}
+
+
+# enum values -> Literal type, so tools repeating an enum (exchange segments,
+# instrument types) share one annotation instead of rebuilding it per schema
+_ENUM_TYPES: Dict[Tuple[Any, ...], Any] = {}
+
+
+def _enum_type(values: List[Any]) -> Any:
+    """Return the shared Literal annotation for a list of enum values."""
+    key = tuple(values)
+    enum_type = _ENUM_TYPES.get(key)
+    if enum_type is None:
+        enum_type = _ENUM_TYPES[key] = Literal[key]
+    return enum_type
+
+
+def _schema_type(prop: Dict[str, Any]) -> Any:
+    """Translate one JSON schema property into a Python/pydantic type annotation."""
+    if "enum" in prop:
+        return _enum_type(prop["enum"])
+    json_type = prop.get("type")
+    if json_type == "array" and isinstance(prop.get("items"), dict):
+        return List[_schema_type(prop["items"])]
+    if json_type == "object" and isinstance(prop.get("additionalProperties"), dict):
+        return Dict[str, _schema_type(prop["additionalProperties"])]
+    return _JSON_SCHEMA_TYPES.get(json_type, Any)
+
+
+def _build_tool_model(name: str, parameters: Dict[str, Any]) -> type[BaseModel]:
+    """
+    Generate a pydantic model for a tool's parameter schema.
+
+    Required properties become required fields; optional ones default to None
+    and are left out of the validated arguments when not provided, so the
+    executors keep applying their own defaults. Unknown arguments pass through.
+    """
+    required = set(parameters.get("required", []))
+    fields = {}
+    for prop_name, prop in parameters.get("properties", {}).items():
+        field_type = _schema_type(prop)
+        if prop_name in required:
+            fields[prop_name] = (field_type, ...)
+        else:
+            fields[prop_name] = (Optional[field_type], None)
+    return create_model(
+        f"{name}_args",
+        __config__=ConfigDict(extra="allow"),
+        **fields
+    )
 
+
+@dataclass(frozen=True, slots=True)
+class ToolDef:
+    """One tool: its name, description, parameter schema and argument model."""
+    name: str
+    description: str
+    parameters: Dict[str, Any]
+    model: Optional[type[BaseModel]] = None
+
+    def as_openai(self) -> Dict[str, Any]:
+        """Return the tool in OpenAI function calling format."""
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.parameters,
+            },
+        }
+
+
+def _build_tool_defs(tools: List[Dict[str, Any]]) -> Tuple[ToolDef, ...]:
+    """Convert OpenAI-format tool specs into ToolDefs with their argument models."""
+    tool_defs = []
+    for tool in tools:
+        function = tool["function"]
+        name = function["name"]
+        parameters = function.get("parameters", {})
+        try:
+            model = _build_tool_model(name, parameters)
+        except Exception as e:
+            print(f"[tools.py] Warning: Could not build argument model for {name}: {e}")
+            model = None
+        tool_defs.append(ToolDef(
+            name=name,
+            description=function.get("description", ""),
+            parameters=parameters,
+            model=model,
+        ))
+    return tuple(tool_defs)
+
+
+# The tools offered to the LLM. Everything below is derived from these records
+DHANHQ_TOOL_DEFS = _build_tool_defs(_TOOL_SPECS)
+
+# The manifest is fixed for the process lifetime: build it once and serialize it
+# once so LLM requests can splice the JSON in instead of re-encoding it every turn
+DHANHQ_TOOLS = tuple(tool.as_openai() for tool in DHANHQ_TOOL_DEFS)
+DHANHQ_TOOLS_JSON = json.dumps(DHANHQ_TOOLS, separators=(",", ":"))
+
+# Tool name -> ToolDef for O(1) lookups at dispatch time. Legacy names stay
+# resolvable; registry tools take precedence.
+TOOL_INDEX: Dict[str, ToolDef] = {
+    tool.name: tool
+    for tool in (*_build_tool_defs(_LEGACY_DHANHQ_TOOLS), *DHANHQ_TOOL_DEFS)
+}
+
+
+def validate_tool_args(function_name: str, function_args: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    Validate and coerce LLM tool-call arguments with the tool's pydantic model.
+
+    Returns:
+        (arguments, error). On success the arguments are the coerced values
+        (e.g. "13" -> 13 for integer fields) and error is None; on failure the
+        original arguments are returned with an error message. Tools without
+        a model are passed through unchanged.
+    """
+    tool = TOOL_INDEX.get(function_name)
+    model = tool.model if tool else None
+    if model is None:
+        return function_args, None
+    try:
+        validated = model.model_validate(function_args)
+    except ValidationError as e:
+        details = "; ".join(
+            f"{'.'.join(str(part) for part in error['loc']) or 'arguments'}: {error['msg']}"
+            for error in e.errors()
+        )
+        return function_args, f"Invalid arguments for {function_name}: {details}"
+    return validated.model_dump(exclude_unset=True), None
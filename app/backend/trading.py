@@ -2,70 +2,1570 @@
 Trading module for DhanHQ integration
 """
 from dhanhq import dhanhq  # type: ignore
-from typing import Optional, Dict, List, Any, Callable
+from typing import Optional, Dict, List, Any, Callable, Iterable, Set
 import os
 import httpx  # pyright: ignore[reportMissingImports]
 import asyncio
 import json
 import csv
 import io
-from datetime import datetime, timedelta
-from dotenv import load_dotenv  # pyright: ignore[reportMissingImports]
+import re
+import threading
+import time
+import functools
+import hashlib
+import tempfile
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import quote as url_quote, urlencode
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import logging
+from settings import get_dhan_settings, load_env
+from ws.dhan_daemon import FEED_SEGMENT_CODES
+
+load_env()
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 needs the optional h2 package; without it the async client speaks HTTP/1.1
+_HAS_H2 = False
+try:
+    import h2  # noqa: F401
+    _HAS_H2 = True
+except ImportError:
+    pass
+
+# dhanhq 2.1+ builds clients from a DhanContext; 2.0 takes client id and token directly
+_HAS_DHAN_CONTEXT = False
+try:
+    from dhanhq import DhanContext  # type: ignore
+    _HAS_DHAN_CONTEXT = True
+except ImportError:
+    DhanContext = None
+
+# Streaming clients, resolved once. A client is None when this dhanhq release
+# (or one of its dependencies) lacks it; the import error is kept for the
+# message raised by the matching create_* method.
+_DHAN_FEED_ERROR: Optional[Exception] = None
+try:
+    from dhanhq import marketfeed as _marketfeed  # type: ignore
+    DhanFeed = _marketfeed.DhanFeed
+    # Feed request codes: 1/2/3 as the UI sends them, or RequestCode values directly
+    _FEED_CODES = {
+        1: _marketfeed.Ticker,   # Ticker Packet (RequestCode 15)
+        2: _marketfeed.Quote,    # Quote Packet (RequestCode 17)
+        3: _marketfeed.Full,     # Full Packet (RequestCode 21)
+        15: _marketfeed.Ticker,
+        17: _marketfeed.Quote,
+        21: _marketfeed.Full,
+    }
+    _FEED_DEFAULT = _marketfeed.Quote
+    _FEED_EXCHANGES = {0: _marketfeed.IDX, 1: _marketfeed.NSE, 2: _marketfeed.BSE}
+except (ImportError, AttributeError) as e:
+    DhanFeed = None
+    _DHAN_FEED_ERROR = e
+
+_DHAN_ORDER_SOCKET_ERROR: Optional[Exception] = None
+try:
+    from dhanhq.orderupdate import OrderSocket  # type: ignore
+except (ImportError, AttributeError) as e:
+    OrderSocket = None
+    _DHAN_ORDER_SOCKET_ERROR = e
+
+_DHAN_FULL_DEPTH_ERROR: Optional[Exception] = None
+try:
+    try:
+        from dhanhq import FullDepth  # type: ignore
+    except ImportError:
+        from dhanhq.fulldepth import FullDepth  # type: ignore
+except (ImportError, AttributeError) as e:
+    FullDepth = None
+    _DHAN_FULL_DEPTH_ERROR = e
+
+# redis and orjson are optional: without them (or without REDIS_URL) market data
+# is only cached in this process
+_HAS_REDIS = False
+try:
+    import redis  # pyright: ignore[reportMissingImports]
+    _HAS_REDIS = True
+except ImportError:
+    redis = None
+
+_HAS_ORJSON = False
+try:
+    import orjson  # pyright: ignore[reportMissingImports]
+    _HAS_ORJSON = True
+except ImportError:
+    orjson = None
+
+# prometheus_client is optional: without it DhanHQ call metrics are not collected
+_HAS_PROMETHEUS = False
+try:
+    from prometheus_client import Counter, Histogram  # pyright: ignore[reportMissingImports]
+    _HAS_PROMETHEUS = True
+except ImportError:
+    Counter = Histogram = None
+
+DHAN_API_BASE_URL = "https://api.dhan.co/v2"
+# Connection limits for the shared async DhanHQ client
+DHAN_ASYNC_MAX_CONNECTIONS = 100
+DHAN_ASYNC_MAX_KEEPALIVE = 20
+# Seconds an idle pooled connection is kept; longer than httpx's 5s default so
+# polling clients (intraday charts, quotes) don't reconnect between polls
+DHAN_KEEPALIVE_EXPIRY = 30
+
+DHAN_CLIENT_ID_MISSING = "DHAN_CLIENT_ID is not configured in backend environment. Please set it in app/backend/.env file."
+
+# Markers of an authentication failure in a DhanHQ error message
+_AUTH_ERROR_RE = re.compile(r"401|Unauthorized|Invalid")
+
+# Maximum number of per-token DhanHQ clients kept alive (least recently used are dropped)
+DHAN_CLIENT_CACHE_SIZE = int(os.getenv("DHAN_CLIENT_CACHE_SIZE", "64"))
+# Seconds a cached DhanHQ client is reused before it is rebuilt
+DHAN_CLIENT_TTL = 10 * 60
+
+# Keep-alive pool shared by every DhanHQ client, so each request reuses an open
+# TLS connection to api.dhan.co instead of handshaking per client
+DHAN_HTTP_POOL_CONNECTIONS = 20
+DHAN_HTTP_POOL_MAXSIZE = 100
+# Gateway errors worth retrying; urllib3 only retries them for idempotent methods
+DHAN_HTTP_RETRY_STATUSES = (502, 503, 504)
+
+_dhan_http_session: Optional[requests.Session] = None
+_dhan_http_session_lock = threading.Lock()
+
+
+def get_dhan_http_session() -> requests.Session:
+    """Get the process-wide requests.Session used for DhanHQ API calls"""
+    global _dhan_http_session
+    with _dhan_http_session_lock:
+        if _dhan_http_session is None:
+            session = requests.Session()
+            # Connection failures are retried for every method (the request never
+            # reached the server, so an order cannot be duplicated). Read errors and
+            # gateway statuses are retried only for idempotent methods, never for
+            # order POSTs; after the last try the gateway response is returned as-is.
+            adapter = HTTPAdapter(
+                pool_connections=DHAN_HTTP_POOL_CONNECTIONS,
+                pool_maxsize=DHAN_HTTP_POOL_MAXSIZE,
+                max_retries=Retry(
+                    total=2,
+                    backoff_factor=0.1,
+                    status_forcelist=DHAN_HTTP_RETRY_STATUSES,
+                    raise_on_status=False,
+                ),
+            )
+            session.mount("https://", adapter)
+            _dhan_http_session = session
+        return _dhan_http_session
+
+
+def _use_shared_session(dhan: Any) -> Any:
+    """Point a DhanHQ client (or its DhanContext HTTP helper) at the shared session"""
+    session = get_dhan_http_session()
+    for owner in (dhan, getattr(dhan, "dhan_http", None)):
+        if owner is not None and isinstance(getattr(owner, "session", None), requests.Session):
+            owner.session = session
+    return dhan
+
+# Batched order placement: orders sent concurrently per batch, and the pause
+# between batches that keeps bursts under DhanHQ's order rate limit
+ORDER_BATCH_SIZE = 10
+ORDER_BATCH_INTERVAL = 1.0
+
+# Worker threads for blocking DhanHQ SDK calls made from async code
+DHAN_THREAD_POOL_SIZE = 16
+
+# Client-side (requests per second, burst) budgets per DhanHQ endpoint class,
+# kept under the API's limits so calls queue here instead of failing with 429.
+# Bursts do not exceed the per-second rate, which is what DhanHQ enforces.
+DHAN_RATE_LIMITS = {
+    "orders": (10, 10),
+    "quotes": (5, 5),
+    "data": (5, 5),
+    "account": (20, 20),
+}
+# Async endpoints by rate-limit class; any other path is an account read
+DHAN_PATH_LIMITS = {
+    "/marketfeed/ohlc": "quotes",
+    "/optionchain": "data",
+    "/optionchain/expirylist": "data",
+}
+
+# DhanHQ calls slower than this are logged by _wrap_response
+DHAN_SLOW_CALL_SECONDS = 1.0
+
+# Latency buckets (seconds) for the dhan_call_seconds histogram
+DHAN_CALL_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2, 5)
+if _HAS_PROMETHEUS:
+    _dhan_call_seconds = Histogram(
+        "dhan_call_seconds", "DhanHQ call latency", ["method", "success"], buckets=DHAN_CALL_BUCKETS
+    )
+    _dhan_call_errors = Counter(
+        "dhan_call_errors_total", "DhanHQ calls that raised", ["method", "error_class"]
+    )
+
+# Public scrip-master downloads by format, and how many CSV lines the async
+# reader hands to a worker thread at a time
+INSTRUMENT_CSV_URLS = {
+    "compact": "https://images.dhan.co/api-data/api-scrip-master.csv",
+    "detailed": "https://images.dhan.co/api-data/api-scrip-master-detailed.csv",
+}
+INSTRUMENT_CSV_PARSE_BATCH = 5000
+# Seconds parsed scrip-master rows are served before revalidating with the server
+INSTRUMENT_CSV_CACHE_TTL = 60 * 60
+# Parsed scrip masters are also snapshotted to disk so a restart doesn't re-download
+# and re-parse them; snapshots older than INSTRUMENT_SNAPSHOT_MAX_AGE are ignored
+INSTRUMENT_SNAPSHOT_DIR = os.getenv(
+    "INSTRUMENT_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "devagent-instruments")
+)
+INSTRUMENT_SNAPSHOT_MAX_AGE = 24 * 60 * 60
+
+# Concurrent DhanHQ calls allowed per *_many fan-out (the token buckets still pace them)
+DHAN_FANOUT_CONCURRENCY = 20
+
+# Seconds QuoteBatcher waits to merge concurrent quote requests into one call
+QUOTE_BATCH_WINDOW = 0.03
+
+# Seconds that successful market data responses are reused for identical requests
+QUOTE_CACHE_TTL = 2
+
+# Seconds a WebSocket tick stays fresh enough to answer a quote request instead of REST
+LIVE_QUOTE_MAX_AGE = 2
+# Securities quote requests may add to the live feed (DhanHQ caps one connection at 5000)
+LIVE_QUOTE_MAX_SUBSCRIPTIONS = 100
+# Seconds without a quote request after which a security is dropped from the live feed
+LIVE_QUOTE_IDLE_SECONDS = 300
+FUNDS_CACHE_TTL = 30
+OPTION_CHAIN_CACHE_TTL = 5
+# Reference data: the security master changes daily, expiries at most weekly
+SECURITY_LIST_CACHE_TTL = 24 * 60 * 60
+EXPIRY_LIST_CACHE_TTL = 60 * 60
+# Seconds an empty positions/holdings/orders book is trusted before asking again
+EMPTY_BOOK_CACHE_TTL = 5
+
+# Redis cache shared by every backend process; option chains are reused for a
+# second, daily candles until the next session opens at 09:00 IST
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_MAX_CONNECTIONS = 32
+REDIS_SOCKET_TIMEOUT = 0.25
+SHARED_OPTION_CHAIN_TTL = 1
+IST = timezone(timedelta(hours=5, minutes=30))
+SESSION_OPEN_HOUR_IST = 9
+
+# SDK enum attribute names (e.g. "NSE", "INTRA") accepted per order payload field
+DHAN_ORDER_ENUM_NAMES = {
+    "exchange_segment": ("NSE", "BSE", "CUR", "MCX", "FNO", "NSE_FNO", "BSE_FNO", "INDEX"),
+    "transaction_type": ("BUY", "SELL"),
+    "product_type": ("CNC", "INTRA", "MARGIN", "CO", "BO", "MTF"),
+    "order_type": ("LIMIT", "MARKET", "SL", "SLM"),
+    "validity": ("DAY", "IOC"),
+}
+
+# Base exchanges the historical data API takes, matched as segment prefixes in
+# this order, and the IDX_I security ids known to be NSE or BSE indices
+HISTORICAL_EXCHANGES = ("NSE", "BSE", "MCX", "NCDEX")
+NSE_INDEX_SECURITY_IDS = frozenset(str(sec_id) for sec_id in range(13, 21))
+BSE_INDEX_SECURITY_IDS = frozenset(str(sec_id) for sec_id in range(51, 56))
+
+# Interval spellings accepted for daily candles, and minute intervals DhanHQ supports
+DAILY_INTERVALS = frozenset({"daily", "day"})
+INTRADAY_INTERVALS = frozenset({1, 5, 15, 25, 60})
+# Intraday ranges longer than INTRADAY_CHUNK_DAYS are fetched as chunks of that many
+# days (DhanHQ serves at most 90 per call), INTRADAY_CHUNK_CONCURRENCY at a time
+INTRADAY_CHUNK_DAYS = 30
+INTRADAY_CHUNK_CONCURRENCY = 5
+
+# Historical responses over closed date ranges are persisted to SQLite; ranges
+# that include today stay in memory for HISTORICAL_CACHE_TTL seconds
+HISTORICAL_CACHE_PATH = os.getenv(
+    "HISTORICAL_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "historical.sqlite3")
+)
+HISTORICAL_CACHE_SIZE_LIMIT = int(os.getenv("HISTORICAL_CACHE_SIZE_LIMIT", str(10 * 1024 ** 3)))
+HISTORICAL_CACHE_TTL = 15 * 60
+HISTORICAL_CACHE_MAX_ENTRIES = 256
+
+
+def _candles_from_columns(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Turn DhanHQ's columnar chart response ({"open": [...], "close": [...], ...})
+    into one dict per candle. Columns shorter than "open" are padded with None
+    (0 for volume and open interest).
+    """
+    opens = data.get("open", [])
+    count = len(opens)
+
+    def column(name: str, default: Any = None) -> List[Any]:
+        values = list(data.get(name) or [])[:count]
+        return values + [default] * (count - len(values))
+
+    timestamps = column("timestamp")
+    candles = []
+    for timestamp, open_, high, low, close, volume, oi in zip(
+        timestamps, opens, column("high"), column("low"), column("close"),
+        column("volume", 0), column("open_interest", 0)
+    ):
+        iso_time = datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+        candles.append({
+            "timestamp": timestamp,
+            "time": iso_time,
+            "date": iso_time,
+            "open": open_,
+            "high": high,
+            "low": low,
+            "close": close,
+            "volume": volume,
+            "open_interest": oi
+        })
+    return candles
+
+
+def _intraday_date_chunks(from_date: str, to_date: str) -> List[tuple]:
+    """
+    Split an inclusive "YYYY-MM-DD" range into consecutive (from, to) ranges of
+    at most INTRADAY_CHUNK_DAYS days. Unparseable dates come back as one range
+    for DhanHQ to reject.
+    """
+    try:
+        start, end = date.fromisoformat(from_date), date.fromisoformat(to_date)
+    except (TypeError, ValueError):
+        return [(from_date, to_date)]
+    chunks = []
+    while start <= end:
+        chunk_end = min(start + timedelta(days=INTRADAY_CHUNK_DAYS - 1), end)
+        chunks.append((start.isoformat(), chunk_end.isoformat()))
+        start = chunk_end + timedelta(days=1)
+    return chunks or [(from_date, to_date)]
+
+
+def _is_dhan_failure(data: Any) -> bool:
+    """Whether a dhanhq SDK response is one of its {"status": "failure", ...} error payloads"""
+    return isinstance(data, dict) and (data.get("status") == "failure" or "error" in data or "errorCode" in data)
+
+
+def _has_candles(data: Any) -> bool:
+    """Whether a daily-history response (columnar, possibly in an SDK envelope) holds any candles"""
+    if isinstance(data, dict):
+        payload = data.get("data", data)
+        return isinstance(payload, dict) and bool(payload.get("open"))
+    return bool(data)
+
+
+def _first_daily_history(dhan, exchanges: List[Any], pool: ThreadPoolExecutor, **params) -> Any:
+    """
+    Daily candles from the first of exchanges, in order of preference, that
+    has any. The first runs on this thread and uses the caller's rate-limit
+    token, while the rest are requested on pool at the same time. A request
+    the pool has not started by the time it is needed runs here instead, so a
+    busy pool cannot deadlock. If no exchange has candles, the most preferred
+    well-formed (empty) response is returned; if all fail, the last failure
+    payload is returned or the last exception re-raised.
+    """
+    def fetch(exchange: Any, throttle: bool) -> Any:
+        if throttle:
+            _rate_limiters["data"].acquire()
+        return dhan.historical_daily_data(exchange_segment=exchange, **params)
+
+    futures = [pool.submit(fetch, exchange, True) for exchange in exchanges[1:]]
+    empty: Any = None
+    failure: Any = None
+    try:
+        for i, exchange in enumerate(exchanges):
+            try:
+                if i == 0:
+                    data = fetch(exchange, False)
+                else:
+                    future = futures[i - 1]
+                    data = fetch(exchange, True) if future.cancel() else future.result()
+            except Exception as e:
+                failure = e
+                continue
+            if _is_dhan_failure(data):
+                failure = data
+            elif _has_candles(data):
+                return data
+            elif empty is None:
+                empty = data
+    finally:
+        # Requests still queued are dropped; a running one cannot be interrupted
+        for future in futures:
+            future.cancel()
+    if empty is not None:
+        return empty
+    if isinstance(failure, Exception):
+        raise failure
+    return failure
+
+
+def _concat_candle_columns(parts: List[Any]) -> Dict[str, List[Any]]:
+    """
+    Join DhanHQ columnar chart responses end to end. Within each part, columns
+    shorter than "open" are padded with None so rows stay aligned.
+    """
+    merged: Dict[str, List[Any]] = {}
+    for part in parts:
+        if not isinstance(part, dict):
+            continue
+        count = len(part.get("open") or [])
+        for key, values in part.items():
+            if isinstance(values, list):
+                column = merged.setdefault(key, [])
+                column.extend(values[:count])
+                column.extend([None] * (count - len(values)))
+    return merged
+
+
+def _candle_columns(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    DhanHQ's columnar chart response as-is, plus a "time" column of ISO
+    timestamps. Smaller on the wire than _candles_from_columns' rows and
+    already the shape charting libraries bind to.
+    """
+    fromtimestamp = datetime.fromtimestamp
+    columns = dict(data)
+    columns["time"] = [
+        fromtimestamp(timestamp).isoformat() if timestamp else None
+        for timestamp in data.get("timestamp") or []
+    ]
+    return columns
+
+
+def _build_dhan_constants() -> Dict[str, Dict[str, Any]]:
+    """
+    Per order field, map both the SDK's enum attribute names and their wire
+    values (e.g. "NSE_EQ", "INTRADAY") to the value the SDK expects, once at import.
+    """
+    constants = {}
+    for field, names in DHAN_ORDER_ENUM_NAMES.items():
+        allowed = {}
+        for name in names:
+            value = getattr(dhanhq, name, None)
+            if value is not None:
+                allowed[name] = value
+        for value in list(allowed.values()):
+            if isinstance(value, str):
+                allowed.setdefault(value, value)
+        constants[field] = allowed
+    return constants
+
+
+_DHAN_CONST = _build_dhan_constants()
+# SDK constants for the historical data exchanges it defines (e.g. dhanhq.NSE)
+_HISTORICAL_EXCHANGE_CONST = {
+    exchange: getattr(dhanhq, exchange) for exchange in HISTORICAL_EXCHANGES if hasattr(dhanhq, exchange)
+}
+
+
+def _dhan_constant(field: str, name: Any) -> Any:
+    """Translate an order field such as exchange_segment to its DhanHQ constant"""
+    try:
+        return _DHAN_CONST[field][name]
+    except (KeyError, TypeError):
+        raise ValueError(f"Unknown {field}: {name!r}") from None
+
+
+def check_order_enum(field: str, value: Any) -> Any:
+    """Return value if it names a DhanHQ enum of this order field, else raise ValueError (for request models)"""
+    _dhan_constant(field, value)
+    return value
+
+
+@functools.lru_cache(maxsize=256)
+def _order_placer(exchange_segment: str, transaction_type: str, order_type: str, product_type: str):
+    """
+    dhanhq.place_order with the four enum arguments already resolved, shared
+    by every order of the same shape. The partial binds the class function,
+    not a client, so it is called with the client as its first argument.
+    """
+    return functools.partial(
+        dhanhq.place_order,
+        exchange_segment=_dhan_constant("exchange_segment", exchange_segment),
+        transaction_type=_dhan_constant("transaction_type", transaction_type),
+        order_type=_dhan_constant("order_type", order_type),
+        product_type=_dhan_constant("product_type", product_type)
+    )
+
+
+class TTLCache:
+    """
+    Thread-safe LRU mapping whose entries expire ttl seconds after insertion.
+    ttl is a number of seconds or a callable evaluated at each insertion.
+    """
+
+    def __init__(self, maxsize: int, ttl: Any):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Any, value: Any) -> None:
+        with self._lock:
+            ttl = self.ttl() if callable(self.ttl) else self.ttl
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key: Any) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+def _is_cacheable(result: Any) -> bool:
+    """
+    Whether a TradingService result is a success worth caching. The dhanhq SDK
+    reports API errors as {"status": "failure", ...} data rather than raising,
+    and those must not be replayed from a cache.
+    """
+    if not isinstance(result, dict) or not result.get("success"):
+        return False
+    data = result.get("data")
+    return not (isinstance(data, dict) and data.get("status") == "failure")
+
+
+def ttl_cached(cache_attr: str, key: Callable[..., Any], cache_if: Optional[Callable[[Dict[str, Any]], bool]] = None):
+    """
+    Cache successful {"success": True, ...} results of a TradingService method
+    in the TTLCache stored on the instance attribute cache_attr. If cache_if is
+    given, only successful results it accepts are cached.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            cache = getattr(self, cache_attr)
+            try:
+                cache_key = key(*args, **kwargs)
+            except TypeError:
+                # Unhashable arguments: skip the cache rather than fail the call
+                return method(self, *args, **kwargs)
+            result = cache.get(cache_key)
+            if result is not None:
+                return result
+            result = method(self, *args, **kwargs)
+            if _is_cacheable(result) and (cache_if is None or cache_if(result)):
+                cache.set(cache_key, result)
+            return result
+        return wrapper
+    return decorator
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills rate tokens per second up to burst.
+    Callers reserve a token and wait out any deficit, so waiters are served
+    in arrival order at the steady rate.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take one token and return how many seconds to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+_rate_limiters = {kind: TokenBucket(rate, burst) for kind, (rate, burst) in DHAN_RATE_LIMITS.items()}
+
+
+def _throttled(kind: str):
+    """Wait for a token from the kind bucket in _rate_limiters before each call"""
+    bucket = _rate_limiters[kind]
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            bucket.acquire()
+            return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SharedCache:
+    """
+    Redis-backed cache for JSON-serializable market data, shared across
+    processes. Every operation degrades to a cache miss when Redis is not
+    configured or unreachable. An outage is logged once when it starts and
+    once when Redis answers again.
+    """
+
+    def __init__(self, url: Optional[str]):
+        self._client = None
+        self._failing = False
+        if url and _HAS_REDIS:
+            pool = redis.ConnectionPool.from_url(
+                url,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=REDIS_SOCKET_TIMEOUT
+            )
+            self._client = redis.Redis(connection_pool=pool)
+
+    @property
+    def enabled(self) -> bool:
+        return self._client is not None
+
+    def _failed(self, operation: str, key: str, error: Exception) -> None:
+        if not self._failing:
+            self._failing = True
+            logger.warning("Redis %s failed for %s, using in-process caches until it recovers: %s", operation, key, error)
+
+    def _recovered(self) -> None:
+        if self._failing:
+            self._failing = False
+            logger.warning("Redis is reachable again")
+
+    def get(self, key: str) -> Any:
+        if self._client is None:
+            return None
+        try:
+            cached = self._client.get(key)
+        except redis.RedisError as e:
+            self._failed("get", key, e)
+            return None
+        self._recovered()
+        if cached is None:
+            return None
+        return orjson.loads(cached) if _HAS_ORJSON else json.loads(cached)
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        if self._client is None or ttl <= 0:
+            return
+        try:
+            encoded = orjson.dumps(value) if _HAS_ORJSON else json.dumps(value)
+        except TypeError:
+            # Not plain JSON (e.g. a DataFrame): leave it to the in-process caches
+            return
+        try:
+            self._client.set(key, encoded, ex=ttl)
+        except redis.RedisError as e:
+            self._failed("set", key, e)
+            return
+        self._recovered()
+
+
+shared_cache = SharedCache(REDIS_URL)
+
+
+def _seconds_until_session_open() -> int:
+    """Seconds from now until the next 09:00 IST"""
+    now = datetime.now(IST)
+    opens_at = now.replace(hour=SESSION_OPEN_HOUR_IST, minute=0, second=0, microsecond=0)
+    if opens_at <= now:
+        opens_at += timedelta(days=1)
+    return int((opens_at - now).total_seconds())
+
+
+def _until_session_open(ttl: int) -> int:
+    """ttl, cut short so the entry never survives into the next session"""
+    return min(ttl, _seconds_until_session_open())
 
-load_dotenv()
+
+def shared_cached(key: Callable[..., Optional[str]], ttl: Any):
+    """
+    Cache the data of successful TradingService results in shared_cache under
+    the string key(*args, **kwargs); a None key bypasses the cache. ttl is a
+    number of seconds or a callable returning one.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not shared_cache.enabled:
+                return method(self, *args, **kwargs)
+            try:
+                cache_key = key(*args, **kwargs)
+            except TypeError:
+                cache_key = None
+            if cache_key is None:
+                return method(self, *args, **kwargs)
+            data = shared_cache.get(cache_key)
+            if data is not None:
+                return {"success": True, "data": data}
+            result = method(self, *args, **kwargs)
+            if _is_cacheable(result):
+                shared_cache.set(cache_key, result["data"], ttl() if callable(ttl) else ttl)
+            return result
+        return wrapper
+    return decorator
+
+
+def _option_chain_shared_key(access_token: str, under_security_id: int,
+                             under_exchange_segment: str, expiry: str) -> str:
+    return f"opt:{under_security_id}:{under_exchange_segment}:{expiry}"
+
+
+def _is_closed_range(to_date: Any) -> bool:
+    """True when to_date parses and falls before today in IST (its bars can no longer change)"""
+    try:
+        last_day = date.fromisoformat(str(to_date)[:10])
+    except ValueError:
+        return False
+    return last_day < datetime.now(IST).date()
+
+
+def _daily_history_shared_key(access_token: str, security_id: int, exchange_segment: str,
+                              instrument_type: str, from_date: str, to_date: str,
+                              interval: str = "daily", columnar: bool = False) -> Optional[str]:
+    """
+    Shared cache key for a closed daily range. Ranges reaching today (or later)
+    are not shared: today's bar is still forming until the session closes.
+    """
+    if str(interval).strip().lower() not in DAILY_INTERVALS or not _is_closed_range(to_date):
+        return None
+    return f"histd:{security_id}:{exchange_segment}:{instrument_type}:{from_date}:{to_date}"
+
+
+class HistCache:
+    """
+    SQLite-backed store for historical responses over closed date ranges.
+
+    Bars for days that have already closed never change, so these responses
+    survive restarts. Payloads are stored as JSON. Entries are evicted
+    least-recently-used once the total payload size exceeds the size limit.
+    """
+
+    def __init__(self, path: str, size_limit: int):
+        self.path = path
+        self.size_limit = size_limit
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS historical_json ("
+                " key TEXT PRIMARY KEY, payload BLOB NOT NULL,"
+                " size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _key(key: tuple) -> str:
+        return "|".join(key)
+
+    def get(self, key: tuple) -> Optional[Dict[str, Any]]:
+        """Return the cached response for key, or None on a miss or read error."""
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute(
+                    "SELECT payload FROM historical_json WHERE key = ?", (self._key(key),)
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE historical_json SET accessed_at = ? WHERE key = ?",
+                    (time.time(), self._key(key))
+                )
+            return orjson.loads(row[0]) if _HAS_ORJSON else json.loads(row[0])
+        except Exception as e:
+            logger.warning("Historical disk cache read failed: %s", e)
+            return None
+
+    def set(self, key: tuple, response: Dict[str, Any]) -> None:
+        """Store a response and evict least-recently-used entries over the size limit."""
+        try:
+            payload = orjson.dumps(response) if _HAS_ORJSON else json.dumps(response).encode()
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO historical_json (key, payload, size, accessed_at) VALUES (?, ?, ?, ?)",
+                    (self._key(key), payload, len(payload), time.time())
+                )
+                self._evict(conn)
+        except Exception as e:
+            logger.warning("Historical disk cache write failed: %s", e)
+
+    def set_size_limit(self, size_limit: int) -> None:
+        """Change the size limit (bytes), evicting immediately if the cache is over it."""
+        self.size_limit = size_limit
+        try:
+            with self._lock:
+                self._evict(self._connect())
+        except Exception as e:
+            logger.warning("Historical disk cache eviction failed: %s", e)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM historical_json").fetchone()[0]
+        if total <= self.size_limit:
+            return
+        for key, size in conn.execute(
+            "SELECT key, size FROM historical_json ORDER BY accessed_at"
+        ).fetchall():
+            conn.execute("DELETE FROM historical_json WHERE key = ?", (key,))
+            total -= size
+            if total <= self.size_limit:
+                break
+
+
+historical_disk_cache = HistCache(HISTORICAL_CACHE_PATH, HISTORICAL_CACHE_SIZE_LIMIT)
+
+# In-memory historical responses, key -> (inserted_at, response), oldest first
+_historical_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_historical_cache_lock = threading.Lock()
+
+
+def set_cache_size_limit(size_limit: int) -> None:
+    """Set the size limit, in bytes, of the on-disk historical data cache."""
+    historical_disk_cache.set_size_limit(size_limit)
+
+
+def _remember_historical(key: tuple, response: Dict[str, Any]) -> None:
+    """Insert a response into the in-memory historical cache, evicting the oldest entry when full."""
+    with _historical_cache_lock:
+        _historical_cache.pop(key, None)
+        if len(_historical_cache) >= HISTORICAL_CACHE_MAX_ENTRIES:
+            _historical_cache.popitem(last=False)
+        _historical_cache[key] = (time.monotonic(), response)
+
+
+def historical_cached(method):
+    """
+    Serve get_historical_data from the in-memory and on-disk response caches.
+
+    Ranges that end before today are cached indefinitely and persisted to
+    historical_disk_cache; ranges that include today stay in memory and expire
+    after HISTORICAL_CACHE_TTL. Only successful responses are cached.
+    """
+    @functools.wraps(method)
+    def wrapper(self, access_token: str, security_id: Any, exchange_segment: str,
+                instrument_type: str, from_date: str, to_date: str,
+                interval: str = "daily", columnar: bool = False) -> Dict[str, Any]:
+        key = (str(security_id), str(exchange_segment), str(instrument_type), str(from_date),
+               str(to_date), str(interval), "columnar" if columnar else "rows")
+        closed_range = _is_closed_range(to_date)
+
+        with _historical_cache_lock:
+            cached = _historical_cache.get(key)
+        if cached:
+            inserted_at, response = cached
+            if closed_range or time.monotonic() - inserted_at < HISTORICAL_CACHE_TTL:
+                return response
+
+        if closed_range:
+            response = historical_disk_cache.get(key)
+            if response is not None:
+                _remember_historical(key, response)
+                return response
+
+        result = method(self, access_token, security_id, exchange_segment, instrument_type,
+                        from_date, to_date, interval, columnar)
+        if isinstance(result, dict) and result.get("success"):
+            _remember_historical(key, result)
+            if closed_range:
+                historical_disk_cache.set(key, result)
+        return result
+    return wrapper
+
+
+def _wrap_response(method):
+    """
+    Wrap a TradingService method's return value as {"success": True, "data": ...},
+    converting any exception into {"success": False, "error": str(e)}. Failures
+    and calls slower than DHAN_SLOW_CALL_SECONDS are logged, and latencies are
+    recorded in the dhan_call_seconds histogram when prometheus_client is installed.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        started = time.perf_counter()
+        success = "false"
+        try:
+            result = {"success": True, "data": method(self, *args, **kwargs)}
+            success = "true"
+            return result
+        except Exception as e:
+            logger.exception("[%s] DhanHQ call failed: %s", name, e)
+            if _HAS_PROMETHEUS:
+                _dhan_call_errors.labels(name, type(e).__name__).inc()
+            return {"success": False, "error": str(e)}
+        finally:
+            elapsed = time.perf_counter() - started
+            if _HAS_PROMETHEUS:
+                _dhan_call_seconds.labels(name, success).observe(elapsed)
+            if elapsed >= DHAN_SLOW_CALL_SECONDS:
+                logger.warning("[%s] Slow DhanHQ call: %.2fs", name, elapsed)
+    return wrapper
+
+
+def _response_json(response: Any) -> Any:
+    """Decode an httpx response body, with orjson when it is installed"""
+    return orjson.loads(response.content) if _HAS_ORJSON else response.json()
+
+
+def _dhan_envelope(response: Any) -> Dict[str, Any]:
+    """Wrap a raw DhanHQ v2 HTTP response in the SDK's {"status", "remarks", "data"} envelope"""
+    try:
+        payload = _response_json(response)
+    except ValueError as e:
+        return {"status": "failure", "remarks": str(e), "data": ""}
+    if response.status_code == 200:
+        return {"status": "success", "remarks": "", "data": payload}
+    remarks = {}
+    if isinstance(payload, dict):
+        remarks = {
+            "error_code": payload.get("errorCode"),
+            "error_type": payload.get("errorType"),
+            "error_message": payload.get("errorMessage")
+        }
+    return {"status": "failure", "remarks": remarks, "data": payload}
+
+
+def _token_validation_error(error_msg: str) -> Dict[str, Any]:
+    """get_user_profile's failure result, with auth errors given an actionable message"""
+    if _AUTH_ERROR_RE.search(error_msg):
+        return {"success": False, "error": "Invalid or expired access token. Please generate a new token from DhanHQ web portal."}
+    return {"success": False, "error": f"Token validation failed: {error_msg}"}
+
+
+def _token_digest(access_token: str) -> str:
+    """Key client caches by a digest so they don't hold raw access tokens"""
+    return hashlib.blake2b(access_token.encode(), digest_size=16).hexdigest()
+
+
+def _parse_csv_rows(lines: Iterable[str], fieldnames: List[str],
+                    values: Optional[Dict[str, str]] = None) -> List[Dict[str, str]]:
+    """
+    Parse CSV data lines (no header) into row dicts keyed by fieldnames, like
+    csv.DictReader. Equal cell values share one string object through the
+    values memo, so the exchange, segment, instrument type and expiry columns
+    of a 100k-row scrip master cost one string each instead of one per row.
+    Pass the same memo for every batch of one file.
+    """
+    if values is None:
+        values = {}
+    share = values.setdefault
+    width = len(fieldnames)
+    rows = []
+    for row in csv.reader(lines):
+        if not row:
+            continue
+        if len(row) < width:
+            row += [None] * (width - len(row))
+        rows.append(dict(zip(fieldnames, [share(value, value) if value else value for value in row])))
+    return rows
+
+
+def _read_csv_rows(lines: Iterable[str]) -> List[Dict[str, str]]:
+    """Parse CSV lines whose first line is the header (see _parse_csv_rows)"""
+    lines = iter(lines)
+    fieldnames = next(csv.reader([next(lines, "")]), [])
+    return _parse_csv_rows(lines, fieldnames) if fieldnames else []
+
+
+def _instrument_snapshot_path(format_type: str) -> str:
+    return os.path.join(INSTRUMENT_SNAPSHOT_DIR, f"scrip-master-{format_type}.json")
+
+
+def _write_instrument_snapshot(format_type: str, etag: Optional[str],
+                               instruments: List[Dict[str, str]]) -> None:
+    """
+    Save parsed scrip-master rows column-header-once (a fieldnames list plus one
+    value list per row), replacing any previous snapshot atomically
+    """
+    snapshot = {
+        "etag": etag,
+        "fieldnames": list(instruments[0]) if instruments else [],
+        "rows": [list(row.values()) for row in instruments],
+    }
+    path = _instrument_snapshot_path(format_type)
+    temp_path = None
+    try:
+        os.makedirs(INSTRUMENT_SNAPSHOT_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile("wb", dir=INSTRUMENT_SNAPSHOT_DIR, delete=False) as f:
+            temp_path = f.name
+            f.write(orjson.dumps(snapshot) if _HAS_ORJSON else json.dumps(snapshot).encode())
+        os.replace(temp_path, path)
+    except Exception as e:
+        logger.warning("Could not write instrument snapshot %s: %s", path, e)
+        if temp_path is not None:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+
+
+def _read_instrument_snapshot(format_type: str) -> Optional[tuple]:
+    """
+    (age_seconds, etag, rows) from the disk snapshot for format_type, or None
+    if there is no usable snapshot younger than INSTRUMENT_SNAPSHOT_MAX_AGE
+    """
+    path = _instrument_snapshot_path(format_type)
+    try:
+        age = time.time() - os.path.getmtime(path)
+        if age >= INSTRUMENT_SNAPSHOT_MAX_AGE:
+            return None
+        with open(path, "rb") as f:
+            raw = f.read()
+        snapshot = orjson.loads(raw) if _HAS_ORJSON else json.loads(raw)
+        fieldnames = snapshot["fieldnames"]
+        values: Dict[str, str] = {}
+        share = values.setdefault
+        rows = [
+            dict(zip(fieldnames, [share(value, value) if value else value for value in row]))
+            for row in snapshot["rows"]
+        ]
+        return age, snapshot.get("etag"), rows
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning("Ignoring unreadable instrument snapshot %s: %s", path, e)
+        return None
+
+
+def _touch_instrument_snapshot(format_type: str) -> None:
+    """Mark the snapshot as current after the server confirmed it is unchanged"""
+    try:
+        os.utime(_instrument_snapshot_path(format_type))
+    except OSError:
+        pass
+
+
+def _is_empty_book(result: Dict[str, Any]) -> bool:
+    """Whether a wrapped DhanHQ list response ({"status", "data": [...]}) has no rows"""
+    data = result.get("data")
+    if isinstance(data, dict):
+        data = data.get("data")
+    return isinstance(data, list) and not data
+
+
+def _live_quote_entry(tick: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    A feed tick in the /marketfeed/ohlc entry shape ({"last_price", "ohlc"}),
+    or None if it carries no price. The feed sends prices as strings.
+    """
+    try:
+        entry: Dict[str, Any] = {"last_price": float(tick["LTP"])}
+        if "open" in tick:
+            entry["ohlc"] = {field: float(tick[field]) for field in ("open", "close", "high", "low")}
+    except (KeyError, TypeError, ValueError):
+        return None
+    return entry
+
+
+def _merge_live_quotes(result: Dict[str, Any], live: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Add feed quotes to a /marketfeed/ohlc result (data -> data -> {segment:
+    {security_id: quote}}) without touching the cached one
+    """
+    envelope = result.get("data")
+    if not live or not result.get("success") or not isinstance(envelope, dict):
+        return result
+    body = envelope.get("data")
+    quotes = body.get("data") if isinstance(body, dict) else None
+    if not isinstance(quotes, dict):
+        return result
+    merged = {segment: dict(entries) for segment, entries in quotes.items()}
+    for segment, entries in live.items():
+        merged.setdefault(segment, {}).update(entries)
+    return {**result, "data": {**envelope, "data": {**body, "data": merged}}}
+
+
+def _quote_cache_key(access_token: str, securities: Dict[str, List[int]]):
+    return _token_digest(access_token), tuple(sorted(
+        (segment, tuple(sorted(str(sec_id) for sec_id in sec_ids)))
+        for segment, sec_ids in securities.items()
+    ))
 
 class TradingService:
     """Service for managing DhanHQ trading operations"""
 
     def __init__(self):
-        self.client_id = os.getenv("DHAN_CLIENT_ID")
-        self.app_id = os.getenv("DHAN_APP_ID")
-        self.app_secret = os.getenv("DHAN_APP_SECRET")
-        self.dhan = None
-
-    def get_dhan_instance(self, access_token: str):
-        """Get or create DhanHQ instance with access token"""
+        settings = get_dhan_settings()
+        self.client_id = settings.client_id
+        self.app_id = settings.app_id
+        self.app_secret = settings.app_secret
+        if not self.client_id:
+            # Trading endpoints will fail until it is set; the rest of the app still runs
+            print(f"Warning: {DHAN_CLIENT_ID_MISSING}")
+        # DhanHQ clients keyed by access token (LRU, shared across request threads)
+        self._dhan_cache = TTLCache(maxsize=DHAN_CLIENT_CACHE_SIZE, ttl=DHAN_CLIENT_TTL)
+        self._dhan_cache_lock = threading.RLock()
+        # Short-lived response caches for data the LLM tool loop re-requests within a turn
+        self._quote_cache = TTLCache(maxsize=1024, ttl=QUOTE_CACHE_TTL)
+        self._funds_cache = TTLCache(maxsize=DHAN_CLIENT_CACHE_SIZE, ttl=FUNDS_CACHE_TTL)
+        self._chain_cache = TTLCache(maxsize=256, ttl=OPTION_CHAIN_CACHE_TTL)
+        # Shared non-blocking client for DhanHQ reads (created on first use)
+        self._async_client: Optional[httpx.AsyncClient] = None
+        # Async reads currently in flight, so identical concurrent requests share one call
+        self._inflight: Dict[Any, "asyncio.Future[Dict[str, Any]]"] = {}
+        # Sync counterpart for the plain account reads (created on first use)
+        self._http_client: Optional[httpx.Client] = None
+        # Blocking SDK calls from async code run here rather than on the loop's default executor
+        self._pool = ThreadPoolExecutor(max_workers=DHAN_THREAD_POOL_SIZE, thread_name_prefix="dhan")
+        # Reference data is refreshed by the first request of each session
+        self._security_list_cache = TTLCache(maxsize=2, ttl=lambda: _until_session_open(SECURITY_LIST_CACHE_TTL))
+        self._expiry_cache = TTLCache(maxsize=1024, ttl=lambda: _until_session_open(EXPIRY_LIST_CACHE_TTL))
+        # Parsed scrip-master CSVs: format_type -> (fresh_until, etag, rows)
+        self._instrument_csv_cache: Dict[str, Any] = {}
+        self._instrument_snapshot_checked: set = set()
+        # Accounts whose positions/holdings/orders came back empty moments ago
+        self._empty_book_cache = TTLCache(maxsize=3 * DHAN_CLIENT_CACHE_SIZE, ttl=EMPTY_BOOK_CACHE_TTL)
+        # Tick cache and subscriptions of the market-data daemon, when one is running
+        self._live_quotes = None
+        self._live_subscriptions = None
+        # "SEG:sid" -> monotonic time of the last quote request, for idle unsubscribes
+        self._live_requested: Dict[str, float] = {}
+
+    def use_live_quotes(self, cache, subscriptions) -> None:
+        """
+        Answer quote requests from the market-data daemon's ticks; securities
+        without a fresh tick go to REST and are subscribed for next time
+        """
+        self._live_quotes = cache
+        self._live_subscriptions = subscriptions
+
+    def _split_live_quotes(self, securities: Dict[str, List[int]]):
+        """(feed quotes by segment, securities still needing the REST call)"""
+        live: Dict[str, Dict[str, Any]] = {}
+        missing: Dict[str, List[int]] = {}
+        now = time.monotonic()
+        self._drop_idle_live_quotes(now)
+        subscribed = set(self._live_subscriptions.keys())
+        for segment, sec_ids in securities.items():
+            for sec_id in sec_ids:
+                key = f"{segment}:{sec_id}"
+                if key in subscribed:
+                    self._live_requested[key] = now
+                tick = self._live_quotes.get(key, max_age=LIVE_QUOTE_MAX_AGE)
+                entry = _live_quote_entry(tick) if tick is not None else None
+                if entry is not None:
+                    live.setdefault(segment, {})[str(sec_id)] = entry
+                    continue
+                missing.setdefault(segment, []).append(sec_id)
+                if (key not in subscribed and segment in FEED_SEGMENT_CODES
+                        and len(subscribed) < LIVE_QUOTE_MAX_SUBSCRIPTIONS):
+                    self._live_subscriptions.add(segment, str(sec_id))
+                    self._live_requested[key] = now
+                    subscribed.add(key)
+        return live, missing
+
+    def _drop_idle_live_quotes(self, now: float) -> None:
+        """Unsubscribe securities nobody has asked a quote for in LIVE_QUOTE_IDLE_SECONDS"""
+        idle = [key for key, requested_at in self._live_requested.items() if now - requested_at > LIVE_QUOTE_IDLE_SECONDS]
+        for key in idle:
+            del self._live_requested[key]
+            segment, _, sec_id = key.partition(":")
+            self._live_subscriptions.remove(segment, sec_id)
+
+    def _forget_empty_books(self, access_token: str) -> None:
+        """Drop cached empty books for an account after it trades"""
+        for book in ("positions", "holdings", "orders"):
+            self._empty_book_cache.discard((book, _token_digest(access_token)))
+
+    def get_dhan_instance(self, access_token: str, use_context: bool = False):
+        """
+        Get or create DhanHQ instance with access token. With use_context, the
+        client is built from a DhanContext (dhanhq 2.1+).
+        """
+        # The dhanhq library doesn't expose access_token for comparison, so clients
+        # are keyed by the token they were built with; a new token gets a new client
+        cache_key = (_token_digest(access_token), use_context)
+        with self._dhan_cache_lock:
+            dhan = self._dhan_cache.get(cache_key)
+            if dhan is not None:
+                return dhan
+
+            # Only reachable on a cache miss: no client is ever cached without a client id
+            if not self.client_id:
+                raise ValueError(DHAN_CLIENT_ID_MISSING)
+            if use_context:
+                dhan = dhanhq(DhanContext(self.client_id, access_token))
+            else:
+                dhan = dhanhq(self.client_id, access_token)
+            dhan = _use_shared_session(dhan)
+            self._dhan_cache.set(cache_key, dhan)
+            return dhan
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Get the pooled httpx.AsyncClient used for non-blocking DhanHQ reads"""
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=DHAN_ASYNC_MAX_CONNECTIONS,
+                    max_keepalive_connections=DHAN_ASYNC_MAX_KEEPALIVE,
+                    keepalive_expiry=DHAN_KEEPALIVE_EXPIRY
+                ),
+                timeout=60.0,
+                http2=_HAS_H2
+            )
+        return self._async_client
+
+    def _get_http_client(self) -> httpx.Client:
+        """Get the pooled httpx.Client (HTTP/2 when h2 is installed) used for sync DhanHQ reads"""
+        if self._http_client is None:
+            with self._dhan_cache_lock:
+                if self._http_client is None:
+                    self._http_client = httpx.Client(
+                        limits=httpx.Limits(
+                            max_connections=DHAN_HTTP_POOL_CONNECTIONS,
+                            max_keepalive_connections=DHAN_HTTP_POOL_CONNECTIONS,
+                            keepalive_expiry=DHAN_KEEPALIVE_EXPIRY
+                        ),
+                        timeout=60.0,
+                        http2=_HAS_H2
+                    )
+        return self._http_client
+
+    async def run_blocking(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking DhanHQ call on the service's thread pool without blocking the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+
+    async def aclose(self) -> None:
+        """Close the DhanHQ HTTP clients and the blocking-call pool"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
+        self._pool.shutdown(wait=False)
+
+    def _dhan_headers(self, access_token: str) -> Dict[str, str]:
         if not self.client_id:
-            raise ValueError("DHAN_CLIENT_ID is not configured in backend environment. Please set it in app/backend/.env file.")
-        # Always create a new instance to ensure correct access token
-        # The dhanhq library doesn't expose access_token for comparison
-        return dhanhq(self.client_id, access_token)
+            raise ValueError(DHAN_CLIENT_ID_MISSING)
+        return {
+            "access-token": access_token,
+            "client-id": self.client_id,
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        }
+
+    def _dhan_request(self, access_token: str, path: str) -> Dict[str, Any]:
+        """
+        GET a DhanHQ v2 endpoint over the pooled httpx client, bypassing the
+        SDK's per-request HTTP/1.1 transport. Callers throttle via @_throttled.
 
-    def authenticate_with_pin(self, pin: str, totp: str) -> Dict[str, Any]:
-        """Authenticate using PIN and TOTP - requires external API call"""
+        Returns the same {"status", "remarks", "data"} envelope as the dhanhq SDK.
+        """
+        response = self._get_http_client().get(f"{DHAN_API_BASE_URL}{path}", headers=self._dhan_headers(access_token))
+        return _dhan_envelope(response)
+
+    async def _dhan_request_async(self, access_token: str, path: str,
+                                  payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Call a DhanHQ v2 endpoint without tying up a worker thread: GET, or POST
+        with a JSON body when payload is given.
+
+        Returns the same {"status", "remarks", "data"} envelope as the dhanhq SDK.
+        """
+        headers = self._dhan_headers(access_token)
+        client = self._get_async_client()
+        url = f"{DHAN_API_BASE_URL}{path}"
+        await _rate_limiters[DHAN_PATH_LIMITS.get(path, "account")].acquire_async()
+        if payload is None:
+            response = await client.get(url, headers=headers)
+        else:
+            response = await client.post(url, headers=headers, json=payload)
+        return _dhan_envelope(response)
+
+    async def _single_flight(self, flight_key: Any, call: Callable[[], Any]) -> Dict[str, Any]:
+        """
+        Await call() unless an identical call (same flight_key) is already in
+        flight, in which case wait for and share its outcome instead: its
+        result, or the exception it raised. If that call is cancelled, one of
+        its waiters makes the call again for the rest.
+        """
+        while True:
+            pending = self._inflight.get(flight_key)
+            if pending is None:
+                break
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    # This caller was cancelled, not the call it was waiting on
+                    raise
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[flight_key] = future
         try:
-            # PIN/TOTP authentication requires calling DhanHQ API directly
-            # This is not available in the dhanhq library v2.0.2
-            # Users should generate tokens via DhanHQ web portal
-            return {
-                "success": False,
-                "error": "PIN/TOTP authentication not available in this version. Please generate access token from DhanHQ web portal."
-            }
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark it retrieved so an unwaited future does not log "never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[flight_key]
+
+    async def _get_cached_async(self, cache: TTLCache, cache_key: Any, path: str, access_token: str,
+                                cache_if: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                                payload: Optional[Dict[str, Any]] = None,
+                                shared_key: Optional[str] = None, shared_ttl: int = 0) -> Dict[str, Any]:
+        """
+        Async counterpart of a ttl_cached, _wrap_response method reading one
+        endpoint. With shared_key, the result is also looked up in and stored
+        to shared_cache for shared_ttl seconds. Concurrent misses for the same
+        cache_key share one request.
+        """
+        result = cache.get(cache_key)
+        if result is not None:
+            return result
+        return await self._single_flight((path, cache_key), functools.partial(
+            self._fetch_cached_async, cache, cache_key, path, access_token, cache_if, payload, shared_key, shared_ttl
+        ))
+
+    async def _fetch_cached_async(self, cache: TTLCache, cache_key: Any, path: str, access_token: str,
+                                  cache_if: Optional[Callable[[Dict[str, Any]], bool]],
+                                  payload: Optional[Dict[str, Any]],
+                                  shared_key: Optional[str], shared_ttl: int) -> Dict[str, Any]:
+        use_shared = shared_key is not None and shared_cache.enabled
+        if use_shared:
+            data = await asyncio.to_thread(shared_cache.get, shared_key)
+            if data is not None:
+                result = {"success": True, "data": data}
+                cache.set(cache_key, result)
+                return result
+        try:
+            result = {"success": True, "data": await self._dhan_request_async(access_token, path, payload)}
         except Exception as e:
             return {"success": False, "error": str(e)}
+        if _is_cacheable(result) and (cache_if is None or cache_if(result)):
+            cache.set(cache_key, result)
+        if use_shared and _is_cacheable(result):
+            await asyncio.to_thread(shared_cache.set, shared_key, result["data"], shared_ttl)
+        return result
+
+    async def get_positions_async(self, access_token: str) -> Dict[str, Any]:
+        """Get current positions without blocking a thread"""
+        return await self._get_cached_async(
+            self._empty_book_cache, ("positions", _token_digest(access_token)), "/positions", access_token, _is_empty_book
+        )
+
+    async def get_holdings_async(self, access_token: str) -> Dict[str, Any]:
+        """Get current holdings without blocking a thread"""
+        return await self._get_cached_async(
+            self._empty_book_cache, ("holdings", _token_digest(access_token)), "/holdings", access_token, _is_empty_book
+        )
+
+    async def get_orders_async(self, access_token: str) -> Dict[str, Any]:
+        """Get all orders without blocking a thread"""
+        return await self._get_cached_async(
+            self._empty_book_cache, ("orders", _token_digest(access_token)), "/orders", access_token, _is_empty_book
+        )
+
+    async def get_fund_limits_async(self, access_token: str) -> Dict[str, Any]:
+        """Get fund limits and margin details without blocking a thread"""
+        return await self._get_cached_async(self._funds_cache, _token_digest(access_token), "/fundlimit", access_token)
+
+    async def get_trades_async(self, access_token: str) -> Dict[str, Any]:
+        """
+        Get all trades executed today without blocking a thread. The trade book
+        is not cached, but concurrent requests for one account share one call.
+        """
+        async def fetch() -> Dict[str, Any]:
+            try:
+                return {"success": True, "data": await self._dhan_request_async(access_token, "/trades")}
+            except Exception as e:
+                return {"success": False, "error": str(e)}
 
-    def authenticate_oauth(self, app_id: str, app_secret: str) -> Dict[str, Any]:
-        """Generate OAuth consent URL - requires external API call"""
+        return await self._single_flight(("/trades", _token_digest(access_token)), fetch)
+
+    async def get_market_quote_async(self, access_token: str, securities: Dict[str, List[int]]) -> Dict[str, Any]:
+        """
+        Get market quote (OHLC) data without blocking a thread. With live
+        quotes enabled, securities with a fresh feed tick skip the REST call.
+        """
         try:
-            # OAuth requires calling DhanHQ API directly
-            # This is not available in the dhanhq library v2.0.2
-            return {
-                "success": False,
-                "error": "OAuth authentication not available in this version. Please generate access token from DhanHQ web portal."
+            # ohlc expects integer security IDs
+            payload = {
+                exchange_seg: [int(sec_id) if isinstance(sec_id, str) else sec_id for sec_id in sec_ids]
+                for exchange_seg, sec_ids in securities.items()
             }
-        except Exception as e:
+        except (TypeError, ValueError) as e:
             return {"success": False, "error": str(e)}
+        live: Dict[str, Dict[str, Any]] = {}
+        if self._live_quotes is not None:
+            live, payload = self._split_live_quotes(payload)
+            if not payload:
+                return {"success": True, "data": {
+                    "status": "success", "remarks": "", "data": {"data": live, "status": "success"}
+                }}
+        cache_key = _quote_cache_key(access_token, payload)
+        result = await self._get_cached_async(self._quote_cache, cache_key, "/marketfeed/ohlc", access_token, payload=payload)
+        return _merge_live_quotes(result, live)
+
+    async def get_option_chain_async(self, access_token: str, under_security_id: int,
+                                     under_exchange_segment: str, expiry: str) -> Dict[str, Any]:
+        """Get option chain data without blocking a thread"""
+        return await self._get_cached_async(
+            self._chain_cache,
+            (_token_digest(access_token), str(under_security_id), under_exchange_segment, expiry),
+            "/optionchain",
+            access_token,
+            payload={
+                "UnderlyingScrip": under_security_id,
+                "UnderlyingSeg": under_exchange_segment,
+                "Expiry": expiry
+            },
+            shared_key=_option_chain_shared_key(access_token, under_security_id, under_exchange_segment, expiry),
+            shared_ttl=SHARED_OPTION_CHAIN_TTL
+        )
+
+    async def get_expiry_list_async(self, access_token: str, under_security_id: int,
+                                    under_exchange_segment: str) -> Dict[str, Any]:
+        """Get expiry list for an underlying without blocking a thread"""
+        return await self._get_cached_async(
+            self._expiry_cache,
+            (str(under_security_id), under_exchange_segment),
+            "/optionchain/expirylist",
+            access_token,
+            payload={
+                "UnderlyingScrip": under_security_id,
+                "UnderlyingSeg": under_exchange_segment
+            }
+        )
 
-    def consume_token_id(self, token_id: str, app_id: str, app_secret: str) -> Dict[str, Any]:
-        """Consume token ID from OAuth redirect - requires external API call"""
+    async def get_security_list_async(self, access_token: str, format_type: str = "compact") -> Dict[str, Any]:
+        """
+        Get security/instrument list in a worker thread; concurrent requests for
+        the same format share one download.
+        """
+        return await self._single_flight(
+            ("security_list", format_type),
+            functools.partial(self.run_blocking, self.get_security_list, access_token, format_type)
+        )
+
+    async def _gather_limited(self, calls: List[Callable[[], Any]],
+                              limit: int = DHAN_FANOUT_CONCURRENCY) -> List[Dict[str, Any]]:
+        """
+        Await every coroutine factory in calls concurrently, at most limit at
+        a time. Results keep the order of calls; exceptions become
+        {"success": False, "error": ...} entries.
+        """
+        semaphore = asyncio.Semaphore(limit)
+
+        async def run(call):
+            async with semaphore:
+                try:
+                    return await call()
+                except Exception as e:
+                    return {"success": False, "error": str(e)}
+
+        return list(await asyncio.gather(*(run(call) for call in calls)))
+
+    async def get_market_quote_many(self, access_token: str,
+                                    securities_list: List[Dict[str, List[int]]]) -> List[Dict[str, Any]]:
+        """Get market quotes for several securities maps concurrently, one result per map"""
+        return await self._gather_limited([
+            functools.partial(self.get_market_quote_async, access_token, securities)
+            for securities in securities_list
+        ])
+
+    async def get_option_chain_many(self, access_token: str,
+                                    chains: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Get several option chains concurrently. Each entry of chains holds
+        under_security_id, under_exchange_segment and expiry.
+        """
+        return await self._gather_limited([
+            functools.partial(self.get_option_chain_async, access_token, **chain)
+            for chain in chains
+        ])
+
+    async def get_historical_data_many(self, access_token: str,
+                                       requests_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Get historical data for several securities concurrently. Each entry of
+        requests_list holds get_historical_data's keyword arguments (security_id,
+        exchange_segment, instrument_type, from_date, to_date and optional interval).
+        """
+        return await self._gather_limited([
+            functools.partial(self.run_blocking, self.get_historical_data, access_token, **request)
+            for request in requests_list
+        ])
+
+    def prewarm(self, access_token: str) -> Dict[str, Any]:
+        """
+        Build the token's DhanHQ client and open its API connection ahead of
+        the first tool call. Fund limits are fetched because the call is cheap
+        and its result lands in the funds cache.
+        """
         try:
-            # Token consumption requires calling DhanHQ API directly
-            return {
-                "success": False,
-                "error": "OAuth token consumption not available in this version. Please generate access token from DhanHQ web portal."
-            }
-        except Exception as e:
+            self.get_dhan_instance(access_token)
+        except ValueError as e:
             return {"success": False, "error": str(e)}
+        result = self.get_fund_limits(access_token)
+        if not result.get("success"):
+            logger.warning("DhanHQ prewarm failed: %s", result.get("error", "Unknown error"))
+        return result
+
+    def authenticate_with_pin(self, pin: str, totp: str) -> Dict[str, Any]:
+        """Authenticate using PIN and TOTP - requires external API call"""
+        # PIN/TOTP authentication requires calling DhanHQ API directly
+        # This is not available in the dhanhq library v2.0.2
+        # Users should generate tokens via DhanHQ web portal
+        return {
+            "success": False,
+            "error": "PIN/TOTP authentication not available in this version. Please generate access token from DhanHQ web portal."
+        }
+
+    def authenticate_oauth(self, app_id: str, app_secret: str) -> Dict[str, Any]:
+        """Generate OAuth consent URL - requires external API call"""
+        # OAuth requires calling DhanHQ API directly
+        # This is not available in the dhanhq library v2.0.2
+        return {
+            "success": False,
+            "error": "OAuth authentication not available in this version. Please generate access token from DhanHQ web portal."
+        }
+
+    def consume_token_id(self, token_id: str, app_id: str, app_secret: str) -> Dict[str, Any]:
+        """Consume token ID from OAuth redirect - requires external API call"""
+        # Token consumption requires calling DhanHQ API directly
+        return {
+            "success": False,
+            "error": "OAuth token consumption not available in this version. Please generate access token from DhanHQ web portal."
+        }
 
     def get_user_profile(self, access_token: str) -> Dict[str, Any]:
         """Get user profile information by validating token"""
@@ -73,10 +1573,15 @@ class TradingService:
             if not self.client_id:
                 return {"success": False, "error": "DHAN_CLIENT_ID not configured in backend"}
 
-            # Validate token by creating a dhanhq instance and making a simple API call
-            dhan = self.get_dhan_instance(access_token)
-            # Try to get fund limits as a way to validate the token
-            funds = dhan.get_fund_limits()
+            # Validate the token with a fund-limits call. Successful results are
+            # cached for FUNDS_CACHE_TTL, so page-by-page profile checks are free
+            funds = self.get_fund_limits(access_token)
+            envelope = funds.get("data")
+            if not funds.get("success"):
+                return _token_validation_error(funds.get("error", "Unknown error"))
+            if isinstance(envelope, dict) and envelope.get("status") == "failure":
+                # DhanHQ reports rejected tokens in the envelope rather than raising
+                return _token_validation_error(str(envelope.get("remarks") or envelope.get("data")))
             return {
                 "success": True,
                 "data": {
@@ -88,166 +1593,258 @@ class TradingService:
             # This is likely a configuration error
             return {"success": False, "error": str(e)}
         except Exception as e:
-            # Log the full error for debugging
-            error_msg = str(e)
-            # Check if it's an API error from DhanHQ
-            if "401" in error_msg or "Unauthorized" in error_msg or "Invalid" in error_msg:
-                return {"success": False, "error": "Invalid or expired access token. Please generate a new token from DhanHQ web portal."}
-            return {"success": False, "error": f"Token validation failed: {error_msg}"}
+            return _token_validation_error(str(e))
 
+    @_wrap_response
+    @_throttled("orders")
     def place_order(self, access_token: str, order_data: Dict[str, Any]) -> Dict[str, Any]:
         """Place a trading order"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-
-            result = dhan.place_order(
-                security_id=order_data["security_id"],
-                exchange_segment=getattr(dhan, order_data["exchange_segment"]),
-                transaction_type=getattr(dhan, order_data["transaction_type"]),
-                quantity=order_data["quantity"],
-                order_type=getattr(dhan, order_data["order_type"]),
-                product_type=getattr(dhan, order_data["product_type"]),
-                price=order_data.get("price", 0),
-                trigger_price=order_data.get("trigger_price", 0),
-                disclosed_quantity=order_data.get("disclosed_quantity", 0),
-                validity=order_data.get("validity", "DAY")
-            )
-            return {"success": True, "data": result}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        # Unknown enum values fail here, before a client is built or cached books are dropped
+        place = _order_placer(
+            order_data["exchange_segment"],
+            order_data["transaction_type"],
+            order_data["order_type"],
+            order_data["product_type"]
+        )
+        dhan = self.get_dhan_instance(access_token)
+        self._forget_empty_books(access_token)
+        return place(
+            dhan,
+            security_id=order_data["security_id"],
+            quantity=order_data["quantity"],
+            price=order_data.get("price", 0),
+            trigger_price=order_data.get("trigger_price", 0),
+            disclosed_quantity=order_data.get("disclosed_quantity", 0),
+            validity=order_data.get("validity", "DAY")
+        )
+
+    def place_orders(self, access_token: str, orders: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Place several orders, ORDER_BATCH_SIZE at a time in parallel.
 
+        BUY orders are sent before SELL orders, and batches are spaced by
+        ORDER_BATCH_INTERVAL seconds. Results are returned in the order of
+        the input list, one place_order-style result per order.
+        """
+        if not orders:
+            return {"success": False, "error": "No orders to place"}
+
+        # Stable sort: BUY legs first, otherwise in the caller's order
+        sequence = sorted(
+            range(len(orders)),
+            key=lambda i: str(orders[i].get("transaction_type", "")).upper() != "BUY"
+        )
+        results: List[Optional[Dict[str, Any]]] = [None] * len(orders)
+        with ThreadPoolExecutor(max_workers=ORDER_BATCH_SIZE) as executor:
+            for start in range(0, len(sequence), ORDER_BATCH_SIZE):
+                if start:
+                    time.sleep(ORDER_BATCH_INTERVAL)
+                batch = sequence[start:start + ORDER_BATCH_SIZE]
+                placed = executor.map(lambda i: self.place_order(access_token, orders[i]), batch)
+                for i, result in zip(batch, placed):
+                    results[i] = result
+
+        failed = sum(1 for result in results if not result.get("success"))
+        return {
+            "success": failed < len(orders),
+            "data": {
+                "results": results,
+                "placed": len(orders) - failed,
+                "failed": failed
+            }
+        }
+
+    @ttl_cached("_empty_book_cache", key=lambda access_token: ("orders", _token_digest(access_token)),
+                cache_if=_is_empty_book)
+    @_wrap_response
+    @_throttled("account")
     def get_orders(self, access_token: str) -> Dict[str, Any]:
         """Get all orders"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            orders = dhan.get_order_list()
-            return {"success": True, "data": orders}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        return self._dhan_request(access_token, "/orders")
 
+    @_wrap_response
+    @_throttled("account")
     def get_order_by_id(self, access_token: str, order_id: str) -> Dict[str, Any]:
         """Get order by ID"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            order = dhan.get_order_by_id(order_id)
-            return {"success": True, "data": order}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        return self._dhan_request(access_token, f"/orders/{url_quote(str(order_id), safe='')}")
 
+    @_wrap_response
+    @_throttled("orders")
     def cancel_order(self, access_token: str, order_id: str) -> Dict[str, Any]:
         """Cancel an order"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            result = dhan.cancel_order(order_id)
-            return {"success": True, "data": result}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        dhan = self.get_dhan_instance(access_token)
+        self._forget_empty_books(access_token)
+        return dhan.cancel_order(order_id)
 
+    async def cancel_orders(self, access_token: str, order_ids: List[str]) -> Dict[str, Any]:
+        """
+        Cancel several orders concurrently, ORDER_BATCH_SIZE in flight at a time;
+        the "orders" token bucket keeps the burst within DhanHQ's rate limit.
+        Results are returned in the order of order_ids, one cancel_order-style
+        result per order.
+        """
+        if not order_ids:
+            return {"success": False, "error": "No orders to cancel"}
+
+        results = await self._gather_limited([
+            functools.partial(self.run_blocking, self.cancel_order, access_token, order_id)
+            for order_id in order_ids
+        ], limit=ORDER_BATCH_SIZE)
+        failed = sum(1 for result in results if not result.get("success"))
+        return {
+            "success": failed < len(order_ids),
+            "data": {
+                "results": results,
+                "cancelled": len(order_ids) - failed,
+                "failed": failed
+            }
+        }
+
+    @_wrap_response
+    @_throttled("orders")
     def modify_order(self, access_token: str, order_id: str, order_data: Dict[str, Any]) -> Dict[str, Any]:
         """Modify an order"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            result = dhan.modify_order(
-                order_id,
-                order_data.get("order_type"),
-                order_data.get("leg_name"),
-                order_data.get("quantity"),
-                order_data.get("price"),
-                order_data.get("trigger_price"),
-                order_data.get("disclosed_quantity"),
-                order_data.get("validity")
-            )
-            return {"success": True, "data": result}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-
+        dhan = self.get_dhan_instance(access_token)
+        self._forget_empty_books(access_token)
+        return dhan.modify_order(
+            order_id,
+            order_data.get("order_type"),
+            order_data.get("leg_name"),
+            order_data.get("quantity"),
+            order_data.get("price"),
+            order_data.get("trigger_price"),
+            order_data.get("disclosed_quantity"),
+            order_data.get("validity")
+        )
+
+    @ttl_cached("_empty_book_cache", key=lambda access_token: ("positions", _token_digest(access_token)),
+                cache_if=_is_empty_book)
+    @_wrap_response
+    @_throttled("account")
     def get_positions(self, access_token: str) -> Dict[str, Any]:
         """Get current positions"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            positions = dhan.get_positions()
-            return {"success": True, "data": positions}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        return self._dhan_request(access_token, "/positions")
 
+    @ttl_cached("_empty_book_cache", key=lambda access_token: ("holdings", _token_digest(access_token)),
+                cache_if=_is_empty_book)
+    @_wrap_response
+    @_throttled("account")
     def get_holdings(self, access_token: str) -> Dict[str, Any]:
         """Get current holdings"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            holdings = dhan.get_holdings()
-            return {"success": True, "data": holdings}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        return self._dhan_request(access_token, "/holdings")
 
+    @ttl_cached("_funds_cache", key=_token_digest)
+    @_wrap_response
+    @_throttled("account")
     def get_fund_limits(self, access_token: str) -> Dict[str, Any]:
         """Get fund limits and margin details"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            funds = dhan.get_fund_limits()
-            return {"success": True, "data": funds}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-
+        return self._dhan_request(access_token, "/fundlimit")
+
+    async def get_portfolio_snapshot(self, access_token: str) -> Dict[str, Any]:
+        """Get positions, holdings and fund limits in one concurrent round-trip"""
+        return await self._snapshot(access_token, {
+            "positions": self.get_positions_async,
+            "holdings": self.get_holdings_async,
+            "funds": self.get_fund_limits_async,
+        })
+
+    async def get_dashboard_snapshot(self, access_token: str) -> Dict[str, Any]:
+        """Get the portfolio snapshot plus the order book in one concurrent round-trip"""
+        return await self._snapshot(access_token, {
+            "positions": self.get_positions_async,
+            "holdings": self.get_holdings_async,
+            "funds": self.get_fund_limits_async,
+            "orders": self.get_orders_async,
+        })
+
+    async def _snapshot(self, access_token: str,
+                        readers: Dict[str, Callable[[str], Any]]) -> Dict[str, Any]:
+        """
+        Run each async reader concurrently and collect their data by name. Fails
+        only if every reader fails; partial failures are listed under "errors".
+        """
+        results = await asyncio.gather(
+            *(reader(access_token) for reader in readers.values()),
+            return_exceptions=True,
+        )
+        snapshot = {}
+        errors = {}
+        for key, result in zip(readers, results):
+            if isinstance(result, BaseException):
+                result = {"success": False, "error": str(result)}
+            if result.get("success"):
+                snapshot[key] = result.get("data")
+            else:
+                snapshot[key] = None
+                errors[key] = result.get("error", "Unknown error")
+        if len(errors) == len(snapshot):
+            return {"success": False, "error": "; ".join(f"{k}: {v}" for k, v in errors.items())}
+        response = {"success": True, "data": snapshot}
+        if errors:
+            response["errors"] = errors
+        return response
+
+    @ttl_cached("_quote_cache", key=_quote_cache_key)
+    @_wrap_response
+    @_throttled("quotes")
     def get_market_quote(self, access_token: str, securities: Dict[str, List[int]]) -> Dict[str, Any]:
         """Get market quote data"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-
-            # Convert string security IDs to integers if needed (ohlc_data expects integers)
-            securities_int = {}
-            for exchange_seg, sec_ids in securities.items():
-                securities_int[exchange_seg] = [
-                    int(sec_id) if isinstance(sec_id, str) else sec_id
-                    for sec_id in sec_ids
-                ]
-
-            print(f"[get_market_quote] Calling ohlc_data with securities (original): {securities}")
-            print(f"[get_market_quote] Calling ohlc_data with securities (converted to int): {securities_int}")
-            quote = dhan.ohlc_data(securities=securities_int)
-
-            # Log the response structure for debugging
-            print(f"[get_market_quote] Response type: {type(quote)}")
+        dhan = self.get_dhan_instance(access_token)
+
+        # Convert string security IDs to integers if needed (ohlc_data expects integers)
+        securities_int = {}
+        for exchange_seg, sec_ids in securities.items():
+            securities_int[exchange_seg] = [
+                int(sec_id) if isinstance(sec_id, str) else sec_id
+                for sec_id in sec_ids
+            ]
+
+        logger.debug("[get_market_quote] Calling ohlc_data with securities %s (as ints: %s)", securities, securities_int)
+        quote = dhan.ohlc_data(securities=securities_int)
+
+        # Log the response structure for debugging; skipped entirely above DEBUG
+        if logger.isEnabledFor(logging.DEBUG):
             if isinstance(quote, dict):
-                print(f"[get_market_quote] Response keys: {list(quote.keys())}")
-                # Log nested structure if present
-                if "data" in quote:
-                    print(f"[get_market_quote] data keys: {list(quote['data'].keys()) if isinstance(quote['data'], dict) else type(quote['data'])}")
-                    if isinstance(quote['data'], dict) and "data" in quote['data']:
-                        nested = quote['data']['data']
-                        if isinstance(nested, dict):
-                            print(f"[get_market_quote] nested data keys: {list(nested.keys())}")
-                            for key in nested.keys():
-                                if isinstance(nested[key], dict):
-                                    print(f"[get_market_quote]   {key} has {len(nested[key])} securities: {list(nested[key].keys())[:5]}")
+                logger.debug("[get_market_quote] Response keys: %s", list(quote.keys()))
+                data = quote.get("data")
+                if data is not None:
+                    logger.debug("[get_market_quote] data keys: %s", list(data.keys()) if isinstance(data, dict) else type(data))
+                    nested = data.get("data") if isinstance(data, dict) else None
+                    if isinstance(nested, dict):
+                        logger.debug("[get_market_quote] nested data keys: %s", list(nested.keys()))
+                        for key, value in nested.items():
+                            if isinstance(value, dict):
+                                logger.debug("[get_market_quote]   %s has %d securities: %s", key, len(value), list(value.keys())[:5])
             elif isinstance(quote, list):
-                print(f"[get_market_quote] Response is list with {len(quote)} items")
+                logger.debug("[get_market_quote] Response is list with %d items", len(quote))
             else:
-                print(f"[get_market_quote] Response: {str(quote)[:500]}")
+                logger.debug("[get_market_quote] Response: %s", str(quote)[:500])
 
-            return {"success": True, "data": quote}
-        except Exception as e:
-            print(f"[get_market_quote] Exception: {str(e)}")
-            import traceback
-            print(f"[get_market_quote] Traceback: {traceback.format_exc()}")
-            return {"success": False, "error": str(e)}
+        return quote
 
+    @ttl_cached("_chain_cache", key=lambda access_token, under_security_id, under_exchange_segment, expiry: (
+        _token_digest(access_token), str(under_security_id), under_exchange_segment, expiry
+    ))
+    @shared_cached(_option_chain_shared_key, SHARED_OPTION_CHAIN_TTL)
+    @_wrap_response
+    @_throttled("data")
     def get_option_chain(self, access_token: str, under_security_id: int,
                         under_exchange_segment: str, expiry: str) -> Dict[str, Any]:
         """Get option chain data"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            chain = dhan.option_chain(
-                under_security_id=under_security_id,
-                under_exchange_segment=under_exchange_segment,
-                expiry=expiry
-            )
-            return {"success": True, "data": chain}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-
-    def get_historical_data(self, access_token: str, security_id: int,
+        dhan = self.get_dhan_instance(access_token)
+        return dhan.option_chain(
+            under_security_id=under_security_id,
+            under_exchange_segment=under_exchange_segment,
+            expiry=expiry
+        )
+
+    @historical_cached
+    @shared_cached(_daily_history_shared_key, _seconds_until_session_open)
+    @_throttled("data")
+    def get_historical_data(self, access_token: str, security_id: str,
                            exchange_segment: str, instrument_type: str,
-                           from_date: str, to_date: str, interval: str = "daily") -> Dict[str, Any]:
+                           from_date: str, to_date: str, interval: str = "daily",
+                           columnar: bool = False) -> Dict[str, Any]:
         """
         Get historical data (daily or intraday minute data)
 
@@ -255,36 +1852,25 @@ class TradingService:
 
         Args:
             access_token: DhanHQ access token
-            security_id: Security ID (will be converted to string per official example)
+            security_id: Security ID as a string, per official example (ints are converted)
             exchange_segment: Exchange segment string (e.g., "NSE_EQ", "BSE_EQ") or constant
             instrument_type: Instrument type (e.g., "EQUITY", "FUTURES", "OPTIONS")
             from_date: Start date in "YYYY-MM-DD" format
             to_date: End date in "YYYY-MM-DD" format
             interval: "daily" for daily data, "intraday" or "minute" for intraday minute data
+            columnar: Return intraday candles as DhanHQ's column arrays plus a "time"
+                column instead of one dict per candle
 
         Returns:
             Dict with success status and data or error message
         """
         try:
-            # Import DhanContext if available (per official example pattern)
-            try:
-                from dhanhq import DhanContext
-                use_dhan_context = True
-            except ImportError:
-                use_dhan_context = False
-
-            # Get dhan instance
-            if use_dhan_context:
-                dhan_context = DhanContext(self.client_id, access_token)
-                from dhanhq import dhanhq
-                dhan = dhanhq(dhan_context)
-            else:
-                dhan = self.get_dhan_instance(access_token)
+            # Get dhan instance (built from a DhanContext when available, per official example pattern)
+            dhan = self.get_dhan_instance(access_token, use_context=_HAS_DHAN_CONTEXT)
 
-            # Convert security_id to string (per official example: "1333" not 1333)
-            # Also ensure we have the numeric value for comparisons
-            security_id_int = int(security_id) if isinstance(security_id, str) else security_id
-            security_id_str = str(security_id_int)
+            # DhanHQ expects a string security_id (per official example: "1333" not 1333);
+            # API requests already arrive as strings, only tool calls may pass ints
+            security_id_str = security_id if isinstance(security_id, str) else str(security_id)
 
             # For historical data API, exchange_segment should be just the exchange name (NSE, BSE, MCX, NCDEX)
             # Not the full segment like "NSE_EQ" or "IDX_I"
@@ -293,69 +1879,60 @@ class TradingService:
 
             # Handle IDX_I (indices) - need to map to actual exchange (NSE or BSE)
             # Common indices: NIFTY 50 (13) = NSE, SENSEX (51) = BSE
+            race_exchanges = False
             if exchange_seg_str == "IDX_I":
-                # Try to determine exchange from security_id
-                # NSE indices typically have lower IDs (e.g., 13 for NIFTY)
-                # BSE indices typically have higher IDs (e.g., 51 for SENSEX)
-                # Common NSE indices: 13 (NIFTY 50), 14 (NIFTY Bank), etc.
-                # Common BSE indices: 51 (SENSEX), etc.
-                print(f"[get_historical_data] Processing IDX_I index with security_id={security_id_int}")
-                if security_id_int in [13, 14, 15, 16, 17, 18, 19, 20]:  # Common NSE indices
+                logger.debug("[get_historical_data] Processing IDX_I index with security_id=%s", security_id_str)
+                if security_id_str in NSE_INDEX_SECURITY_IDS:
                     exchange_seg_str = "NSE"
-                    print(f"[get_historical_data] Mapped security_id {security_id_int} to NSE")
-                elif security_id_int in [51, 52, 53, 54, 55]:  # Common BSE indices
+                    logger.debug("[get_historical_data] Mapped security_id %s to NSE", security_id_str)
+                elif security_id_str in BSE_INDEX_SECURITY_IDS:
                     exchange_seg_str = "BSE"
-                    print(f"[get_historical_data] Mapped security_id {security_id_int} to BSE")
+                    logger.debug("[get_historical_data] Mapped security_id %s to BSE", security_id_str)
                 else:
-                    # Default to NSE for unknown indices, but log a warning
-                    print(f"[get_historical_data] Unknown index security_id {security_id_int}, defaulting to NSE")
+                    # Unknown index: daily candles are requested from NSE and BSE at once, preferring NSE
                     exchange_seg_str = "NSE"
-            elif exchange_seg_str.startswith('NSE'):
-                # Extract "NSE" from "NSE_EQ", "NSE_FO", etc.
-                exchange_seg_str = "NSE"
-            elif exchange_seg_str.startswith('BSE'):
-                # Extract "BSE" from "BSE_EQ", "BSE_FO", etc.
-                exchange_seg_str = "BSE"
-            elif exchange_seg_str.startswith('MCX'):
-                # Extract "MCX" from "MCX_COM", etc.
-                exchange_seg_str = "MCX"
-            elif exchange_seg_str.startswith('NCDEX'):
-                # Extract "NCDEX" from "NCDEX_COM", etc.
-                exchange_seg_str = "NCDEX"
-
-            # Map exchange string to dhan constant if possible
-            # Official example uses: dhan.NSE, dhan.BSE, etc.
-            # But we can also pass the string directly if constant not available
-            exchange_constant = None
-            if hasattr(dhan, 'NSE') and exchange_seg_str == 'NSE':
-                exchange_constant = dhan.NSE
-            elif hasattr(dhan, 'BSE') and exchange_seg_str == 'BSE':
-                exchange_constant = dhan.BSE
-            elif hasattr(dhan, 'MCX') and exchange_seg_str == 'MCX':
-                exchange_constant = dhan.MCX
-            elif hasattr(dhan, 'NCDEX') and exchange_seg_str == 'NCDEX':
-                exchange_constant = dhan.NCDEX
-
-            # Use constant if available, otherwise use the base exchange string
-            # According to docs, exchange_segment should be like "NSE", "BSE" (string or constant)
-            exchange_seg = exchange_constant if exchange_constant is not None else exchange_seg_str
+                    race_exchanges = "NSE" in _HISTORICAL_EXCHANGE_CONST and "BSE" in _HISTORICAL_EXCHANGE_CONST
+                    if race_exchanges:
+                        logger.warning("[get_historical_data] Unknown index security_id %s, requesting NSE and BSE daily data (NSE preferred)", security_id_str)
+                    else:
+                        logger.warning("[get_historical_data] Unknown index security_id %s, defaulting to NSE", security_id_str)
+            else:
+                # Extract "NSE" from "NSE_EQ", "MCX" from "MCX_COM", etc.
+                base_exchange = exchange_seg_str.partition("_")[0]
+                if base_exchange in HISTORICAL_EXCHANGES:
+                    exchange_seg_str = base_exchange
+
+            # Use the dhan constant for the base exchange if the SDK defines one,
+            # otherwise the base exchange string itself
+            exchange_seg = _HISTORICAL_EXCHANGE_CONST.get(exchange_seg_str, exchange_seg_str)
 
             # Fetch data based on interval type
             try:
                 # Check if interval is numeric (1, 5, 10, 15, 60) or daily
                 interval_str = str(interval).strip()
-                is_daily = interval_str.lower() in ["daily", "day"]
+                is_daily = interval_str.lower() in DAILY_INTERVALS
 
                 if is_daily:
                     # Daily historical data (per official example)
-                    print(f"[get_historical_data] Calling historical_daily_data with security_id={security_id_str}, exchange_seg={exchange_seg}, instrument_type={instrument_type}, from_date={from_date}, to_date={to_date}")
-                    data = dhan.historical_daily_data(
-                        security_id=security_id_str,
-                        exchange_segment=exchange_seg,
-                        instrument_type=instrument_type,
-                        from_date=from_date,
-                        to_date=to_date
-                    )
+                    logger.debug("[get_historical_data] Calling historical_daily_data with security_id=%s, exchange_seg=%s, instrument_type=%s, from_date=%s, to_date=%s", security_id_str, exchange_seg, instrument_type, from_date, to_date)
+                    if race_exchanges:
+                        data = _first_daily_history(
+                            dhan,
+                            [_HISTORICAL_EXCHANGE_CONST["NSE"], _HISTORICAL_EXCHANGE_CONST["BSE"]],
+                            self._pool,
+                            security_id=security_id_str,
+                            instrument_type=instrument_type,
+                            from_date=from_date,
+                            to_date=to_date
+                        )
+                    else:
+                        data = dhan.historical_daily_data(
+                            security_id=security_id_str,
+                            exchange_segment=exchange_seg,
+                            instrument_type=instrument_type,
+                            from_date=from_date,
+                            to_date=to_date
+                        )
                 else:
                     # Intraday minute data using REST API /v2/charts/intraday
                     # This endpoint supports intervals: 1, 5, 15, 25, 60
@@ -367,13 +1944,13 @@ class TradingService:
                     if interval_str.isdigit():
                         interval_int = int(interval_str)
                         # Validate interval is one of the supported values
-                        if interval_int in [1, 5, 15, 25, 60]:
+                        if interval_int in INTRADAY_INTERVALS:
                             interval_value = str(interval_int)
                         else:
-                            print(f"[get_historical_data] Invalid interval {interval_int}, defaulting to 1 minute")
+                            logger.warning("[get_historical_data] Invalid interval %s, defaulting to 1 minute", interval_int)
                             interval_value = "1"
                     else:
-                        print(f"[get_historical_data] Non-numeric interval '{interval_str}', defaulting to 1 minute")
+                        logger.warning("[get_historical_data] Non-numeric interval '%s', defaulting to 1 minute", interval_str)
 
                     # Use original exchange_segment (e.g., "NSE_EQ", "IDX_I") for REST API
                     # Convert instrument_type to instrument
@@ -384,13 +1961,11 @@ class TradingService:
                     from_datetime = f"{from_date} 09:15:00"
                     to_datetime = f"{to_date} 15:30:00"
 
-                    print(f"[get_historical_data] Calling REST API /v2/charts/intraday with:")
-                    print(f"  securityId={security_id_str}")
-                    print(f"  exchangeSegment={exchange_segment}")
-                    print(f"  instrument={instrument}")
-                    print(f"  interval={interval_value}")
-                    print(f"  fromDate={from_datetime}")
-                    print(f"  toDate={to_datetime}")
+                    logger.debug(
+                        "[get_historical_data] Calling REST API /v2/charts/intraday with securityId=%s "
+                        "exchangeSegment=%s instrument=%s interval=%s fromDate=%s toDate=%s",
+                        security_id_str, exchange_segment, instrument, interval_value, from_datetime, to_datetime
+                    )
 
                     # Call REST API endpoint
                     api_url = "https://api.dhan.co/v2/charts/intraday"
@@ -409,75 +1984,75 @@ class TradingService:
                         "toDate": to_datetime
                     }
 
-                    try:
-                        response = httpx.post(api_url, headers=headers, json=payload, timeout=30.0)
+                    def fetch_chunk(chunk: tuple, throttle: bool = True) -> Any:
+                        if throttle:
+                            _rate_limiters["data"].acquire()
+                        # The pooled httpx client keeps the connection to api.dhan.co alive
+                        # (multiplexed over HTTP/2 when h2 is installed)
+                        response = self._get_http_client().post(api_url, headers=headers, json={
+                            **payload, "fromDate": f"{chunk[0]} 09:15:00", "toDate": f"{chunk[1]} 15:30:00"
+                        }, timeout=30.0)
                         response.raise_for_status()
-                        data = response.json()
+                        return _response_json(response)
+
+                    try:
+                        chunks = _intraday_date_chunks(from_date, to_date)
+                        if len(chunks) == 1:
+                            # This call's rate-limit token was taken by @_throttled
+                            data = fetch_chunk(chunks[0], throttle=False)
+                        else:
+                            logger.debug("[get_historical_data] Fetching %d date chunks", len(chunks))
+                            # The first chunk uses the token @_throttled took for this call
+                            throttles = [False] + [True] * (len(chunks) - 1)
+                            with ThreadPoolExecutor(max_workers=INTRADAY_CHUNK_CONCURRENCY) as executor:
+                                parts = list(executor.map(fetch_chunk, chunks, throttles))
+                            failed = next(
+                                ((chunk, part) for chunk, part in zip(chunks, parts) if _is_dhan_failure(part)), None
+                            )
+                            if failed is not None:
+                                # One failed range fails the call rather than leaving a gap in the candles
+                                logger.warning("[get_historical_data] Chunk %s to %s failed", *failed[0])
+                                data = failed[1]
+                            else:
+                                data = _concat_candle_columns(parts)
 
                         # Transform response from arrays to list of objects for easier processing
                         if isinstance(data, dict) and "open" in data and "close" in data:
-                            # Convert array format to list of candle objects
-                            opens = data.get("open", [])
-                            highs = data.get("high", [])
-                            lows = data.get("low", [])
-                            closes = data.get("close", [])
-                            volumes = data.get("volume", [])
-                            timestamps = data.get("timestamp", [])
-                            oi = data.get("open_interest", [])
-
-                            candles = []
-                            for i in range(len(opens)):
-                                candle = {
-                                    "timestamp": timestamps[i] if i < len(timestamps) else None,
-                                    "time": datetime.fromtimestamp(timestamps[i]).isoformat() if i < len(timestamps) and timestamps[i] else None,
-                                    "date": datetime.fromtimestamp(timestamps[i]).isoformat() if i < len(timestamps) and timestamps[i] else None,
-                                    "open": opens[i] if i < len(opens) else None,
-                                    "high": highs[i] if i < len(highs) else None,
-                                    "low": lows[i] if i < len(lows) else None,
-                                    "close": closes[i] if i < len(closes) else None,
-                                    "volume": volumes[i] if i < len(volumes) else 0,
-                                    "open_interest": oi[i] if i < len(oi) else 0
-                                }
-                                candles.append(candle)
-
-                            data = candles
-                            print(f"[get_historical_data] Transformed {len(candles)} candles from REST API response")
+                            if columnar:
+                                data = _candle_columns(data)
+                                logger.debug("[get_historical_data] Returning %s candles as columns", len(data['time']))
+                            else:
+                                data = _candles_from_columns(data)
+                                logger.debug("[get_historical_data] Transformed %s candles from REST API response", len(data))
                         else:
-                            print(f"[get_historical_data] Unexpected REST API response format")
+                            logger.warning("[get_historical_data] Unexpected REST API response format")
 
                     except httpx.HTTPStatusError as e:
                         error_msg = f"HTTP {e.response.status_code}: {e.response.text}"
-                        print(f"[get_historical_data] REST API HTTP error: {error_msg}")
-                        # Try to parse error response
-                        try:
-                            error_data = e.response.json()
-                            if isinstance(error_data, dict) and ("status" in error_data or "error" in error_data):
-                                raise Exception(error_msg)
-                        except:
-                            pass
+                        logger.warning("[get_historical_data] REST API HTTP error: %s", error_msg)
                         raise Exception(error_msg)
                     except Exception as e:
                         error_msg = str(e)
-                        print(f"[get_historical_data] REST API call failed: {error_msg}")
+                        logger.warning("[get_historical_data] REST API call failed: %s", error_msg)
                         raise
 
-                print(f"[get_historical_data] Success - data type: {type(data)}, length: {len(data) if isinstance(data, (list, dict)) else 'N/A'}")
+                logger.debug("[get_historical_data] Success - data type: %s, length: %s", type(data), len(data) if isinstance(data, (list, dict)) else 'N/A')
 
                 # Check if the response is an error response from DhanHQ
                 if isinstance(data, dict):
                     # Check for DhanHQ error structure
-                    if data.get("status") == "failure" or "error" in data or "errorCode" in data:
+                    if _is_dhan_failure(data):
                         error_info = data.get("remarks") or data.get("data") or data
                         error_code = error_info.get("error_code") or error_info.get("errorCode") or ""
                         error_message = error_info.get("error_message") or error_info.get("errorMessage") or str(error_info)
                         error_msg = f"DhanHQ Error {error_code}: {error_message}" if error_code else error_message
-                        print(f"[get_historical_data] DhanHQ API returned error: {error_msg}")
+                        logger.warning("[get_historical_data] DhanHQ API returned error: %s", error_msg)
                         return {"success": False, "error": error_msg, "error_code": error_code, "raw_response": data}
 
                 return {"success": True, "data": data}
             except Exception as api_error:
                 error_msg = str(api_error)
-                print(f"[get_historical_data] API call failed: {error_msg}")
+                logger.warning("[get_historical_data] API call failed: %s", error_msg)
 
                 # Try to extract error details from exception
                 if hasattr(api_error, 'response') or hasattr(api_error, 'args'):
@@ -492,23 +2067,26 @@ class TradingService:
                             return {"success": False, "error": error_msg, "error_code": error_code, "raw_response": error_data}
 
                 # For indices (when original exchange_segment was IDX_I), try fallback to other exchange if first attempt failed
-                if exchange_segment.upper() == "IDX_I" and hasattr(dhan, 'NSE') and hasattr(dhan, 'BSE'):
+                # (unless both were already raced for daily data)
+                already_raced = race_exchanges and is_daily
+                if (exchange_segment.upper() == "IDX_I" and not already_raced
+                        and "NSE" in _HISTORICAL_EXCHANGE_CONST and "BSE" in _HISTORICAL_EXCHANGE_CONST):
                     # Try the other exchange as fallback
                     # If we tried NSE first, try BSE, and vice versa
                     if exchange_seg_str == "NSE":
-                        fallback_exchange = dhan.BSE
+                        fallback_exchange = _HISTORICAL_EXCHANGE_CONST["BSE"]
                         fallback_name = "BSE"
                     elif exchange_seg_str == "BSE":
-                        fallback_exchange = dhan.NSE
+                        fallback_exchange = _HISTORICAL_EXCHANGE_CONST["NSE"]
                         fallback_name = "NSE"
                     else:
                         fallback_exchange = None
 
                     if fallback_exchange:
-                        print(f"[get_historical_data] Trying fallback exchange: {fallback_name}")
+                        logger.debug("[get_historical_data] Trying fallback exchange: %s", fallback_name)
                         try:
                             interval_str = str(interval).strip()
-                            is_daily = interval_str.lower() in ["daily", "day"]
+                            is_daily = interval_str.lower() in DAILY_INTERVALS
 
                             if is_daily:
                                 data = dhan.historical_daily_data(
@@ -523,7 +2101,7 @@ class TradingService:
                                 fallback_interval = 1  # Default to 1 minute
                                 if interval_str.isdigit():
                                     fallback_interval = int(interval_str)
-                                    if fallback_interval not in [1, 5, 10, 15, 60]:
+                                    if fallback_interval not in INTRADAY_INTERVALS:
                                         fallback_interval = 1
 
                                 data = dhan.intraday_minute_data(
@@ -534,109 +2112,93 @@ class TradingService:
                                     to_date=to_date,
                                     interval=fallback_interval
                                 )
-                            print(f"[get_historical_data] Fallback succeeded with {fallback_name}")
+                            logger.debug("[get_historical_data] Fallback succeeded with %s", fallback_name)
                             return {"success": True, "data": data}
                         except Exception as fallback_error:
-                            print(f"[get_historical_data] Fallback also failed: {str(fallback_error)}")
+                            logger.warning("[get_historical_data] Fallback also failed: %s", fallback_error)
                             return {"success": False, "error": f"Original error: {error_msg}. Fallback error: {str(fallback_error)}"}
 
                 return {"success": False, "error": error_msg}
         except Exception as e:
-            print(f"[get_historical_data] Outer exception: {str(e)}")
+            logger.warning("[get_historical_data] Outer exception: %s", e)
             return {"success": False, "error": str(e)}
 
+    # The security master is a public download, so one copy serves every token
+    @ttl_cached("_security_list_cache", key=lambda access_token, format_type="compact": format_type,
+                cache_if=lambda result: result.get("data") is not None)
+    @_wrap_response
     def get_security_list(self, access_token: str, format_type: str = "compact") -> Dict[str, Any]:
         """Get security/instrument list"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            securities = dhan.fetch_security_list(format_type)
-            return {"success": True, "data": securities}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-
+        dhan = self.get_dhan_instance(access_token)
+        return dhan.fetch_security_list(format_type)
+
+    # Expiries are the same for every account, so one entry serves all tokens
+    @ttl_cached("_expiry_cache", key=lambda access_token, under_security_id, under_exchange_segment: (
+        str(under_security_id), under_exchange_segment
+    ))
+    @_wrap_response
+    @_throttled("data")
     def get_expiry_list(self, access_token: str, under_security_id: int,
                        under_exchange_segment: str) -> Dict[str, Any]:
         """Get expiry list for underlying"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            expiries = dhan.expiry_list(
-                under_security_id=under_security_id,
-                under_exchange_segment=under_exchange_segment
-            )
-            return {"success": True, "data": expiries}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-
+        dhan = self.get_dhan_instance(access_token)
+        return dhan.expiry_list(
+            under_security_id=under_security_id,
+            under_exchange_segment=under_exchange_segment
+        )
+
+    @_wrap_response
+    @_throttled("account")
     def get_trades(self, access_token: str) -> Dict[str, Any]:
         """Get all trades executed today"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            trades = dhan.get_trade_book()
-            return {"success": True, "data": trades}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        return self._dhan_request(access_token, "/trades")
 
+    @_wrap_response
+    @_throttled("account")
     def get_trade_by_order_id(self, access_token: str, order_id: str) -> Dict[str, Any]:
         """Get trades by order ID"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            trades = dhan.get_trade_by_order_id(order_id)
-            return {"success": True, "data": trades}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        return self._dhan_request(access_token, f"/trades/{url_quote(str(order_id), safe='')}")
 
+    @_wrap_response
+    @_throttled("account")
     def get_trade_history(self, access_token: str, from_date: str, to_date: str, page_number: int = 0) -> Dict[str, Any]:
         """Get trade history for date range"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            trades = dhan.get_trade_history(from_date, to_date, page_number)
-            return {"success": True, "data": trades}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        return self._dhan_request(access_token, f"/trades/{from_date}/{to_date}/{page_number}")
 
+    @_wrap_response
+    @_throttled("account")
     def calculate_margin(self, access_token: str, margin_data: Dict[str, Any]) -> Dict[str, Any]:
         """Calculate margin for an order"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            margin = dhan.margin_calculator(
-                security_id=margin_data.get("security_id"),
-                exchange_segment=getattr(dhan, margin_data.get("exchange_segment", "NSE_EQ")),
-                transaction_type=getattr(dhan, margin_data.get("transaction_type", "BUY")),
-                quantity=margin_data.get("quantity", 1),
-                product_type=getattr(dhan, margin_data.get("product_type", "INTRADAY")),
-                price=margin_data.get("price", 0),
-                trigger_price=margin_data.get("trigger_price", 0)
-            )
-            return {"success": True, "data": margin}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-
+        dhan = self.get_dhan_instance(access_token)
+        return dhan.margin_calculator(
+            security_id=margin_data.get("security_id"),
+            exchange_segment=_dhan_constant("exchange_segment", margin_data.get("exchange_segment", "NSE_EQ")),
+            transaction_type=_dhan_constant("transaction_type", margin_data.get("transaction_type", "BUY")),
+            quantity=margin_data.get("quantity", 1),
+            product_type=_dhan_constant("product_type", margin_data.get("product_type", "INTRADAY")),
+            price=margin_data.get("price", 0),
+            trigger_price=margin_data.get("trigger_price", 0)
+        )
+
+    @_wrap_response
+    @_throttled("account")
     def get_kill_switch_status(self, access_token: str) -> Dict[str, Any]:
         """Get kill switch status"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            status = dhan.kill_switch()
-            return {"success": True, "data": status}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        dhan = self.get_dhan_instance(access_token)
+        return dhan.kill_switch()
 
+    @_wrap_response
+    @_throttled("orders")
     def manage_kill_switch(self, access_token: str, status: str) -> Dict[str, Any]:
         """Manage kill switch (ACTIVATE or DEACTIVATE)"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            result = dhan.kill_switch(status)
-            return {"success": True, "data": result}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        dhan = self.get_dhan_instance(access_token)
+        return dhan.kill_switch(status)
 
+    @_wrap_response
+    @_throttled("account")
     def get_ledger(self, access_token: str, from_date: Optional[str] = None, to_date: Optional[str] = None) -> Dict[str, Any]:
         """Get ledger report"""
-        try:
-            dhan = self.get_dhan_instance(access_token)
-            ledger = dhan.ledger_report(from_date, to_date)
-            return {"success": True, "data": ledger}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+        return self._dhan_request(access_token, f"/ledger?{urlencode({'from-date': from_date, 'to-date': to_date})}")
 
     def create_market_feed(self, access_token: str, instruments: List[tuple], version: str = "v2"):
         """
@@ -655,98 +2217,113 @@ class TradingService:
         """
         if not self.client_id:
             raise ValueError("DHAN_CLIENT_ID is not configured")
-        try:
-            # Import DhanFeed and constants (actual class name in dhanhq library)
-            from dhanhq.marketfeed import DhanFeed, Ticker, Quote, Full, NSE, BSE, IDX
-
-            # Convert instruments to use proper constants
-            # For v2, use RequestCode values directly: Ticker=15, Quote=17, Full=21
-            # Map numeric feed codes to constants
-            feed_code_to_constant = {
-                1: Ticker,   # Ticker Packet (RequestCode 15)
-                2: Quote,    # Quote Packet (RequestCode 17)
-                3: Full,     # Full Packet (RequestCode 21)
-                15: Ticker,  # Direct RequestCode mapping
-                17: Quote,
-                21: Full,
-            }
-
-            # Map exchange codes to constants
-            exchange_code_to_constant = {
-                0: IDX,   # Index (IDX = 0)
-                1: NSE,   # NSE (NSE = 1)
-                2: BSE,   # BSE (BSE = 2)
-            }
-
-            # Note: IDX, NSE, BSE are just integers (0, 1, 2), so mapping is optional
-            # But we keep it for clarity and consistency
-
-            converted_instruments = []
-            for inst in instruments:
-                if len(inst) >= 3:
-                    exchange_code, security_id, feed_code = inst[0], inst[1], inst[2]
-                    # Convert security_id to string
-                    security_id_str = str(security_id) if not isinstance(security_id, str) else security_id
-
-                    # Convert exchange_code to constant if available
-                    exchange_constant = exchange_code_to_constant.get(exchange_code, exchange_code)
-
-                    # Convert feed_code to constant (RequestCode value)
-                    feed_constant = feed_code_to_constant.get(feed_code, Quote)  # Default to Quote
-
-                    converted_instruments.append((exchange_constant, security_id_str, feed_constant))
-                    print(f"Converted instrument: exchange={exchange_code}->{exchange_constant}, security_id={security_id_str}, feed={feed_code}->{feed_constant}")
-                else:
-                    # Keep as-is if format is different
-                    converted_instruments.append(inst)
+        if DhanFeed is None:
+            raise ImportError(f"Market Feed not available: {str(_DHAN_FEED_ERROR)}")
+
+        # One pass with bound lookups; entries that are not (exchange, security_id,
+        # feed_code) triples are passed through unchanged
+        exchange_constant = _FEED_EXCHANGES.get
+        feed_constant = _FEED_CODES.get
+        converted_instruments = [
+            (
+                exchange_constant(inst[0], inst[0]),
+                inst[1] if isinstance(inst[1], str) else str(inst[1]),
+                feed_constant(inst[2], _FEED_DEFAULT),
+            )
+            if len(inst) >= 3 else inst
+            for inst in instruments
+        ]
 
-            print(f"Final converted instruments for DhanFeed: {converted_instruments}")
-            print(f"Version: {version}")
+        print(f"Converted {len(converted_instruments)} instruments for DhanFeed")
+        print(f"Version: {version}")
 
-            # DhanFeed.__init__ signature: (self, client_id, access_token, instruments, version='v1')
-            # Pass client_id and access_token as separate arguments, not as tuple or DhanContext
-            return DhanFeed(self.client_id, access_token, converted_instruments, version)
-        except (ImportError, AttributeError) as e:
-            raise ImportError(f"Market Feed not available: {str(e)}")
+        # DhanFeed.__init__ signature: (self, client_id, access_token, instruments, version='v1')
+        # Pass client_id and access_token as separate arguments, not as tuple or DhanContext
+        return DhanFeed(self.client_id, access_token, converted_instruments, version)
 
     def create_order_update(self, access_token: str):
         """Create Order Update instance for real-time order status"""
         if not self.client_id:
             raise ValueError("DHAN_CLIENT_ID is not configured")
-        try:
-            # Try different import paths for OrderSocket
-            try:
-                from dhanhq.orderupdate import OrderSocket
-            except ImportError:
-                # Alternative import path
-                from dhanhq import orderupdate
-                OrderSocket = orderupdate.OrderSocket
-
-            # OrderSocket expects client_id and access_token as separate arguments, not a tuple
-            return OrderSocket(self.client_id, access_token)
-        except (ImportError, AttributeError) as e:
-            raise ImportError(f"Order Updates not available: {str(e)}")
+        if OrderSocket is None:
+            raise ImportError(f"Order Updates not available: {str(_DHAN_ORDER_SOCKET_ERROR)}")
+        # OrderSocket expects client_id and access_token as separate arguments, not a tuple
+        return OrderSocket(self.client_id, access_token)
 
     def create_full_depth(self, access_token: str, instruments: List[tuple]):
         """Create Full Depth instance for 20-level market depth"""
         if not self.client_id:
             raise ValueError("DHAN_CLIENT_ID is not configured")
-        try:
-            # Try different import paths for FullDepth
-            try:
-                from dhanhq import FullDepth
-            except ImportError:
-                # Alternative import path
-                from dhanhq.fulldepth import FullDepth
+        if FullDepth is None:
+            raise ImportError(f"Full Depth not available: {str(_DHAN_FULL_DEPTH_ERROR)}")
+        return FullDepth((self.client_id, access_token), instruments)
+
+    def _instrument_csv_result(self, format_type: str, instruments: List[Dict[str, str]]) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "data": {
+                "instruments": instruments,
+                "count": len(instruments),
+                "format": format_type
+            }
+        }
+
+    def _instrument_csv_request_headers(self, format_type: str) -> Dict[str, str]:
+        """Conditional request headers revalidating the cached copy of a scrip master, if any"""
+        cached = self._instrument_csv_cache.get(format_type)
+        if cached is not None and cached[1]:
+            return {"If-None-Match": cached[1]}
+        return {}
+
+    def _remember_instrument_csv(self, format_type: str, response: Any,
+                                 instruments: List[Dict[str, str]]) -> Optional[str]:
+        """Cache rows in memory and return their ETag, if known"""
+        previous = self._instrument_csv_cache.get(format_type)
+        etag = response.headers.get("etag") or (previous[1] if previous else None)
+        self._instrument_csv_cache[format_type] = (
+            time.monotonic() + INSTRUMENT_CSV_CACHE_TTL, etag, instruments
+        )
+        return etag
+
+    def _load_instrument_snapshot(self, format_type: str) -> None:
+        """
+        Seed the in-memory cache from the disk snapshot, once per format. The
+        snapshot stays fresh for what is left of INSTRUMENT_CSV_CACHE_TTL since
+        it was written, and after that revalidates with its saved ETag.
+        """
+        if format_type in self._instrument_snapshot_checked:
+            return
+        self._instrument_snapshot_checked.add(format_type)
+        if format_type in self._instrument_csv_cache:
+            return
+        snapshot = _read_instrument_snapshot(format_type)
+        if snapshot is not None:
+            age, etag, instruments = snapshot
+            self._instrument_csv_cache[format_type] = (
+                time.monotonic() + INSTRUMENT_CSV_CACHE_TTL - age, etag, instruments
+            )
 
-            return FullDepth((self.client_id, access_token), instruments)
-        except (ImportError, AttributeError) as e:
-            raise ImportError(f"Full Depth not available: {str(e)}")
+    def _cached_instrument_csv(self, format_type: str, response: Any = None) -> Optional[List[Dict[str, str]]]:
+        """
+        Cached rows for format_type while they are fresh, or when response is a
+        304 revalidating them; otherwise None.
+        """
+        cached = self._instrument_csv_cache.get(format_type)
+        if cached is None:
+            return None
+        if response is None:
+            return cached[2] if time.monotonic() < cached[0] else None
+        return cached[2] if response.status_code == 304 else None
 
     def get_instrument_list_csv(self, format_type: str = "compact") -> Dict[str, Any]:
         """
         Fetch instrument list from CSV endpoints
 
+        Parsed rows are reused for INSTRUMENT_CSV_CACHE_TTL seconds, then
+        revalidated with the server's ETag so an unchanged file isn't downloaded
+        and parsed again. Rows are snapshotted to INSTRUMENT_SNAPSHOT_DIR so a
+        restarted process starts from the last download.
+
         Args:
             format_type: "compact" or "detailed"
 
@@ -754,30 +2331,80 @@ class TradingService:
             Dict with success status and parsed CSV data
         """
         try:
-            if format_type == "compact":
-                url = "https://images.dhan.co/api-data/api-scrip-master.csv"
-            elif format_type == "detailed":
-                url = "https://images.dhan.co/api-data/api-scrip-master-detailed.csv"
-            else:
+            url = INSTRUMENT_CSV_URLS.get(format_type)
+            if url is None:
                 return {"success": False, "error": "format_type must be 'compact' or 'detailed'"}
+            self._load_instrument_snapshot(format_type)
+            instruments = self._cached_instrument_csv(format_type)
+            if instruments is not None:
+                return self._instrument_csv_result(format_type, instruments)
+
+            # Stream the CSV over the pooled client (keep-alive, gzip transfer) and
+            # parse rows as lines arrive instead of buffering the whole file as text
+            headers = self._instrument_csv_request_headers(format_type)
+            with self._get_http_client().stream("GET", url, headers=headers, timeout=60.0) as response:
+                instruments = self._cached_instrument_csv(format_type, response)
+                downloaded = instruments is None
+                if downloaded:
+                    response.raise_for_status()
+                    instruments = _read_csv_rows(response.iter_lines())
+                etag = self._remember_instrument_csv(format_type, response, instruments)
+
+            if downloaded:
+                _write_instrument_snapshot(format_type, etag, instruments)
+            else:
+                _touch_instrument_snapshot(format_type)
 
-            # Fetch CSV data
-            response = httpx.get(url, timeout=60.0)
-            response.raise_for_status()
+            return self._instrument_csv_result(format_type, instruments)
+        except httpx.HTTPError as e:
+            return {"success": False, "error": f"HTTP error fetching instrument list: {str(e)}"}
+        except Exception as e:
+            return {"success": False, "error": f"Error fetching instrument list: {str(e)}"}
 
-            # Parse CSV data
-            csv_text = response.text
-            csv_reader = csv.DictReader(io.StringIO(csv_text))
-            instruments = list(csv_reader)
+    async def get_instrument_list_csv_async(self, format_type: str = "compact") -> Dict[str, Any]:
+        """
+        Async counterpart of get_instrument_list_csv: streams the CSV over the
+        shared async client and parses each INSTRUMENT_CSV_PARSE_BATCH lines in
+        a worker thread, so neither downloading nor parsing holds the event loop.
+        """
+        try:
+            url = INSTRUMENT_CSV_URLS.get(format_type)
+            if url is None:
+                return {"success": False, "error": "format_type must be 'compact' or 'detailed'"}
+            if format_type not in self._instrument_snapshot_checked:
+                await asyncio.to_thread(self._load_instrument_snapshot, format_type)
+            instruments = self._cached_instrument_csv(format_type)
+            if instruments is not None:
+                return self._instrument_csv_result(format_type, instruments)
+
+            headers = self._instrument_csv_request_headers(format_type)
+            async with self._get_async_client().stream("GET", url, headers=headers, timeout=60.0) as response:
+                instruments = self._cached_instrument_csv(format_type, response)
+                downloaded = instruments is None
+                if downloaded:
+                    response.raise_for_status()
+                    instruments = []
+                    fieldnames: Optional[List[str]] = None
+                    values: Dict[str, str] = {}
+                    batch: List[str] = []
+                    async for line in response.aiter_lines():
+                        if fieldnames is None:
+                            fieldnames = next(csv.reader([line]))
+                            continue
+                        batch.append(line)
+                        if len(batch) >= INSTRUMENT_CSV_PARSE_BATCH:
+                            instruments.extend(await asyncio.to_thread(_parse_csv_rows, batch, fieldnames, values))
+                            batch = []
+                    if batch:
+                        instruments.extend(await asyncio.to_thread(_parse_csv_rows, batch, fieldnames, values))
+                etag = self._remember_instrument_csv(format_type, response, instruments)
+
+            if downloaded:
+                await asyncio.to_thread(_write_instrument_snapshot, format_type, etag, instruments)
+            else:
+                await asyncio.to_thread(_touch_instrument_snapshot, format_type)
 
-            return {
-                "success": True,
-                "data": {
-                    "instruments": instruments,
-                    "count": len(instruments),
-                    "format": format_type
-                }
-            }
+            return self._instrument_csv_result(format_type, instruments)
         except httpx.HTTPError as e:
             return {"success": False, "error": f"HTTP error fetching instrument list: {str(e)}"}
         except Exception as e:
@@ -796,7 +2423,7 @@ class TradingService:
         """
         try:
             # Fetch CSV data
-            csv_result = self.get_instrument_list_csv(format_type)
+            csv_result = await self.get_instrument_list_csv_async(format_type)
             if not csv_result.get("success"):
                 return csv_result
 
@@ -804,6 +2431,8 @@ class TradingService:
 
             # Save to database
             result = await db.save_instruments(instruments, format_type)
+            if not result.get("success"):
+                return result
 
             return {
                 "success": True,
@@ -838,80 +2467,80 @@ class TradingService:
             # No authentication headers needed
             headers = {}
 
-            # Fetch instrument list using async client
+            # Fetch instrument list using the pooled async client
             # Note: DhanHQ API returns 302 redirect to CSV file, so we need to follow redirects
-            async with httpx.AsyncClient(follow_redirects=True) as client:
-                response = await client.get(url, headers=headers, timeout=30.0)
+            client = self._get_async_client()
+            await _rate_limiters["account"].acquire_async()
+            response = await client.get(url, headers=headers, timeout=30.0, follow_redirects=True)
 
-                # Get response text first for debugging
-                response_text = ""
+            # Get response text first for debugging
+            response_text = ""
+            try:
+                response_text = response.text
+            except:
+                pass
+
+            # Check response status
+            if response.status_code not in [200, 302]:
+                error_msg = response_text or f"HTTP {response.status_code}"
                 try:
-                    response_text = response.text
+                    error_json = response.json()
+                    error_msg = error_json.get("message") or error_json.get("error") or error_json.get("detail") or error_msg
                 except:
                     pass
 
-                # Check response status
-                if response.status_code not in [200, 302]:
-                    error_msg = response_text or f"HTTP {response.status_code}"
-                    try:
-                        error_json = response.json()
-                        error_msg = error_json.get("message") or error_json.get("error") or error_json.get("detail") or error_msg
-                    except:
-                        pass
+                return {
+                    "success": False,
+                    "error": f"HTTP {response.status_code}: {error_msg}",
+                    "url": url,
+                    "response_text": response_text[:500] if response_text else ""  # Include first 500 chars for debugging
+                }
+
+            # Check if response is CSV (DhanHQ returns CSV for instrument lists via redirect)
+            content_type = response.headers.get("content-type", "").lower()
+            # Check if it's CSV: content-type contains csv, or starts with CSV headers (EXCH_ID, SECURITY_ID, etc.)
+            is_csv = (
+                "csv" in content_type or
+                (response_text and response_text.strip().startswith(("SECURITY_ID", "EXCH_ID", "SYMBOL_NAME"))) or
+                (response_text and len(response_text) > 50 and "," in response_text[:200] and "\n" in response_text[:500])
+            )
 
+            if is_csv:
+                # Parse CSV response
+                try:
+                    import io
+                    data = _read_csv_rows(io.StringIO(response_text))
+                except Exception as e:
                     return {
                         "success": False,
-                        "error": f"HTTP {response.status_code}: {error_msg}",
+                        "error": f"Invalid CSV response from API: {str(e)}",
                         "url": url,
-                        "response_text": response_text[:500] if response_text else ""  # Include first 500 chars for debugging
+                        "response_text": response_text[:500] if response_text else ""
+                    }
+            else:
+                # Parse JSON response
+                try:
+                    data = _response_json(response)
+                except ValueError as e:
+                    return {
+                        "success": False,
+                        "error": f"Invalid JSON response from API: {str(e)}",
+                        "url": url,
+                        "response_text": response_text[:500] if response_text else ""
                     }
 
-                # Check if response is CSV (DhanHQ returns CSV for instrument lists via redirect)
-                content_type = response.headers.get("content-type", "").lower()
-                # Check if it's CSV: content-type contains csv, or starts with CSV headers (EXCH_ID, SECURITY_ID, etc.)
-                is_csv = (
-                    "csv" in content_type or
-                    (response_text and response_text.strip().startswith(("SECURITY_ID", "EXCH_ID", "SYMBOL_NAME"))) or
-                    (response_text and len(response_text) > 50 and "," in response_text[:200] and "\n" in response_text[:500])
-                )
-
-                if is_csv:
-                    # Parse CSV response
-                    try:
-                        import io
-                        csv_reader = csv.DictReader(io.StringIO(response_text))
-                        data = list(csv_reader)
-                    except Exception as e:
-                        return {
-                            "success": False,
-                            "error": f"Invalid CSV response from API: {str(e)}",
-                            "url": url,
-                            "response_text": response_text[:500] if response_text else ""
-                        }
-                else:
-                    # Parse JSON response
-                    try:
-                        data = response.json()
-                    except json.JSONDecodeError as e:
+                # Handle case where API returns error in JSON
+                if isinstance(data, dict):
+                    if "status" in data and data.get("status") != "success":
+                        error_msg = data.get("message") or data.get("error") or data.get("detail") or "Unknown error from API"
                         return {
                             "success": False,
-                            "error": f"Invalid JSON response from API: {str(e)}",
-                            "url": url,
-                            "response_text": response_text[:500] if response_text else ""
+                            "error": error_msg,
+                            "url": url
                         }
-
-                    # Handle case where API returns error in JSON
-                    if isinstance(data, dict):
-                        if "status" in data and data.get("status") != "success":
-                            error_msg = data.get("message") or data.get("error") or data.get("detail") or "Unknown error from API"
-                            return {
-                                "success": False,
-                                "error": error_msg,
-                                "url": url
-                            }
-                        # Some APIs return data wrapped in a "data" field
-                        if "data" in data and isinstance(data["data"], list):
-                            data = data["data"]
+                    # Some APIs return data wrapped in a "data" field
+                    if "data" in data and isinstance(data["data"], list):
+                        data = data["data"]
 
             return {
                 "success": True,
@@ -955,6 +2584,92 @@ class TradingService:
                 "url": url if 'url' in locals() else "unknown"
             }
 
+def _slice_quote(result: Dict[str, Any], securities: Dict[str, List[int]]) -> Dict[str, Any]:
+    """
+    Cut a merged quote response down to the requested securities.
+
+    DhanHQ nests quotes as data -> data -> {segment: {security_id: quote}};
+    any other shape is returned whole.
+    """
+    envelope = result.get("data")
+    if not result.get("success") or not isinstance(envelope, dict):
+        return result
+    body = envelope.get("data")
+    quotes = body.get("data") if isinstance(body, dict) else None
+    if not isinstance(quotes, dict):
+        return result
+    sliced = {}
+    for segment, sec_ids in securities.items():
+        segment_quotes = quotes.get(segment)
+        if isinstance(segment_quotes, dict):
+            wanted = {str(sec_id) for sec_id in sec_ids}
+            sliced[segment] = {sec_id: quote for sec_id, quote in segment_quotes.items() if str(sec_id) in wanted}
+    return {**result, "data": {**envelope, "data": {**body, "data": sliced}}}
+
+
+class QuoteBatcher:
+    """
+    Coalesce market quote requests made within a short window into one call.
+
+    Requests for the same access token that arrive within `window` seconds are
+    merged (duplicate security IDs removed) into a single OHLC request, and each
+    caller gets back the slice of the response for its own securities.
+    """
+
+    def __init__(self, service: "TradingService", window: float = QUOTE_BATCH_WINDOW):
+        self.service = service
+        self.window = window
+        self._pending: Dict[str, List[Any]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        # Running flush tasks; the loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def get(self, access_token: str, securities: Dict[str, List[int]]) -> Dict[str, Any]:
+        """Get quotes for securities, sharing the upstream call with concurrent requests"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(access_token, []).append((securities, future))
+        if access_token not in self._timers:
+            self._timers[access_token] = loop.call_later(self.window, self._start_flush, access_token)
+        return await future
+
+    def _start_flush(self, access_token: str) -> None:
+        task = asyncio.get_running_loop().create_task(self._flush_token(access_token))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self) -> None:
+        """Send every pending batch now"""
+        await asyncio.gather(*(self._flush_token(token) for token in list(self._pending)))
+
+    async def _flush_token(self, access_token: str) -> None:
+        timer = self._timers.pop(access_token, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(access_token, [])
+        if not batch:
+            return
+
+        merged: Dict[str, List[Any]] = {}
+        seen = set()
+        for securities, _ in batch:
+            for segment, sec_ids in securities.items():
+                segment_ids = merged.setdefault(segment, [])
+                for sec_id in sec_ids:
+                    if (segment, str(sec_id)) not in seen:
+                        seen.add((segment, str(sec_id)))
+                        segment_ids.append(sec_id)
+
+        try:
+            result = await self.service.get_market_quote_async(access_token, merged)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        for securities, future in batch:
+            if not future.done():
+                future.set_result(result if len(batch) == 1 else _slice_quote(result, securities))
+
+
 # Global trading service instance
 trading_service = TradingService()
+quote_batcher = QuoteBatcher(trading_service)
 
@@ -1,19 +1,53 @@
 from __future__ import annotations
 
-import os
+import asyncio
 import threading
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Set, Tuple
 
+from settings import get_dhan_settings
 from ws.market_cache import MarketCache
 from ws.subscriptions import SubscriptionManager, Subscription
 
+# dhanhq 2.x marketfeed exchange segment codes, by exchange segment name: the
+# SDK's names plus the spellings this app's tools and resolver use (NSE_FO,
+# BSE_FO, MCX_COM). Segments missing here (e.g. NCDEX_COM) are not streamed.
+FEED_SEGMENT_CODES: Dict[str, int] = {
+    "IDX_I": 0,
+    "NSE_EQ": 1,
+    "NSE_FNO": 2,
+    "NSE_FO": 2,
+    "NSE_CURRENCY": 3,
+    "BSE_EQ": 4,
+    "MCX_COMM": 5,
+    "MCX_COM": 5,
+    "BSE_CURRENCY": 7,
+    "BSE_FNO": 8,
+    "BSE_FO": 8,
+}
+# Fallback names for ticks of instruments no subscription names (the SDK's spelling)
+FEED_SEGMENT_NAMES: Dict[int, str] = {
+    0: "IDX_I",
+    1: "NSE_EQ",
+    2: "NSE_FNO",
+    3: "NSE_CURRENCY",
+    4: "BSE_EQ",
+    5: "MCX_COMM",
+    7: "BSE_CURRENCY",
+    8: "BSE_FNO",
+}
+
+# Seconds between supervisor passes; subscription changes within one pass go out together
+SUPERVISOR_INTERVAL = 1.0
+# Seconds to wait before reconnecting a feed that dropped
+FEED_RESTART_DELAY = 5.0
+
 
 class DhanMarketDataDaemon:
     """
     Singleton-style daemon:
       - maintains ONE Dhan WebSocket connection (via dhanhq.marketfeed.DhanFeed)
-      - restarts the feed when subscription set changes
+      - sends subscription changes to the running feed, batched per supervisor pass
       - writes latest ticks into MarketCache
     """
 
@@ -25,11 +59,23 @@ class DhanMarketDataDaemon:
 
         self._feed = None
         self._feed_thread: Optional[threading.Thread] = None
-        self._drain_thread: Optional[threading.Thread] = None
+        self._feed_started_at = float("-inf")
+        # Bumped to retire the running feed thread
+        self._generation = 0
         self._active_version: Optional[int] = None
-
-        self._client_id = os.getenv("DHAN_CLIENT_ID")
-        self._access_token = os.getenv("DHAN_ACCESS_TOKEN")
+        # Instruments the feed is (or is about to be) subscribed to
+        self._fed: set = set()
+        # (feed segment code, security id) -> segment names it was subscribed under,
+        # so ticks are cached under the keys quote requests look up
+        self._segment_names: Dict[Tuple[int, str], Set[str]] = {}
+        # Changes for the feed thread to send on its own event loop
+        self._pending_lock = threading.Lock()
+        self._pending_add: list = []
+        self._pending_remove: list = []
+
+        settings = get_dhan_settings()
+        self._client_id = settings.client_id
+        self._access_token = settings.access_token
         self._enabled = bool(self._client_id and self._access_token)
 
         self._last_error: Optional[str] = None
@@ -53,16 +99,9 @@ class DhanMarketDataDaemon:
         self._stop.set()
         self._stop_current_feed()
 
-    def _map_exchange_segment(self, exchange_segment: str) -> int:
-        seg = (exchange_segment or "").upper()
-        if seg == "IDX_I":
-            return 0
-        if seg.startswith("NSE"):
-            return 1
-        if seg.startswith("BSE"):
-            return 2
-        # Fallback to NSE
-        return 1
+    def _map_exchange_segment(self, exchange_segment: str) -> Optional[int]:
+        """Feed code of an exchange segment, or None if the feed does not carry it"""
+        return FEED_SEGMENT_CODES.get((exchange_segment or "").upper())
 
     def _map_mode(self, mode: str) -> Any:
         # Import lazily so backend can start even if dhanhq is missing/misinstalled.
@@ -74,62 +113,86 @@ class DhanMarketDataDaemon:
 
     def _build_instruments(self, subs: list[Subscription]) -> list[tuple]:
         out = []
+        segment_names: Dict[Tuple[int, str], Set[str]] = {}
         for s in subs:
             exch = self._map_exchange_segment(s.exchange_segment)
+            if exch is None:
+                continue
             out.append((exch, str(s.security_id), self._map_mode(s.mode)))
+            segment_names.setdefault((exch, str(s.security_id)), set()).add(s.exchange_segment)
+        self._segment_names = segment_names
         return out
 
+    def _feed_running(self) -> bool:
+        return self._feed_thread is not None and self._feed_thread.is_alive()
+
     def _stop_current_feed(self) -> None:
-        try:
-            if self._feed is not None:
-                # Prefer close_connection() (sync) if available.
-                if hasattr(self._feed, "close_connection"):
-                    try:
-                        self._feed.close_connection()
-                    except Exception:
-                        pass
-                # Some versions have disconnect() coroutine; we can't await here safely.
-        finally:
-            self._feed = None
+        # The feed thread owns the connection and its event loop; it disconnects
+        # and closes both once it sees its generation retired
+        self._generation += 1
+        self._feed = None
+        self._feed_thread = None
+        self._fed = set()
+        with self._pending_lock:
+            self._pending_add, self._pending_remove = [], []
+
+    def _resubscribe(self, instruments: set) -> None:
+        """Queue the difference between instruments and the running feed's subscriptions"""
+        added = list(instruments - self._fed)
+        removed = list(self._fed - instruments)
+        with self._pending_lock:
+            self._pending_add.extend(added)
+            self._pending_remove.extend(removed)
+        self._fed = instruments
+
+    def _apply_pending(self, feed: Any) -> None:
+        # Runs on the feed thread: the SDK schedules the packets on the current event loop
+        with self._pending_lock:
+            added, removed = self._pending_add, self._pending_remove
+            self._pending_add, self._pending_remove = [], []
+        if removed:
+            feed.unsubscribe_symbols(removed)
+        if added:
+            feed.subscribe_symbols(added)
 
     def _start_feed(self, instruments: list[tuple]) -> None:
         from dhanhq.marketfeed import DhanFeed  # type: ignore
 
-        self._feed = DhanFeed(self._client_id, self._access_token, instruments, "v2")
-        feed = self._feed
-
-        def run_forever_thread() -> None:
-            # Mirror the repo's existing pattern: dedicate a thread + event loop to run_forever().
+        self._generation += 1
+        generation = self._generation
+        self._fed = set(instruments)
+        self._feed_started_at = time.monotonic()
+
+        def feed_thread() -> None:
+            # One thread per connection drives the feed's event loop: connect,
+            # then send queued subscription changes and drain ticks into the cache.
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            feed = None
             try:
-                import asyncio
-
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
+                # DhanFeed binds the current thread's event loop, so it is built here
+                feed = DhanFeed(self._client_id, self._access_token, list(instruments), "v2")
+                self._feed = feed
                 feed.run_forever()
-            except Exception as e:  # noqa: BLE001
-                self._last_error = f"feed run_forever error: {e}"
-            finally:
-                try:
-                    loop.close()  # type: ignore[name-defined]
-                except Exception:
-                    pass
-
-        def drain_thread() -> None:
-            # Drain tick queue and update cache.
-            while not self._stop.is_set() and self._feed is feed:
-                try:
+                while not self._stop.is_set() and self._generation == generation:
+                    self._apply_pending(feed)
                     msg = feed.get_data()
                     if msg:
                         self._ingest(msg)
-                except Exception as e:  # noqa: BLE001
-                    self._last_error = f"feed get_data error: {e}"
-                    time.sleep(0.25)
-                time.sleep(0.01)
+            except Exception as e:  # noqa: BLE001
+                self._last_error = f"feed error: {e}"
+            finally:
+                if feed is not None:
+                    try:
+                        feed.close_connection()
+                    except Exception:
+                        pass
+                loop.close()
+                if self._generation == generation:
+                    self._feed = None
 
-        self._feed_thread = threading.Thread(target=run_forever_thread, daemon=True)
+        self._feed_thread = threading.Thread(target=feed_thread, daemon=True)
         self._feed_thread.start()
-        self._drain_thread = threading.Thread(target=drain_thread, daemon=True)
-        self._drain_thread.start()
 
     def _ingest(self, msg: Any) -> None:
         """
@@ -145,6 +208,18 @@ class DhanMarketDataDaemon:
             self._cache.update(key, tick)
 
         if isinstance(msg, dict):
+            # dhanhq 2.x: one flat tick with a numeric exchange_segment, e.g.
+            # {"type": "Quote Data", "exchange_segment": 1, "security_id": 1333, "LTP": "...", ...}
+            if "type" in msg and "security_id" in msg:
+                seg = msg.get("exchange_segment")
+                sid = str(msg["security_id"])
+                if isinstance(seg, int):
+                    names = self._segment_names.get((seg, sid)) or {FEED_SEGMENT_NAMES.get(seg, str(seg))}
+                else:
+                    names = {seg}
+                for name in names:
+                    update_one(name, sid, {**msg, "security_id": sid, "exchange_segment": name})
+                return
             # Common shape: {"IDX_I": {"13": {...}}} or {"data": {...}}
             if "data" in msg and isinstance(msg["data"], dict):
                 return self._ingest(msg["data"])
@@ -171,7 +246,8 @@ class DhanMarketDataDaemon:
 
     def _run_supervisor(self) -> None:
         """
-        Supervises subscription changes and rebuilds the feed accordingly.
+        Supervises subscription changes: connects the feed when there is something
+        to stream and sends later changes to the running connection as one diff.
         """
         if not self._enabled:
             self._last_error = "DHAN_ACCESS_TOKEN not set; market daemon disabled"
@@ -184,21 +260,20 @@ class DhanMarketDataDaemon:
 
                 if not subs:
                     # No subscriptions -> stop feed and idle.
-                    if self._feed is not None:
+                    if self._feed_running():
                         self._stop_current_feed()
                         self._active_version = None
-                    time.sleep(0.25)
-                    continue
-
-                if self._active_version != v:
-                    # Rebuild required.
-                    self._stop_current_feed()
-                    instruments = self._build_instruments(subs)
-                    self._start_feed(instruments)
+                elif not self._feed_running():
+                    # First subscription, or the connection dropped: (re)connect, at most once per delay
+                    if time.monotonic() - self._feed_started_at >= FEED_RESTART_DELAY:
+                        self._start_feed(self._build_instruments(subs))
+                        self._active_version = v
+                elif self._active_version != v:
+                    # Everything changed since the last pass goes to the live connection at once
+                    self._resubscribe(set(self._build_instruments(subs)))
                     self._active_version = v
 
-                time.sleep(0.25)
+                time.sleep(SUPERVISOR_INTERVAL)
             except Exception as e:  # noqa: BLE001
                 self._last_error = f"daemon supervisor error: {e}"
                 time.sleep(1.0)
-
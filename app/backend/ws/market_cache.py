@@ -1,7 +1,8 @@
 from __future__ import annotations
 
 import threading
-from typing import Any, Dict
+import time
+from typing import Any, Dict, Optional, Tuple
 
 
 class MarketCache:
@@ -11,13 +12,23 @@ class MarketCache:
 
     def __init__(self) -> None:
         self._lock = threading.Lock()
-        self._data: Dict[str, Dict[str, Any]] = {}
+        self._data: Dict[str, Tuple[float, Dict[str, Any]]] = {}
 
     def update(self, key: str, tick: Dict[str, Any]) -> None:
         with self._lock:
-            self._data[key] = tick
+            self._data[key] = (time.monotonic(), tick)
 
-    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Latest tick for key, or None if there is none received within max_age seconds"""
         with self._lock:
-            return dict(self._data)
+            entry = self._data.get(key)
+        if entry is None:
+            return None
+        received_at, tick = entry
+        if max_age is not None and time.monotonic() - received_at > max_age:
+            return None
+        return tick
 
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {key: tick for key, (_, tick) in self._data.items()}
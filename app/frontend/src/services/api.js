@@ -154,6 +154,13 @@ export default {
     return response.data;
   },
 
+  async getDashboard(accessToken) {
+    const response = await api.post("/api/trading/dashboard", {
+      token_id: accessToken,
+    });
+    return response.data;
+  },
+
   async getMarketQuote(data) {
     const response = await api.post("/api/trading/market/quote", data);
     return response.data;